@@ -0,0 +1,134 @@
+import argparse
+import io
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from benchmarks import synthetic
+from src.processors import engines, sales_orders_processor, sales_processor
+from utils import dimension_cache, gcp_utils
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# --------------------------------------------------------------------------------
+# PARIDAD ENTRE MOTORES DE PROCESAMIENTO
+#    Uso: python -m benchmarks.engine_parity [--rows N] [--seeds 3]
+#
+# Procesa los mismos CSV crudos sintéticos con cada motor de
+# src/processors/engines.py (leyendo cada uno como lo hace main.py) y compara
+# los Parquet resultantes byte a byte contra el motor pandas. Los datos incluyen
+# casos borde: timestamps inválidos o con offset, tipos de venta desconocidos,
+# cantidades en cero y claves de producto con espacios o fuera de la dimensión.
+# Termina con código 1 si algún motor difiere.
+# --------------------------------------------------------------------------------
+REFERENCE_ENGINE = 'pandas'
+
+FACTS = [
+    ('sales', sales_processor, synthetic.generate_raw_sales),
+    ('sales_orders', sales_orders_processor, synthetic.generate_raw_sales_orders),
+]
+
+def _sprinkle(rng: np.random.Generator, df: pd.DataFrame, column: str, values: list, rate: float = 0.02) -> None:
+    """Reemplaza una proporción `rate` de filas de `column` por valores de `values`."""
+    mask = rng.random(len(df)) < rate
+    df[column] = df[column].astype(object)
+    df.loc[mask, column] = rng.choice(np.asarray(values, dtype=object), int(mask.sum()))
+
+def _with_edge_cases(fact_name: str, df: pd.DataFrame, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed + 1_000)
+    _sprinkle(rng, df, 'attributes.createdAt', ['no-es-fecha', '2025-07-26T01:15:00-03:00', '2025-07-26 23:59:59'])
+    if fact_name == 'sales':
+        _sprinkle(rng, df, 'attributes.closedAt', ['', '2025-07-27T02:59:59.999Z'])
+        _sprinkle(rng, df, 'attributes.saleType', ['takeaway', 'Delivery', 'DRIVE-THRU', None])
+    else:
+        _sprinkle(rng, df, 'attributes.quantity', [0])
+        _sprinkle(rng, df, 'attributes.price', [0.0, None])
+        _sprinkle(rng, df, 'relationships.product.data.id', [' 7 ', '99999', None])
+    return df
+
+def _quiet_expected_warnings():
+    """Los avisos de claves sin item_key y de esquema se esperan con los casos borde."""
+    for name in (sales_orders_processor.__name__, 'src.processors.polars_engine', 'src.processors.fact_schema', gcp_utils.__name__):
+        logging.getLogger(name).setLevel(logging.ERROR)
+
+def _parquet_bytes(table: pa.Table) -> bytes:
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer)
+    return buffer.getvalue()
+
+def _run_engine(processor, csv_path: str) -> tuple[pa.Table, float]:
+    """Lee y transforma un CSV como lo hace main.py con ese procesador; devuelve (tabla, segundos)."""
+    start = time.perf_counter()
+    raw = gcp_utils.read_csv_from_gcs(
+        csv_path,
+        column_types=getattr(processor, 'RAW_COLUMN_TYPES', None),
+        exclude_columns=getattr(processor, 'COLUMNS_TO_DELETE', None),
+        as_table=getattr(processor, 'ARROW_INPUT', False),
+    )
+    table = processor.process(raw)
+    return table, time.perf_counter() - start
+
+def _describe_difference(expected: pa.Table, actual: pa.Table) -> str:
+    if expected.schema != actual.schema:
+        return f"esquemas distintos:\n{expected.schema}\n!=\n{actual.schema}"
+    if expected.num_rows != actual.num_rows:
+        return f"{expected.num_rows} filas != {actual.num_rows} filas"
+    columns = [name for name in expected.column_names if not expected[name].equals(actual[name])]
+    return f"columnas con valores distintos: {columns}" if columns else "mismos datos, distinta codificación del Parquet"
+
+def check_parity(rows: int, null_rate: float, seeds: int, num_items: int, engine_names: list[str]) -> bool:
+    """
+    Compara cada motor contra pandas para cada tabla de hechos y semilla.
+
+    Returns:
+        bool: True si todas las salidas son idénticas byte a byte.
+    """
+    dimension_cache.preload_dimension(
+        'items', synthetic.generate_dim_items(num_items),
+        key_columns=['item_type', 'original_key'], value_column='item_key'
+    )
+    ok = True
+    with tempfile.TemporaryDirectory(prefix='engine-parity-') as workdir:
+        for fact_name, module, generate in FACTS:
+            processors = {name: engines.resolve(module, name) for name in [REFERENCE_ENGINE, *engine_names]}
+            _quiet_expected_warnings()
+            for seed in range(seeds):
+                kwargs = {'num_items': num_items} if fact_name == 'sales_orders' else {}
+                raw = _with_edge_cases(fact_name, generate(rows, null_rate, seed=seed, **kwargs), seed)
+                csv_path = os.path.join(workdir, f'{fact_name}_{seed}.csv')
+                raw.to_csv(csv_path, index=False)
+
+                expected, expected_seconds = _run_engine(processors[REFERENCE_ENGINE], csv_path)
+                expected_bytes = _parquet_bytes(expected)
+                for name in engine_names:
+                    actual, seconds = _run_engine(processors[name], csv_path)
+                    timing = f"{name} {seconds:.3f}s vs {REFERENCE_ENGINE} {expected_seconds:.3f}s"
+                    if _parquet_bytes(actual) == expected_bytes:
+                        logger.info(f"{fact_name} (semilla {seed}): {name} idéntico ({timing}).")
+                    else:
+                        ok = False
+                        logger.error(f"{fact_name} (semilla {seed}): {name} DIFIERE - {_describe_difference(expected, actual)}")
+    dimension_cache.clear_cache()
+    return ok
+
+def _parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Paridad de salida entre motores de procesamiento.")
+    parser.add_argument('--rows', type=int, default=50_000, help="Filas sintéticas por archivo.")
+    parser.add_argument('--null-rate', type=float, default=0.1, help="Proporción de nulos en columnas opcionales.")
+    parser.add_argument('--seeds', type=int, default=3, help="Cantidad de conjuntos de datos distintos por tabla.")
+    parser.add_argument('--num-items', type=int, default=500, help="Tamaño de la dimensión dim_items sintética.")
+    parser.add_argument('--engines', nargs='+', default=[e for e in engines.ENGINES if e != REFERENCE_ENGINE],
+                        help="Motores a comparar contra pandas.")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = _parse_args(sys.argv[1:])
+    sys.exit(0 if check_parity(args.rows, args.null_rate, args.seeds, args.num_items, args.engines) else 1)
@@ -0,0 +1,257 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable
+
+import pandas as pd
+import pyarrow as pa
+
+from benchmarks import synthetic
+from src.processors import child_facts, sales_orders_processor, sales_processor
+from utils import dimension_cache, gcp_utils, parquet_profiles
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# --------------------------------------------------------------------------------
+# BENCHMARKS OFFLINE DE LOS PROCESADORES
+#    Uso: python -m benchmarks.run_benchmarks [--rows N] [--baseline archivo.json]
+#
+# Genera CSV crudos sintéticos, mide cada etapa de los procesadores y el ciclo
+# completo lectura -> transformación -> escritura con el backend local de
+# utils.storage, y compara el throughput (filas/s) contra un baseline guardado.
+# No usa GCS ni red: la dimensión dim_items se genera y se precarga en
+# dimension_cache.
+# --------------------------------------------------------------------------------
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+def _time_call(fn: Callable, make_input: Callable, repeat: int) -> float:
+    """Mejor tiempo (segundos) de `repeat` ejecuciones; cada una recibe una entrada nueva."""
+    best = float('inf')
+    for _ in range(repeat):
+        data = make_input()
+        start = time.perf_counter()
+        fn(data)
+        best = min(best, time.perf_counter() - start)
+        del data
+    return best
+
+def _peak_memory_mb(fn: Callable, make_input: Callable) -> float:
+    """
+    Pico de memoria (MB) asignada por `fn`, medido en una ejecución aparte de la
+    de tiempo porque tracemalloc agrega sobrecosto. Incluye las asignaciones de
+    Python y numpy; las del pool de Arrow se informan a nivel proceso en 'meta'.
+    """
+    data = make_input()
+    tracemalloc.start()
+    try:
+        fn(data)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / (1024 * 1024)
+
+def _measure(name: str, rows: int, fn: Callable, make_input: Callable, repeat: int) -> dict:
+    seconds = _time_call(fn, make_input, repeat)
+    result = {
+        'rows': rows,
+        'seconds': round(seconds, 6),
+        'rows_per_sec': round(rows / seconds, 1) if seconds > 0 else None,
+        'peak_memory_mb': round(_peak_memory_mb(fn, make_input), 2),
+    }
+    logger.info(f"{name}: {result['seconds']:.4f}s, {result['rows_per_sec']:,.0f} filas/s, pico {result['peak_memory_mb']:.1f} MB")
+    return result
+
+def _stage_inputs(stages: list[tuple[str, Callable]], raw: pd.DataFrame) -> list[tuple[str, Callable, pd.DataFrame]]:
+    """Ejecuta las etapas una vez en orden para obtener la entrada real de cada una."""
+    inputs = []
+    df = raw
+    for name, fn in stages:
+        inputs.append((name, fn, df))
+        df = fn(df.copy())
+    return inputs
+
+def _sales_stages() -> list[tuple[str, Callable]]:
+    p = sales_processor
+    return [
+        ('_clean_data', p._clean_data),
+        ('_process_date[start]', lambda df: p._process_date(df, 'attributes.createdAt', 'start')),
+        ('_process_date[closed]', lambda df: p._process_date(df, 'attributes.closedAt', 'closed')),
+        ('transform_sale_type', p.transform_sale_type),
+        ('enforce_fact_sales_schema', p.enforce_fact_sales_schema),
+    ]
+
+def _sales_orders_stages() -> list[tuple[str, Callable]]:
+    p = sales_orders_processor
+    return [
+        ('_clean_data', p._clean_data),
+        ('_process_date[created]', lambda df: p._process_date(df, 'created_at', 'created')),
+        ('update_item_key', p.update_item_key),
+        ('enforce_fact_sales_schema', p.enforce_fact_sales_schema),
+    ]
+
+def _read_raw_csv(path: str, processor) -> pd.DataFrame:
+    """
+    Lee el CSV crudo igual que el pipeline (backend local con memory map, lector
+    de Arrow, proyección y tipos declarados).
+    """
+    return gcp_utils.read_csv_from_gcs(path, processor.RAW_COLUMN_TYPES, processor.COLUMNS_TO_DELETE)
+
+def _benchmark_fact(fact_name: str, processor, stages: list, raw: pd.DataFrame, files: int, workdir: str, repeat: int) -> dict:
+    """Mide las etapas de un procesador, su `process` completo, sus tablas hijas y el ciclo local completo."""
+    rows = len(raw)
+    results = {}
+
+    # El CSV intermedio reproduce lo que ve el pipeline (tipos tal como los deja el lector)
+    raw_path = os.path.join(workdir, f'{fact_name}_raw.csv')
+    raw.to_csv(raw_path, index=False)
+    pipeline_input = _read_raw_csv(raw_path, processor)
+
+    for name, fn, stage_input in _stage_inputs(stages, pipeline_input):
+        results[f'{fact_name}.{name}'] = _measure(f'{fact_name}.{name}', rows, fn, stage_input.copy, repeat)
+
+    results[f'{fact_name}.process'] = _measure(f'{fact_name}.process', rows, processor.process, pipeline_input.copy, repeat)
+    if getattr(processor, 'CHILD_FACTS', None):
+        clean_table = processor.process(pipeline_input.copy())
+        results[f'{fact_name}.child_facts'] = _measure(f'{fact_name}.child_facts', rows, lambda table: child_facts.extract(table, processor), lambda: clean_table, repeat)
+    results[f'{fact_name}.read_csv'] = _measure(f'{fact_name}.read_csv', rows, lambda path: _read_raw_csv(path, processor), lambda: raw_path, repeat)
+
+    # Ciclo completo sobre disco local, repartiendo las filas en `files` archivos
+    paths = []
+    for i, part in enumerate(_split(raw, files)):
+        path = os.path.join(workdir, f'{fact_name}_{i:03d}.csv')
+        part.to_csv(path, index=False)
+        paths.append(path)
+
+    profile = parquet_profiles.resolve(fact_name, processor)
+
+    def _end_to_end(csv_paths: list[str]):
+        for path in csv_paths:
+            df = processor.process(_read_raw_csv(path, processor))
+            gcp_utils.write_parquet_to_gcs(df, f'{path}.parquet', profile=profile)
+
+    results[f'{fact_name}.end_to_end'] = _measure(f'{fact_name}.end_to_end[{files} archivos]', rows, _end_to_end, lambda: paths, repeat)
+    return results
+
+def _split(df: pd.DataFrame, parts: int) -> list[pd.DataFrame]:
+    size = -(-len(df) // max(1, parts))
+    return [df.iloc[i:i + size] for i in range(0, len(df), size)] if size else [df]
+
+def run(rows: int, null_rate: float, files: int, repeat: int, num_items: int) -> dict:
+    """
+    Ejecuta todos los benchmarks y devuelve el reporte.
+
+    Returns:
+        dict: {'meta': {...}, 'results': {benchmark: {'rows', 'seconds', 'rows_per_sec', 'peak_memory_mb'}}}
+    """
+    # Los avisos de claves sin item_key y los logs por archivo se repiten en cada
+    # repetición y no aportan al reporte
+    logging.getLogger(sales_orders_processor.__name__).setLevel(logging.ERROR)
+    logging.getLogger(gcp_utils.__name__).setLevel(logging.WARNING)
+    dimension_cache.preload_dimension(
+        'items', synthetic.generate_dim_items(num_items),
+        key_columns=['item_type', 'original_key'], value_column='item_key'
+    )
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='fact-bench-') as workdir:
+        results.update(_benchmark_fact(
+            'sales', sales_processor, _sales_stages(),
+            synthetic.generate_raw_sales(rows, null_rate), files, workdir, repeat
+        ))
+        results.update(_benchmark_fact(
+            'sales_orders', sales_orders_processor, _sales_orders_stages(),
+            synthetic.generate_raw_sales_orders(rows, null_rate, num_items=num_items), files, workdir, repeat
+        ))
+    dimension_cache.clear_cache()
+
+    return {
+        'meta': {
+            'rows': rows,
+            'null_rate': null_rate,
+            'files': files,
+            'repeat': repeat,
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'pyarrow': pa.__version__,
+            'machine': platform.machine(),
+            'arrow_max_memory_mb': round(pa.default_memory_pool().max_memory() / (1024 * 1024), 1),
+            # ru_maxrss está en KB en Linux
+            'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        },
+        'results': results,
+    }
+
+def compare_to_baseline(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    Compara el throughput contra el baseline.
+
+    Args:
+        report (dict): Reporte de la ejecución actual.
+        baseline (dict): Reporte guardado previamente.
+        tolerance (float): Caída relativa de filas/s tolerada (ej. 0.15 = 15%).
+
+    Returns:
+        list[str]: Benchmarks que empeoraron más allá de la tolerancia.
+    """
+    if baseline.get('meta', {}).get('rows') != report['meta']['rows']:
+        logger.warning("El baseline se generó con otra cantidad de filas; la comparación es sólo orientativa.")
+
+    regressions = []
+    for name, current in report['results'].items():
+        previous = baseline.get('results', {}).get(name)
+        if not previous or not previous.get('rows_per_sec') or not current.get('rows_per_sec'):
+            continue
+        change = current['rows_per_sec'] / previous['rows_per_sec'] - 1
+        memory_change = current['peak_memory_mb'] - previous.get('peak_memory_mb', current['peak_memory_mb'])
+        line = f"{name}: {change:+.1%} filas/s, {memory_change:+.1f} MB de pico"
+        if change < -tolerance:
+            regressions.append(name)
+            logger.warning(f"REGRESIÓN {line}")
+        else:
+            logger.info(line)
+    return regressions
+
+def _parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmarks offline de los procesadores de hechos.")
+    parser.add_argument('--rows', type=int, default=200_000, help="Filas sintéticas por tabla de hechos.")
+    parser.add_argument('--null-rate', type=float, default=0.1, help="Proporción de nulos en columnas opcionales.")
+    parser.add_argument('--files', type=int, default=4, help="Archivos en los que se reparten las filas en el ciclo completo.")
+    parser.add_argument('--repeat', type=int, default=3, help="Repeticiones por benchmark (se informa la mejor).")
+    parser.add_argument('--num-items', type=int, default=500, help="Tamaño de la dimensión dim_items sintética.")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE_PATH, help="Archivo JSON del baseline.")
+    parser.add_argument('--save-baseline', action='store_true', help="Guarda esta ejecución como nuevo baseline.")
+    parser.add_argument('--tolerance', type=float, default=0.15, help="Caída de filas/s tolerada antes de marcar una regresión.")
+    parser.add_argument('--fail-on-regression', action='store_true', help="Termina con código 1 si hay regresiones.")
+    parser.add_argument('--output', help="Guarda el reporte completo de esta ejecución en un JSON.")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = _parse_args(sys.argv[1:])
+    report = run(args.rows, args.null_rate, args.files, args.repeat, args.num_items)
+    logger.info(f"RSS máximo del proceso: {report['meta']['max_rss_mb']:.1f} MB (pool de Arrow: {report['meta']['arrow_max_memory_mb']:.1f} MB)")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Baseline guardado en {args.baseline}")
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline):
+        logger.info(f"No hay baseline en {args.baseline}; usar --save-baseline para crearlo.")
+        sys.exit(0)
+
+    with open(args.baseline) as f:
+        regressions = compare_to_baseline(report, json.load(f), args.tolerance)
+    sys.exit(1 if regressions and args.fail_on_regression else 0)
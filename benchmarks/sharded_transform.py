@@ -0,0 +1,128 @@
+import argparse
+import io
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from benchmarks import synthetic
+from src.processors import engines, sales_orders_processor, sales_processor, sharding
+from utils import dimension_cache, gcp_utils
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# --------------------------------------------------------------------------------
+# TRANSFORMACIÓN POR SHARDS DE UN ARCHIVO GRANDE
+#    Uso: python -m benchmarks.sharded_transform [--rows N ...] [--workers 2 4 8]
+#
+# Genera un CSV crudo sintético grande por tabla de hechos, lo transforma en un
+# solo proceso y repartido en N procesos (ver src/processors/sharding.py), y
+# compara tiempos y el Parquet resultante byte a byte. El primer uso de cada
+# pool (arranque de procesos y envío de dim_items) se mide aparte: en una
+# ejecución real se paga una vez. Termina con código 1 si alguna salida difiere.
+#
+# Con varios --rows, informa al final el punto de cruce de cada tabla: la menor
+# cantidad de filas medida desde la cual los shards son más rápidos que un solo
+# proceso. Es el valor a usar en SHARD_MIN_ROWS en esa máquina.
+# --------------------------------------------------------------------------------
+FACTS = [
+    ('sales', sales_processor, synthetic.generate_raw_sales),
+    ('sales_orders', sales_orders_processor, synthetic.generate_raw_sales_orders),
+]
+
+def _parquet_bytes(table: pa.Table) -> bytes:
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer)
+    return buffer.getvalue()
+
+def _read(processor, csv_path: str):
+    return gcp_utils.read_csv_from_gcs(
+        csv_path,
+        column_types=getattr(processor, 'RAW_COLUMN_TYPES', None),
+        exclude_columns=getattr(processor, 'COLUMNS_TO_DELETE', None),
+        as_table=getattr(processor, 'ARROW_INPUT', False),
+    )
+
+def _best_transform(processor, raw, repeat: int) -> tuple[pa.Table, float]:
+    """Mejor tiempo de `repeat` transformaciones de los mismos datos crudos."""
+    best, table = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        table = processor.process(raw)
+        best = min(best, time.perf_counter() - start)
+    return table, best
+
+def _log_crossover(speedups: dict[tuple[str, int], list[tuple[int, float]]]):
+    """Informa, por tabla y cantidad de procesos, desde cuántas filas los shards ganan."""
+    for (fact_name, workers), measured in sorted(speedups.items()):
+        losing = [rows for rows, speedup in measured if speedup < 1]
+        winning = [rows for rows, speedup in measured if speedup >= 1 and rows > max(losing, default=0)]
+        if winning:
+            logger.info(f"Punto de cruce de {fact_name} con {workers} procesos: {min(winning)} filas.")
+        else:
+            logger.info(f"{fact_name} con {workers} procesos no gana en ningún tamaño medido (hasta {max(rows for rows, _ in measured)} filas).")
+
+def run(rows_list: list[int], workers_list: list[int], engine: str, repeat: int, num_items: int) -> bool:
+    """
+    Compara la transformación por shards contra la de un solo proceso, para
+    cada cantidad de filas de `rows_list`.
+
+    Returns:
+        bool: True si todas las salidas son idénticas byte a byte.
+    """
+    dimension_cache.preload_dimension('items', synthetic.generate_dim_items(num_items), *sales_orders_processor.ITEMS_LOOKUP[1:])
+    logging.getLogger(sales_orders_processor.__name__).setLevel(logging.ERROR)
+    logger.info(f"CPUs disponibles: {sharding.available_cpus()}")
+    ok = True
+    speedups = {}
+    with tempfile.TemporaryDirectory(prefix='sharded-transform-') as workdir:
+        for rows in rows_list:
+            for fact_name, module, generate in FACTS:
+                kwargs = {'num_items': num_items} if fact_name == 'sales_orders' else {}
+                csv_path = os.path.join(workdir, f'{fact_name}.csv')
+                generate(rows, seed=0, **kwargs).to_csv(csv_path, index=False)
+
+                single = engines.resolve(module, engine)
+                raw = _read(single, csv_path)
+                expected, single_seconds = _best_transform(single, raw, repeat)
+                expected_bytes = _parquet_bytes(expected)
+                logger.info(f"{fact_name} ({rows} filas, {engine}): 1 proceso {single_seconds:.3f}s")
+
+                for workers in workers_list:
+                    if workers > sharding.available_cpus():
+                        logger.info(f"{fact_name}: {workers} procesos omitido (más que las CPUs disponibles).")
+                        continue
+                    processor = engines.resolve(module, engine, shard_workers=workers, shard_min_rows=1)
+                    start = time.perf_counter()
+                    processor.process(raw.slice(0, workers) if isinstance(raw, pa.Table) else raw.iloc[:workers])
+                    warmup = time.perf_counter() - start
+                    actual, seconds = _best_transform(processor, raw, repeat)
+                    identical = _parquet_bytes(actual) == expected_bytes
+                    ok = ok and identical
+                    speedups.setdefault((fact_name, workers), []).append((rows, single_seconds / seconds))
+                    logger.info(
+                        f"{fact_name}: {workers} procesos {seconds:.3f}s (x{single_seconds / seconds:.2f}; "
+                        f"arranque del pool {warmup:.2f}s) - {'idéntico' if identical else 'DIFIERE'}"
+                    )
+                sharding.shutdown_pool()
+    _log_crossover(speedups)
+    dimension_cache.clear_cache()
+    return ok
+
+def _parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Transformación por shards de un archivo grande.")
+    parser.add_argument('--rows', type=int, nargs='+', default=[1_000_000], help="Filas sintéticas del archivo (varias, para buscar el punto de cruce).")
+    parser.add_argument('--workers', type=int, nargs='+', default=[2, sharding.available_cpus()], help="Cantidades de procesos a medir.")
+    parser.add_argument('--engine', default='pandas', choices=engines.ENGINES, help="Motor de transformación.")
+    parser.add_argument('--repeat', type=int, default=3, help="Repeticiones por medición (se informa la mejor).")
+    parser.add_argument('--num-items', type=int, default=500, help="Tamaño de la dimensión dim_items sintética.")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = _parse_args(sys.argv[1:])
+    sys.exit(0 if run(sorted(set(args.rows)), sorted(set(args.workers)), args.engine, args.repeat, args.num_items) else 1)
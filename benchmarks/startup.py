@@ -0,0 +1,142 @@
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from utils import manifest_utils, storage
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# --------------------------------------------------------------------------------
+# TIEMPO DE ARRANQUE Y DE UNA EJECUCIÓN SIN ARCHIVOS NUEVOS
+#    Uso: python -m benchmarks.startup [--files N] [--repeat N] [--baseline archivo.json]
+#
+# Arma un almacenamiento local con N archivos crudos por tabla de hechos, todos
+# ya registrados en el manifiesto, y corre main.run_all_tasks en un intérprete
+# nuevo: es lo que paga cada ejecución programada que no encuentra archivos
+# nuevos. Mide la importación de main, la ejecución completa y el tiempo total
+# del intérprete, e informa qué bibliotecas pesadas se cargaron (no debería
+# cargarse ninguna). Compara contra un baseline guardado, como run_benchmarks.
+# --------------------------------------------------------------------------------
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'startup_baseline.json')
+HEAVY_MODULES = ('pandas', 'pyarrow', 'numpy', 'polars', 'gcsfs')
+FACTS = ('sales', 'sales_orders')
+
+# Se ejecuta en un intérprete nuevo, con STORAGE_ROOT apuntando al almacenamiento armado
+_CHILD_SCRIPT = f"""
+import json, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+main.metrics.reset()
+summary = main.run_all_tasks(main.FACT_PROCESSING_TASKS)
+done = time.perf_counter()
+print(json.dumps({{
+    'import_s': imported - start,
+    'empty_run_s': done - imported,
+    'processed': sum(result['processed'] for result in summary.values()),
+    'heavy_modules': [name for name in {HEAVY_MODULES!r} if name in sys.modules],
+}}))
+"""
+
+def _prepare_root(root: str, files: int):
+    """Crea `files` CSV crudos por tabla y los registra en el manifiesto, como ya procesados."""
+    for fact_name in FACTS:
+        for i in range(files):
+            path = os.path.join(root, f"raw/fact_{fact_name}/date=2025-01-{1 + i % 28:02d}/file_{i:05d}.csv")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write(f"id\n{i}\n")
+        listed = storage.list_objects(root, f"raw/fact_{fact_name}/", suffix='.csv')
+        manifest_utils.append_entries([obj['path'] for obj in listed], f"logs/manifest/fact_{fact_name}/", root, {obj['path']: obj for obj in listed})
+
+def _run_once(root: str) -> dict:
+    env = {**os.environ, 'STORAGE_ROOT': root, 'LOG_LEVEL': 'WARNING', 'RUN_REPORT_PREFIX': ''}
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', _CHILD_SCRIPT], env=env, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), capture_output=True, text=True, check=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result['process_s'] = time.perf_counter() - start
+    return result
+
+def run(files: int, repeat: int) -> dict:
+    """
+    Mide el arranque y una ejecución sin archivos nuevos.
+
+    Returns:
+        dict: {'meta': {...}, 'results': {métrica: segundos (mejor de `repeat`)}, 'heavy_modules': [...]}
+    """
+    with tempfile.TemporaryDirectory(prefix='fact-startup-') as root:
+        _prepare_root(root, files)
+        runs = [_run_once(root) for _ in range(repeat)]
+
+    if any(run['processed'] for run in runs):
+        raise RuntimeError("La ejecución procesó archivos: el almacenamiento de prueba no quedó registrado en el manifiesto.")
+    results = {name: min(run[name] for run in runs) for name in ('import_s', 'empty_run_s', 'process_s')}
+    for name, seconds in results.items():
+        logger.info(f"{name}: {seconds:.3f}s")
+    heavy = sorted({name for run in runs for name in run['heavy_modules']})
+    if heavy:
+        logger.warning(f"La ejecución sin archivos nuevos importó: {', '.join(heavy)}")
+    return {'meta': {'files': files, 'repeat': repeat, 'python': sys.version.split()[0]}, 'results': results, 'heavy_modules': heavy}
+
+def compare_to_baseline(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    Compara los tiempos contra el baseline.
+
+    Returns:
+        list[str]: Métricas que empeoraron más allá de la tolerancia (ej. 0.25 = 25%).
+    """
+    regressions = []
+    for name, current in report['results'].items():
+        previous = baseline.get('results', {}).get(name)
+        if not previous:
+            continue
+        change = current / previous - 1
+        line = f"{name}: {change:+.1%} ({previous:.3f}s -> {current:.3f}s)"
+        if change > tolerance:
+            regressions.append(name)
+            logger.warning(f"REGRESIÓN {line}")
+        else:
+            logger.info(line)
+    return regressions
+
+def _parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Tiempo de arranque y de una ejecución sin archivos nuevos.")
+    parser.add_argument('--files', type=int, default=500, help="Archivos crudos ya procesados por tabla de hechos.")
+    parser.add_argument('--repeat', type=int, default=5, help="Repeticiones (se informa la mejor).")
+    parser.add_argument('--max-seconds', type=float, default=1.0, help="Tiempo máximo del intérprete completo para una ejecución vacía.")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE_PATH, help="Archivo JSON del baseline.")
+    parser.add_argument('--save-baseline', action='store_true', help="Guarda esta ejecución como nuevo baseline.")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Aumento de tiempo tolerado antes de marcar una regresión.")
+    parser.add_argument('--output', help="Guarda el reporte de esta ejecución en un JSON.")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = _parse_args(sys.argv[1:])
+    logging.getLogger('utils.storage').setLevel(logging.WARNING)
+    report = run(args.files, args.repeat)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    failed = bool(report['heavy_modules'])
+    if report['results']['process_s'] > args.max_seconds:
+        logger.warning(f"La ejecución vacía tardó {report['results']['process_s']:.3f}s (máximo: {args.max_seconds:.3f}s).")
+        failed = True
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Baseline guardado en {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            failed = bool(compare_to_baseline(report, json.load(f), args.tolerance)) or failed
+    else:
+        logger.info(f"No hay baseline en {args.baseline}; usar --save-baseline para crearlo.")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,120 @@
+import numpy as np
+import pandas as pd
+
+# --------------------------------------------------------------------------------
+# Generadores de datos crudos sintéticos
+#
+# Reproducen la estructura de columnas que produce la exportación de la API
+# (json_normalize con 'attributes.*' y 'relationships.*'), incluidas las
+# columnas anchas tipo JSON que los procesadores descartan. `null_rate` controla
+# la proporción de nulos en las columnas opcionales.
+# --------------------------------------------------------------------------------
+BASE_TIMESTAMP = pd.Timestamp('2025-07-26T03:00:00Z')
+
+def _iso_timestamps(rng: np.random.Generator, rows: int, null_rate: float, span_hours: int = 30) -> np.ndarray:
+    """Timestamps ISO 8601 en UTC con la misma forma que la API ('...T12:34:56.000Z')."""
+    offsets = pd.to_timedelta(rng.integers(0, span_hours * 3600, rows), unit='s')
+    values = (BASE_TIMESTAMP + offsets).strftime('%Y-%m-%dT%H:%M:%S.000Z').to_numpy(dtype=object)
+    values[rng.random(rows) < null_rate] = None
+    return values
+
+def _with_nulls(rng: np.random.Generator, values, null_rate: float) -> np.ndarray:
+    """Reemplaza una proporción `null_rate` de valores por nulos."""
+    values = np.asarray(values, dtype=object)
+    values[rng.random(len(values)) < null_rate] = None
+    return values
+
+def _json_refs(rng: np.random.Generator, rows: int, ref_type: str, max_refs: int, id_range: int, pool_size: int = 2_000) -> np.ndarray:
+    """
+    Listas de referencias JSON:API serializadas como las deja pandas ("[{'type': ..., 'id': ...}]").
+
+    Se arma un conjunto de `pool_size` listas distintas y se muestrea de él, para
+    que generar millones de filas no requiera un bucle por fila.
+    """
+    pool = np.empty(pool_size, dtype=object)
+    for i in range(pool_size):
+        refs = rng.integers(1, id_range, rng.integers(0, max_refs + 1))
+        pool[i] = '[' + ', '.join(f"{{'type': '{ref_type}', 'id': '{ref}'}}" for ref in refs) + ']'
+    return pool[rng.integers(0, pool_size, rows)]
+
+def generate_raw_sales(rows: int, null_rate: float = 0.1, seed: int = 0) -> pd.DataFrame:
+    """
+    Genera un DataFrame crudo de fact_sales con el layout de la exportación.
+
+    Args:
+        rows (int): Cantidad de ventas.
+        null_rate (float): Proporción de nulos en columnas opcionales.
+        seed (int): Semilla para reproducibilidad.
+    """
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'type': 'Sale',
+        'id': np.arange(1, rows + 1) + 100_000,
+        'attributes.closedAt': _iso_timestamps(rng, rows, null_rate),
+        'attributes.comment': _with_nulls(rng, rng.choice(['sin sal', 'mesa ventana', 'cumpleaños'], rows), max(null_rate, 0.7)),
+        'attributes.createdAt': _iso_timestamps(rng, rows, 0.0),
+        'attributes.people': _with_nulls(rng, rng.integers(1, 9, rows), null_rate),
+        'attributes.customerName': _with_nulls(rng, rng.choice(['Ana', 'Juan', 'Lucía', 'Pedro'], rows), 0.5),
+        'attributes.total': np.round(rng.random(rows) * 50_000, 2),
+        'attributes.saleType': rng.choice(['EAT-IN', 'TAKEAWAY', 'DELIVERY', 'eat-in'], rows),
+        'attributes.saleState': rng.choice(['CLOSED', 'IN-COURSE', 'PENDING', 'CANCELED'], rows, p=[0.85, 0.08, 0.05, 0.02]),
+        'attributes.anonymousCustomer': None,
+        'attributes.anonymousCustomer.name': _with_nulls(rng, rng.choice(['Cliente', 'Mostrador'], rows), 0.8),
+        'attributes.expectedPayments': _json_refs(rng, rows, 'ExpectedPayment', 2, 500),
+        'relationships.customer.data': None,
+        'relationships.customer.data.type': 'Customer',
+        'relationships.customer.data.id': _with_nulls(rng, rng.integers(1, 5_000, rows), max(null_rate, 0.6)),
+        'relationships.discounts.data': _json_refs(rng, rows, 'Discount', 1, 50),
+        'relationships.items.data': _json_refs(rng, rows, 'Item', 8, 10_000_000),
+        'relationships.payments.data': _json_refs(rng, rows, 'Payment', 2, 10_000_000),
+        'relationships.saleIdentifier.data': None,
+        'relationships.shippingCosts.data': _json_refs(rng, rows, 'ShippingCost', 1, 20),
+        'relationships.table.data.type': 'Table',
+        'relationships.table.data.id': _with_nulls(rng, rng.integers(1, 60, rows), null_rate),
+        'relationships.tips.data': _json_refs(rng, rows, 'Tip', 1, 1_000),
+        'relationships.waiter.data.type': 'User',
+        'relationships.waiter.data.id': _with_nulls(rng, rng.integers(1, 30, rows), null_rate),
+    })
+
+def generate_raw_sales_orders(rows: int, null_rate: float = 0.1, seed: int = 1, num_items: int = 500) -> pd.DataFrame:
+    """
+    Genera un DataFrame crudo de fact_sales_orders con el layout de la exportación.
+
+    Args:
+        rows (int): Cantidad de órdenes.
+        null_rate (float): Proporción de nulos en columnas opcionales.
+        seed (int): Semilla para reproducibilidad.
+        num_items (int): Cantidad de productos distintos (debe coincidir con `generate_dim_items`).
+    """
+    rng = np.random.default_rng(seed)
+    quantity = rng.integers(1, 5, rows)
+    return pd.DataFrame({
+        'type': 'Item',
+        'id': np.arange(1, rows + 1) + 5_000_000,
+        'attributes.canceled': _with_nulls(rng, rng.choice([True, False], rows, p=[0.03, 0.97]), null_rate),
+        'attributes.cancellationComment': _with_nulls(rng, rng.choice(['error de carga', 'cliente se retiró'], rows), 0.97),
+        'attributes.comment': _with_nulls(rng, rng.choice(['sin cebolla', 'bien cocido', 'para llevar'], rows), 0.9),
+        'attributes.createdAt': _iso_timestamps(rng, rows, 0.0),
+        'attributes.price': np.round(rng.random(rows) * 8_000, 2) * quantity,
+        'attributes.quantity': quantity,
+        'attributes.status': rng.choice(['DELIVERED', 'PENDING', 'PREPARING'], rows, p=[0.9, 0.05, 0.05]),
+        'attributes.paid': _with_nulls(rng, rng.choice([True, False], rows), null_rate),
+        'relationships.product.data.type': 'Product',
+        # Algunas claves fuera de la dimensión para ejercitar los item_key nulos
+        'relationships.product.data.id': rng.integers(1, int(num_items * 1.02) + 1, rows),
+        'relationships.subitems.data': _json_refs(rng, rows, 'Subitem', 3, 2_000),
+        'relationships.priceList.data': None,
+        'relationships.priceList.data.type': 'PriceList',
+        'relationships.priceList.data.id': _with_nulls(rng, rng.integers(1, 4, rows), null_rate),
+        'relationships.sale.data.type': 'Sale',
+        'relationships.sale.data.id': rng.integers(100_001, 100_001 + max(rows // 4, 1), rows),
+    })
+
+def generate_dim_items(num_items: int = 500) -> pd.DataFrame:
+    """Genera una dimensión dim_items sintética con las columnas que usa update_item_key."""
+    return pd.DataFrame({
+        'item_key': np.arange(1, num_items + 1),
+        'item_type': 'Product',
+        'original_key': [str(i) for i in range(1, num_items + 1)],
+        'item_name': [f'Producto {i}' for i in range(1, num_items + 1)],
+    })
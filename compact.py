@@ -0,0 +1,42 @@
+import importlib
+import sys
+
+from main import FACT_PROCESSING_TASKS
+from utils import compaction_utils, parquet_profiles
+from utils.env_config import config
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# --------------------------------------------------------------------------------
+# COMPACTACIÓN DE PARTICIONES DE LA CAPA CLEAN
+#    Uso: python compact.py [tabla ...] (por defecto, todas las de FACT_PROCESSING_TASKS)
+#    Cada tabla se compacta junto con sus tablas hijas (CHILD_FACTS del procesador).
+#    No ejecutar dos compactaciones de la misma tabla a la vez.
+# --------------------------------------------------------------------------------
+if __name__ == "__main__":
+    requested = sys.argv[1:]
+    tasks = [task for task in FACT_PROCESSING_TASKS if not requested or task["name"] in requested]
+    fact_names = [task["name"] for task in tasks]
+
+    unknown = set(requested) - set(fact_names)
+    if unknown:
+        logger.error(f"Tablas de hechos desconocidas: {', '.join(sorted(unknown))}")
+        sys.exit(1)
+
+    logger.info("--- INICIANDO COMPACTACIÓN DE TABLAS DE HECHOS ---")
+    total_failed = 0
+    for task in tasks:
+        fact_name = task["name"]
+        processor = importlib.import_module(task["processor"])
+        compacted, failed = compaction_utils.compact_fact(config.STORAGE_ROOT, fact_name, profile=parquet_profiles.resolve(fact_name, processor))
+        total_failed += failed
+        logger.info(f"Tabla 'fact_{fact_name}': {compacted} particiones compactadas, {failed} con error.")
+        # Las tablas hijas se compactan aunque CHILD_FACTS_ENABLED esté apagado ahora: pueden tener salidas anteriores
+        for child_name in getattr(processor, 'CHILD_FACTS', None) or {}:
+            compacted, failed = compaction_utils.compact_fact(config.STORAGE_ROOT, child_name, profile=parquet_profiles.resolve(child_name), source_fact=fact_name)
+            total_failed += failed
+            logger.info(f"Tabla 'fact_{child_name}': {compacted} particiones compactadas, {failed} con error.")
+
+    logger.info("--- COMPACTACIÓN FINALIZADA ---")
+    sys.exit(1 if total_failed else 0)
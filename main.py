@@ -1,108 +1,771 @@
 import os
-from utils import gcp_utils, logs_utils
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Iterable
+from utils import change_detection, manifest_utils, memory_utils, metrics, pipeline_utils, scheduler_utils, storage
 from utils.env_config import config
 from utils.logger import get_logger
+from src.processors import engines
 
-# Módulos de procesamiento para cada tabla de hecho
-from src.processors import sales_processor, sales_orders_processor
+# gcp_utils, compaction_utils, microbatch_utils, parquet_profiles y los
+# procesadores cargan pandas y pyarrow: se importan dentro de las funciones que
+# procesan archivos, de modo que una ejecución sin archivos nuevos (listado,
+# manifiesto y detección de cambios) termina sin importarlos.
 
 logger = get_logger(__name__)
 
 # --------------------------------------------------------------------------------
 # 1. CENTRALIZACIÓN DE TAREAS DE HECHOS
+#    'processor' es el nombre del módulo procesador, que se importa recién
+#    cuando la tarea tiene archivos para procesar. El módulo expone `process(df)` (devuelve una
+#    tabla de Arrow con el esquema de salida del hecho) y, opcionalmente,
+#    RAW_COLUMN_TYPES y COLUMNS_TO_DELETE para leer el CSV crudo ya proyectado
+#    y tipado. 'manifest_prefix' es el manifiesto de archivos procesados;
+#    'log_file' es el log CSV heredado, que se migra al manifiesto la primera vez.
+#    'engine' (opcional) elige el motor de transformación: 'pandas' o 'polars'
+#    (por defecto, PROCESSING_ENGINE). Con SHARD_WORKERS > 1, los archivos de
+#    al menos SHARD_MIN_ROWS filas se transforman repartidos en varios procesos.
 # --------------------------------------------------------------------------------
 FACT_PROCESSING_TASKS = [
-    {"name": "sales", "processor_func": sales_processor.process, "log_file": "logs/processed_sales_log.txt"},
-    {"name": "sales_orders", "processor_func": sales_orders_processor.process, "log_file": "logs/processed_sales_orders_log.txt"}
+    {"name": "sales", "processor": "src.processors.sales_processor", "manifest_prefix": "logs/manifest/fact_sales/", "log_file": "logs/processed_sales_log.txt"},
+    {"name": "sales_orders", "processor": "src.processors.sales_orders_processor", "manifest_prefix": "logs/manifest/fact_sales_orders/", "log_file": "logs/processed_sales_orders_log.txt"}
 ]
 
+def _date_partition(file_path: str) -> str:
+    """Devuelve el segmento 'date=YYYY-MM-DD' de una ruta de archivo crudo."""
+    return [part for part in file_path.split('/') if 'date=' in part][0]
+
+def _apply_lookback(partition: str, days: int) -> str:
+    """Retrocede `days` días una partición 'date=YYYY-MM-DD' para volver a listar archivos tardíos."""
+    partition_date = datetime.strptime(partition.replace('date=', ''), '%Y-%m-%d').date()
+    return f"date={(partition_date - timedelta(days=days)).isoformat()}"
+
+def _update_watermark(discovered: list[dict], pending_files: set, current_watermark: str, manifest_prefix: str):
+    """
+    Avanza el watermark de descubrimiento de una tabla de hechos.
+
+    El nuevo watermark es la partición más antigua que todavía tiene archivos
+    pendientes o, si no queda ninguno, la más reciente listada: todas las
+    particiones anteriores a él ya están completamente procesadas.
+    """
+    if not config.INCREMENTAL_DISCOVERY or not discovered:
+        return
+
+    partitions = [part for part in (_partition_or_none(obj['path']) for obj in discovered) if part]
+    pending_partitions = [part for part in (_partition_or_none(path) for path in pending_files) if part]
+    if pending_partitions:
+        new_watermark = min(pending_partitions)
+    elif partitions:
+        new_watermark = max(partitions)
+    else:
+        return
+
+    if new_watermark != current_watermark:
+        manifest_utils.save_watermark(new_watermark, manifest_prefix, config.STORAGE_ROOT)
+        logger.info(f"Watermark de descubrimiento actualizado a '{new_watermark}'.")
+
+def _partition_or_none(file_path: str) -> str | None:
+    """Como _date_partition, pero devuelve None si la ruta no tiene partición de fecha."""
+    try:
+        return _date_partition(file_path)
+    except IndexError:
+        return None
+
+# --------------------------------------------------------------------------------
+# 2. LÓGICA REUTILIZABLE PARA PROCESAR UN ARCHIVO
+#    Descarga, transforma, sube y registra un único archivo crudo. Los errores se
+#    aíslan por archivo para que un archivo fallido no detenga al resto del lote.
+# --------------------------------------------------------------------------------
+def _destination_path(fact_name: str, file_path: str, partition: str = None) -> str:
+    """
+    Ruta del Parquet en la capa clean correspondiente a un archivo crudo.
+
+    Las filas que caen en otra partición que la del archivo (ver
+    PARTITION_BY_BUSINESS_DATE) van a 'nombre@YYYY-MM-DD.parquet', con la fecha
+    del archivo crudo: no pisan la salida de un archivo del mismo nombre de ese
+    día y el nombre sigue indicando de qué archivo salen (ver change_detection).
+    """
+    raw_partition = _date_partition(file_path)
+    file_name = file_path.split('/')[-1]
+    if partition is None or partition == raw_partition:
+        return storage.get_backend().uri(f"clean/fact_{fact_name}/{raw_partition}/{file_name.replace('.csv', '.parquet')}")
+    return storage.get_backend().uri(f"clean/fact_{fact_name}/{partition}/{file_name.replace('.csv', '')}@{raw_partition.replace('date=', '')}.parquet")
+
+def _output_partitions(file_path: str, entry: dict | None) -> list[str]:
+    """Particiones de clean con filas de un archivo crudo: la de su ruta y las que registró el manifiesto."""
+    return sorted({_date_partition(file_path), *manifest_utils.entry_partitions(entry)})
+
+def _by_business_date(processor) -> bool:
+    """Indica si la salida del procesador se particiona por la fecha de negocio de cada fila."""
+    return config.PARTITION_BY_BUSINESS_DATE and bool(getattr(processor, 'PARTITION_DATE_KEY', None))
+
+def _split_output(table, processor) -> dict:
+    """
+    Reparte una salida con LINEAGE_COLUMN por partición (ver utils.microbatch_utils):
+    por la fecha de negocio de cada fila o por la del archivo crudo de cada fila.
+    """
+    from utils import microbatch_utils
+    if _by_business_date(processor):
+        return microbatch_utils.split_by_date_key(table, processor.PARTITION_DATE_KEY, _date_partition)
+    return microbatch_utils.split_by_partition(table, _date_partition)
+
+def _read_raw_file(file_path: str, processor):
+    """Lee un CSV crudo con la proyección y los tipos declarados por el procesador."""
+    from utils import gcp_utils
+    return gcp_utils.read_csv_from_gcs(
+        file_path,
+        column_types=getattr(processor, 'RAW_COLUMN_TYPES', None),
+        exclude_columns=getattr(processor, 'COLUMNS_TO_DELETE', None),
+        as_table=getattr(processor, 'ARROW_INPUT', False),
+    )
+
+def _run_processor(processor, raw_df, fact_name: str, source_columns: dict, report_dropped: bool = True):
+    """
+    Aplica el procesador a un DataFrame crudo (o a un bloque) midiendo la etapa.
+
+    Las columnas que el procesador descartó por no estar en su esquema (ver
+    fact_schema.pop_dropped_columns) se informan con los archivos que las
+    traían. `source_columns` es {archivo crudo: sus columnas}; con columnas
+    None, el archivo es el único origen de los datos. Con `report_dropped`
+    apagado (bloques siguientes de un mismo archivo) sólo se quita la anotación.
+    """
+    from src.processors import fact_schema
+    with metrics.stage('transform', rows_in=len(raw_df)) as m:
+        clean_df = processor.process(raw_df)
+        m['rows_out'] = len(clean_df)
+
+    clean_df, dropped = fact_schema.pop_dropped_columns(clean_df)
+    if dropped and report_dropped:
+        for file_path, columns in source_columns.items():
+            file_dropped = [col for col in dropped if columns is None or col in columns]
+            if file_dropped:
+                logger.warning(f"Columnas no declaradas en el esquema de 'fact_{fact_name}' descartadas de '{file_path}': {', '.join(file_dropped)}")
+    return clean_df
+
+def _child_fact_names(processor) -> list[str]:
+    """Tablas de hechos hijas que declara el procesador (ver child_facts), si CHILD_FACTS_ENABLED está activo."""
+    if not config.CHILD_FACTS_ENABLED:
+        return []
+    return list(getattr(processor, 'CHILD_FACTS', None) or {})
+
+def _child_tables(processor, clean_table) -> dict:
+    """Tablas hijas de la salida de un procesador ({tabla hija: tabla}; vacío si no corresponde)."""
+    if not _child_fact_names(processor):
+        return {}
+    from src.processors import child_facts
+    return child_facts.extract(clean_table, processor)
+
+def _write_child_facts(children: dict, destination_path: str, fact_name: str) -> list[str]:
+    """
+    Escribe cada tabla hija junto al Parquet de su tabla padre: misma partición y
+    mismo nombre, en clean/fact_{hija}/. Una tabla hija sin filas no se escribe
+    y se elimina la que hubiera dejado una versión anterior del mismo archivo.
+
+    Returns:
+        list[str]: URIs de los Parquet escritos.
+    """
+    from utils import gcp_utils, parquet_profiles
+    backend = storage.get_backend()
+    relative = backend.key(destination_path)[len(f"clean/fact_{fact_name}/"):]
+    written = []
+    for child_name, table in children.items():
+        key = f"clean/fact_{child_name}/{relative}"
+        if table.num_rows == 0:
+            backend.delete(key)
+            continue
+        gcp_utils.write_parquet_to_gcs(table, backend.uri(key), profile=parquet_profiles.resolve(child_name))
+        written.append(backend.uri(key))
+    return written
+
+def _write_file_children(fact_name: str, processor, file_path: str, children: dict):
+    """Escribe las tablas hijas de un archivo crudo junto a cada Parquet de su salida."""
+    if not children:
+        return
+    if not _by_business_date(processor):
+        _write_child_facts(children, _destination_path(fact_name, file_path), fact_name)
+        return
+    from utils import microbatch_utils
+    # Las filas hijas llevan la clave de fecha de su fila padre (CHILD_FACT_PARENT_COLUMNS)
+    child_parts = {child_name: _split_output(microbatch_utils.with_lineage(table, file_path), processor) for child_name, table in children.items()}
+    for partition in sorted({partition for parts in child_parts.values() for partition in parts}):
+        partition_children = {child_name: parts[partition][0] for child_name, parts in child_parts.items() if partition in parts}
+        _write_child_facts(partition_children, _destination_path(fact_name, file_path, partition), fact_name)
+
+def _write_file_output(fact_name: str, processor, file_path: str, clean_table, children: dict, profile: dict) -> list[str]:
+    """
+    Escribe la salida de un archivo crudo y sus tablas hijas.
+
+    Returns:
+        list[str]: Particiones de clean donde quedaron sus filas: la del archivo
+        o, con PARTITION_BY_BUSINESS_DATE, la de cada fecha de negocio (una
+        sola pasada sobre la tabla y un Parquet por partición).
+    """
+    from utils import gcp_utils, microbatch_utils
+    if _by_business_date(processor):
+        parts = _split_output(microbatch_utils.with_lineage(clean_table, file_path), processor)
+        for partition, (table, _) in parts.items():
+            gcp_utils.write_parquet_to_gcs(table, _destination_path(fact_name, file_path, partition), profile=profile)
+        partitions = sorted(parts)
+    else:
+        gcp_utils.write_parquet_to_gcs(clean_table, _destination_path(fact_name, file_path), profile=profile)
+        partitions = [_date_partition(file_path)]
+    _write_file_children(fact_name, processor, file_path, children)
+    return partitions
+
+def process_single_file(file_path: str, fact_name: str, processor, manifest_prefix: str, source: dict = None) -> bool:
+    """
+    Procesa un archivo crudo de una tabla de hechos y lo registra en el log.
+
+    `source` es el objeto del listado del archivo: su generación, tamaño y MD5
+    quedan en el manifiesto (ver utils.change_detection). Con el tamaño, el
+    gobernador de memoria decide si el archivo se procesa en memoria, solo o
+    por bloques (ver utils.memory_utils).
+
+    Returns:
+        bool: True si el archivo se procesó y registró correctamente.
+    """
+    with metrics.file_context(fact_name, file_path):
+        return _process_single_file(file_path, fact_name, processor, manifest_prefix, source)
+
+def _process_streaming(file_path: str, processor, profile: dict, fact_name: str) -> list[str]:
+    """
+    Procesa un CSV por bloques y escribe su Parquet a medida que avanza, con
+    memoria acotada (el orden de filas del perfil se respeta en todo el archivo,
+    ver gcp_utils._ChunkWriter). Con PARTITION_BY_BUSINESS_DATE, cada bloque se reparte por fecha
+    de negocio y se escribe un Parquet por partición. Las tablas hijas de cada
+    bloque (sólo claves) se juntan y se escriben al final.
+
+    Returns:
+        list[str]: Particiones de clean donde quedaron sus filas.
+    """
+    from utils import gcp_utils, microbatch_utils
+    raw_chunks = gcp_utils.iter_csv_chunks_from_gcs(
+        file_path,
+        getattr(processor, 'RAW_COLUMN_TYPES', None),
+        getattr(processor, 'COLUMNS_TO_DELETE', None),
+        config.STREAMING_CHUNK_MB * 1024 * 1024,
+        as_table=getattr(processor, 'ARROW_INPUT', False),
+    )
+    children = []
+
+    def _clean_chunks():
+        for i, chunk in enumerate(raw_chunks):
+            clean_chunk = _run_processor(processor, chunk, fact_name, {file_path: None}, report_dropped=i == 0)
+            children.append(_child_tables(processor, clean_chunk))
+            yield clean_chunk
+
+    if _by_business_date(processor):
+        # El nombre de cada Parquet ya indica su archivo de origen: el linaje por bloque no se guarda
+        parts = (
+            {partition: table.replace_schema_metadata(None) for partition, (table, _) in _split_output(microbatch_utils.with_lineage(clean_chunk, file_path), processor).items()}
+            for clean_chunk in _clean_chunks()
+        )
+        partitions = sorted(gcp_utils.write_partitioned_chunks_to_gcs(parts, lambda partition: _destination_path(fact_name, file_path, partition), profile))
+    else:
+        gcp_utils.write_parquet_chunks_to_gcs(_clean_chunks(), _destination_path(fact_name, file_path), profile)
+        partitions = [_date_partition(file_path)]
+
+    if children and children[0]:
+        import pyarrow as pa
+        from src.processors import fact_schema
+        merged = {name: fact_schema.unify_dictionaries(pa.concat_tables(part[name] for part in children)) for name in children[0]}
+        _write_file_children(fact_name, processor, file_path, merged)
+    return partitions
+
+def _process_single_file(file_path: str, fact_name: str, processor, manifest_prefix: str, source: dict = None) -> bool:
+    from utils import parquet_profiles
+    try:
+        logger.info(f"Procesando archivo: {file_path}")
+
+        profile = parquet_profiles.resolve(fact_name, processor)
+        logger.info(f"Aplicando la función de procesamiento: {processor.__name__}")
+
+        with memory_utils.admit(fact_name, file_path, (source or {}).get('size') or 0, manifest_prefix) as decision:
+            if config.STREAMING_MODE or decision['mode'] == 'streaming':
+                partitions = _process_streaming(file_path, processor, profile, fact_name)
+            else:
+                try:
+                    raw_df = _read_raw_file(file_path, processor)
+                    clean_df = _run_processor(processor, raw_df, fact_name, {file_path: None})
+                    partitions = _write_file_output(fact_name, processor, file_path, clean_df, _child_tables(processor, clean_df), profile)
+                except MemoryError:
+                    # Se liberan los DataFrames del intento en memoria antes de reintentar
+                    raw_df = clean_df = None
+                    logger.warning(f"Memoria insuficiente al procesar '{file_path}' en memoria; se reintenta por bloques.")
+                    decision['fallback'] = 'streaming'
+                    partitions = _process_streaming(file_path, processor, profile, fact_name)
+
+        manifest_utils.append_to_log(file_path, manifest_prefix, config.STORAGE_ROOT, source, partitions)
+
+        logger.info(f"Archivo procesado y guardado exitosamente en clean/fact_{fact_name}/ ({', '.join(partitions) or 'sin filas'}).")
+        return True
+
+    except Exception as e:
+        logger.error(f"ERROR al procesar el archivo '{file_path}': {e}", exc_info=True)
+        return False
+
+def process_files_pipelined(files: Iterable[str], fact_name: str, processor, manifest_prefix: str, file_slots: threading.Semaphore = None, on_commit: Callable = None, listing: dict[str, dict] = None) -> dict:
+    """
+    Procesa archivos con etapas solapadas: descarga anticipada, transformación y
+    subida en hilos separados, con colas acotadas entre ellas. Cada archivo se
+    registra en el manifiesto sólo después de subir su Parquet.
+
+    `files` puede ser un generador: el lector pide el siguiente archivo recién
+    cuando tiene lugar, lo que permite decidir la admisión sobre la marcha.
+    `on_commit(ruta)`, si se indica, se llama después de registrar cada archivo.
+    `listing` ({ruta: objeto del listado}) aporta lo que se registra de cada archivo crudo.
+
+    Returns:
+        dict: {ruta del archivo: True si se procesó y registró correctamente}.
+    """
+    from utils import parquet_profiles
+    profile = parquet_profiles.resolve(fact_name, processor)
+    # Particiones escritas de cada archivo, hasta registrarlo (escritura y registro corren en el mismo hilo)
+    written_partitions = {}
+
+    def _read(file_path):
+        logger.info(f"Descargando archivo: {file_path}")
+        with metrics.file_context(fact_name, file_path):
+            return _read_raw_file(file_path, processor)
+
+    def _transform(file_path, raw_df):
+        logger.info(f"Aplicando {processor.__name__} a {file_path}")
+        with metrics.file_context(fact_name, file_path):
+            clean_df = _run_processor(processor, raw_df, fact_name, {file_path: None})
+            return clean_df, _child_tables(processor, clean_df)
+
+    def _write(file_path, outputs):
+        clean_df, children = outputs
+        with metrics.file_context(fact_name, file_path):
+            written_partitions[file_path] = _write_file_output(fact_name, processor, file_path, clean_df, children, profile)
+
+    def _commit(file_path):
+        partitions = written_partitions.pop(file_path)
+        with metrics.file_context(fact_name, file_path):
+            manifest_utils.append_to_log(file_path, manifest_prefix, config.STORAGE_ROOT, (listing or {}).get(file_path), partitions)
+        logger.info(f"Archivo procesado y guardado exitosamente en clean/fact_{fact_name}/ ({', '.join(partitions) or 'sin filas'}).")
+        if on_commit is not None:
+            on_commit(file_path)
+
+    return pipeline_utils.run_staged_pipeline(
+        files, _read, _transform, _write, _commit,
+        queue_size=config.PIPELINE_QUEUE_SIZE, slots=file_slots,
+    )
+
+def process_micro_batch(files: list[str], fact_name: str, processor, manifest_prefix: str, listing: dict[str, dict] = None) -> dict:
+    """
+    Procesa varios archivos crudos en una sola pasada (ver utils.microbatch_utils):
+    los concatena con su linaje, aplica el procesador una vez, escribe un Parquet
+    por partición de fecha y registra todas las fuentes en un único segmento del
+    manifiesto, de modo que quedan registradas juntas o ninguna.
+
+    Si el micro-lote falla, se eliminan sus Parquet ya escritos y cada archivo
+    se reintenta por separado con process_single_file, para que un archivo
+    defectuoso no bloquee al resto. `listing` ({ruta: objeto del listado})
+    aporta lo que se registra de cada archivo crudo.
+
+    El micro-lote pasa por el gobernador de memoria como una unidad; si no
+    entraría en memoria ni solo, sus archivos se procesan de a uno.
+
+    Returns:
+        dict: {ruta del archivo: True si se procesó y registró correctamente}.
+    """
+    import pyarrow as pa
+    from utils import gcp_utils, microbatch_utils, parquet_profiles
+    label = f"{files[0]} (+{len(files) - 1} archivos)" if len(files) > 1 else files[0]
+    profile = parquet_profiles.resolve(fact_name, processor)
+    batch_bytes = sum((listing or {}).get(file_path, {}).get('size') or 0 for file_path in files)
+
+    if len(files) > 1 and not memory_utils.fits_alone(batch_bytes, manifest_prefix):
+        logger.info(f"El micro-lote de {len(files)} archivos ({batch_bytes / 1024 / 1024:.0f} MB) no entra en memoria; se procesan de a uno.")
+        return {file_path: process_single_file(file_path, fact_name, processor, manifest_prefix, (listing or {}).get(file_path)) for file_path in files}
+
+    def _read(file_path):
+        with metrics.file_context(fact_name, label):
+            return _read_raw_file(file_path, processor)
+
+    with metrics.file_context(fact_name, label), memory_utils.admit(fact_name, label, batch_bytes, manifest_prefix, allow_streaming=False):
+        # Las lecturas son independientes y dominadas por la latencia de cada objeto
+        with ThreadPoolExecutor(max_workers=max(1, min(config.MICRO_BATCH_READ_WORKERS, len(files))), thread_name_prefix=f"read_{fact_name}") as executor:
+            raw_data = list(executor.map(_read, files))
+
+        results = {}
+        frames = []
+        for file_path, data in zip(files, raw_data):
+            # read_csv_from_gcs devuelve datos sin columnas cuando la lectura falla
+            if data.shape[1] == 0:
+                logger.error(f"No se pudo leer '{file_path}'; queda pendiente para la próxima ejecución.")
+                results[file_path] = False
+            else:
+                frames.append((file_path, data))
+        if not frames:
+            return results
+
+        backend = storage.get_backend()
+        sources = [file_path for file_path, _ in frames]
+        source_columns = {file_path: set(data.column_names if isinstance(data, pa.Table) else data.columns) for file_path, data in frames}
+        written = []
+        try:
+            logger.info(f"Aplicando {processor.__name__} a un micro-lote de {len(frames)} archivos.")
+            batch = microbatch_utils.concat_with_lineage(frames)
+            del frames, raw_data
+            clean_table = _run_processor(processor, batch, fact_name, source_columns)
+            del batch
+
+            # Cada tabla hija se reparte por partición con el linaje de sus propias filas
+            child_parts = {
+                child_name: _split_output(table, processor)
+                for child_name, table in _child_tables(processor, clean_table).items()
+            }
+            partitions = {}
+            for partition, (table, partition_sources) in _split_output(clean_table, processor).items():
+                destination_path = backend.uri(f"clean/fact_{fact_name}/{partition}/{microbatch_utils.output_name(partition_sources)}")
+                gcp_utils.write_parquet_to_gcs(table, destination_path, profile=profile)
+                written.append(destination_path)
+                children = {child_name: parts[partition][0] for child_name, parts in child_parts.items() if partition in parts}
+                written.extend(_write_child_facts(children, destination_path, fact_name))
+                for file_path in partition_sources:
+                    partitions.setdefault(file_path, []).append(partition)
+
+            manifest_utils.append_entries(sources, manifest_prefix, config.STORAGE_ROOT, listing, partitions)
+            logger.info(f"Micro-lote de {len(sources)} archivos guardado en {len(written)} archivo(s) Parquet.")
+            results.update({file_path: True for file_path in sources})
+            return results
+
+        except Exception as e:
+            logger.error(f"ERROR en el micro-lote de {len(sources)} archivos: {e}; se reintentan de a uno.", exc_info=True)
+            for destination_path in written:
+                try:
+                    backend.delete(backend.key(destination_path))
+                except Exception as delete_error:
+                    logger.warning(f"No se pudo eliminar {destination_path}: {delete_error}")
+
+    for file_path in sources:
+        results[file_path] = process_single_file(file_path, fact_name, processor, manifest_prefix, (listing or {}).get(file_path))
+    return results
+
+def _processing_mode() -> str:
+    """Modo de procesamiento configurado (también es la clave de su modelo de costo)."""
+    if config.MICRO_BATCH_MODE:
+        return 'micro_batch'
+    if config.PIPELINE_MODE and not config.STREAMING_MODE:
+        return 'pipeline'
+    return 'per_file'
+
+def process_pending_files(pending: list[dict], fact_name: str, processor, manifest_prefix: str, file_slots: threading.Semaphore = None, deadline: float = None) -> tuple[dict, list[str]]:
+    """
+    Procesa archivos pendientes en el modo configurado, admitiendo cada archivo
+    o micro-lote sólo si su costo estimado entra antes de `deadline` (ver
+    utils.scheduler_utils). Lo observado actualiza el modelo de costo de la tabla.
+
+    Args:
+        pending (list[dict]): Archivos (objetos del listado) en orden de prioridad.
+        fact_name (str): Nombre de la tabla de hechos.
+        processor: Módulo procesador de la tabla de hechos.
+        manifest_prefix (str): Prefijo del manifiesto de archivos procesados.
+        file_slots (threading.Semaphore, opcional): Tope global de archivos (o micro-lotes) en proceso.
+        deadline (float, opcional): Límite en time.monotonic(); None para procesar todos.
+
+    Returns:
+        tuple[dict, list[str]]: ({ruta: True si se procesó y registró}, rutas que quedan para la próxima ejecución).
+    """
+    mode = _processing_mode()
+    model = scheduler_utils.get_model(scheduler_utils.load_models(manifest_prefix, config.STORAGE_ROOT), mode)
+    listing = {obj['path']: obj for obj in pending}
+    sizes = {obj['path']: obj.get('size') or 0 for obj in pending}
+    overhead, per_mb = model.coefficients()
+    logger.info(f"Costo estimado en modo {mode}: {overhead:.2f}s por archivo + {per_mb:.3f}s por MB.")
+
+    if mode == 'micro_batch':
+        from utils import microbatch_utils
+        batches = microbatch_utils.plan_batches(pending, config.MICRO_BATCH_MAX_FILES, config.MICRO_BATCH_MAX_MB * 1024 * 1024)
+        units = [{'items': batch, 'bytes': sum(sizes[file_path] for file_path in batch)} for batch in batches]
+        if config.SCHEDULER_ORDER == 'smallest':
+            units.sort(key=lambda unit: unit['bytes'])
+        max_workers = max(1, min(config.PROCESSING_MAX_WORKERS, len(units)))
+        logger.info(f"Procesando hasta {len(units)} micro-lotes con {max_workers} workers en paralelo.")
+        results, skipped = scheduler_utils.run_within_budget(
+            units, lambda files: process_micro_batch(files, fact_name, processor, manifest_prefix, listing),
+            max_workers, model, deadline, file_slots, f"fact_{fact_name}",
+        )
+        left = [file_path for unit in skipped for file_path in unit['items']]
+
+    elif mode == 'pipeline':
+        logger.info(f"Procesando en modo pipeline (cola entre etapas: {config.PIPELINE_QUEUE_SIZE}).")
+        # Archivos que pueden estar en el pipeline delante del próximo (ver pipeline_utils)
+        depth = 2 * config.PIPELINE_QUEUE_SIZE + 3
+        admitted, committed, left = [], [], []
+
+        # Los archivos que no entran solos en memoria no pasan por el pipeline, que
+        # retiene varios a la vez: se procesan de a uno al final (ver utils.memory_utils)
+        deferred = [obj for obj in pending if not memory_utils.fits_alone(sizes[obj['path']], manifest_prefix)]
+        deferred_paths = {obj['path'] for obj in deferred}
+
+        def _admit():
+            for obj in pending:
+                if obj['path'] in deferred_paths:
+                    continue
+                ahead = min(len(admitted) - len(committed), depth)
+                if scheduler_utils.fits(model, sizes[obj['path']], 1, deadline, ahead) or scheduler_utils.should_explore(model, deadline, len(admitted)):
+                    admitted.append(obj['path'])
+                    yield obj['path']
+                else:
+                    left.append(obj['path'])
+
+        start = time.perf_counter()
+        results = process_files_pipelined(_admit(), fact_name, processor, manifest_prefix, file_slots, on_commit=committed.append, listing=listing)
+        if admitted:
+            model.observe(sum(sizes[file_path] for file_path in admitted), len(admitted), time.perf_counter() - start)
+
+        for obj in deferred:
+            if scheduler_utils.fits(model, sizes[obj['path']], 1, deadline):
+                logger.info(f"Procesando fuera del pipeline, por tamaño: {obj['path']}")
+                if file_slots is not None:
+                    file_slots.acquire()
+                try:
+                    results[obj['path']] = process_single_file(obj['path'], fact_name, processor, manifest_prefix, obj)
+                finally:
+                    if file_slots is not None:
+                        file_slots.release()
+            else:
+                left.append(obj['path'])
+
+    else:
+        units = [{'items': [obj['path']], 'bytes': sizes[obj['path']]} for obj in pending]
+        max_workers = max(1, min(config.PROCESSING_MAX_WORKERS, len(units)))
+        logger.info(f"Procesando con {max_workers} workers en paralelo.")
+        results, skipped = scheduler_utils.run_within_budget(
+            units, lambda files: {files[0]: process_single_file(files[0], fact_name, processor, manifest_prefix, listing[files[0]])},
+            max_workers, model, deadline, file_slots, f"fact_{fact_name}",
+        )
+        left = [unit['items'][0] for unit in skipped]
+
+    try:
+        scheduler_utils.save_model(model, mode, manifest_prefix, config.STORAGE_ROOT)
+    except Exception as e:
+        logger.warning(f"No se pudo guardar el throughput observado de '{fact_name}': {e}")
+    memory_utils.save_models(manifest_prefix)
+    return results, left
+
 # --------------------------------------------------------------------------------
-# 2. LÓGICA REUTILIZABLE PARA PROCESAR UNA TABLA DE HECHOS
+# 3. LÓGICA REUTILIZABLE PARA PROCESAR UNA TABLA DE HECHOS
 #    Esta función encapsula la lógica para procesar todos los archivos nuevos
 #    de una tabla de hechos.
 # --------------------------------------------------------------------------------
-def run_fact_processing_task(fact_name: str, process_function, log_path: str):
+def run_fact_processing_task(fact_name: str, processor, manifest_prefix: str, file_slots: threading.Semaphore = None, legacy_log_path: str = None, deadline: float = None):
     """
     Ejecuta el pipeline para un lote de archivos nuevos de una tabla de hechos.
+
+    El lote es, según la configuración, todo lo pendiente (BACKLOG_DRAIN), lo que
+    entre antes de `deadline` (RUN_TIME_BUDGET_SECONDS) o los primeros
+    PROCESSING_BATCH_SIZE archivos, en el orden de SCHEDULER_ORDER.
+
+    Son pendientes los archivos nuevos, los reescritos desde que se procesaron
+    y las demás fuentes de los Parquet que contienen filas de un archivo
+    reescrito; las copias idénticas de archivos ya procesados se registran sin
+    procesarlas (ver utils.change_detection).
+
+    Args:
+        fact_name (str): Nombre de la tabla de hechos (ej. 'sales').
+        processor: Módulo procesador de la tabla de hechos (ver FACT_PROCESSING_TASKS).
+        manifest_prefix (str): Prefijo del manifiesto de archivos procesados dentro del bucket.
+        file_slots (threading.Semaphore, opcional): Semáforo compartido entre tareas
+            que limita la cantidad global de archivos en proceso simultáneo.
+        legacy_log_path (str, opcional): Log CSV heredado a migrar al manifiesto si aún no se hizo.
+        deadline (float, opcional): Límite de la ejecución en time.monotonic() (ver run_all_tasks).
+
+    Returns:
+        tuple[bool, int, int]: (tarea exitosa, archivos procesados, archivos fallidos).
     """
     logger.info(f"--- Iniciando procesamiento para la tabla de hechos: '{fact_name}' ---")
     
     try:
         raw_folder_prefix = f"raw/fact_{fact_name}/"
-        all_files = gcp_utils.list_gcs_files(config.GCS_BUCKET_NAME, raw_folder_prefix)
-        
-        processed_files = logs_utils.load_processed_log(log_path, config.GCS_BUCKET_NAME)
-        
-        files_to_process = [
-            f"gs://{f}" if not f.startswith('gs://') else f 
-            for f in all_files 
-            if f.endswith(".csv") and (f"gs://{f}" if not f.startswith('gs://') else f) not in processed_files
-        ]
+
+        watermark = None
+        if config.INCREMENTAL_DISCOVERY:
+            watermark = manifest_utils.load_watermark(manifest_prefix, config.STORAGE_ROOT)
+        # El listado incremental no ve los archivos reescritos en particiones anteriores al watermark: cada tanto se lista todo
+        full_listing = bool(watermark) and config.CHANGE_DETECTION and change_detection.full_listing_due(
+            manifest_prefix, config.STORAGE_ROOT, config.CHANGE_DETECTION_FULL_LIST_HOURS
+        )
+        start_partition = _apply_lookback(watermark, config.DISCOVERY_LOOKBACK_DAYS) if watermark and not full_listing else None
+        logger.info(f"Listando '{raw_folder_prefix}' desde {start_partition or 'el inicio'}{' (revisión completa de cambios)' if full_listing else ''}.")
+        discovered = storage.list_objects(config.STORAGE_ROOT, raw_folder_prefix, start_partition, suffix=".csv")
+
+        if legacy_log_path:
+            manifest_utils.migrate_legacy_log(legacy_log_path, manifest_prefix, config.STORAGE_ROOT)
+        entries = manifest_utils.load_manifest_entries(manifest_prefix, config.STORAGE_ROOT)
+
+        pending, changed, record_only = change_detection.classify(
+            discovered, entries, config.STORAGE_ROOT, config.CHANGE_DETECTION, config.DUPLICATE_DETECTION
+        )
+        if record_only:
+            duplicates = sum(1 for obj in record_only if obj.get('duplicate_of'))
+            logger.info(f"Se registran sin procesar {len(record_only)} archivos: {duplicates} copias idénticas de archivos ya procesados y {len(record_only) - duplicates} vueltos a subir sin cambios.")
+            # Un archivo vuelto a subir sin cambios conserva las particiones donde ya están sus filas
+            kept_partitions = {obj['path']: manifest_utils.entry_partitions(entries.get(obj['path'])) for obj in record_only if not obj.get('duplicate_of')}
+            manifest_utils.append_entries([obj['path'] for obj in record_only], manifest_prefix, config.STORAGE_ROOT, {obj['path']: obj for obj in record_only}, kept_partitions)
+
+        superseded = change_detection.load_superseded(manifest_prefix, config.STORAGE_ROOT)
+        if changed:
+            logger.info(f"{len(changed)} archivos cambiaron desde que se procesaron; se reprocesan.")
+            partitions_of = lambda file_path: _output_partitions(file_path, entries.get(file_path))
+            found = change_detection.find_superseded_outputs(config.STORAGE_ROOT, fact_name, changed, partitions_of)
+            for child_name in _child_fact_names(processor):
+                found += change_detection.find_superseded_outputs(config.STORAGE_ROOT, child_name, changed, partitions_of, source_fact=fact_name)
+            superseded = change_detection.register_superseded(found, superseded)
+        if config.INCREMENTAL_DISCOVERY and config.CHANGE_DETECTION and start_partition is None:
+            # Los reescritos encontrados quedan pendientes y el watermark retrocede hasta ellos (ver _update_watermark)
+            change_detection.save_full_listing(manifest_prefix, config.STORAGE_ROOT)
+        if superseded:
+            listed = {obj['path']: obj for obj in pending}
+            outstanding, kept = change_detection.outstanding_objects(superseded, entries, {obj['path']: obj for obj in discovered}, config.STORAGE_ROOT)
+            pending.extend(obj for obj in outstanding if obj['path'] not in listed)
+            if changed or kept != superseded:
+                change_detection.save_superseded(kept, manifest_prefix, config.STORAGE_ROOT)
+            superseded = kept
+
+        pending = scheduler_utils.order_files(pending, config.SCHEDULER_ORDER)
+        files_to_process = [obj['path'] for obj in pending]
 
         if not files_to_process:
             logger.info(f"No se encontraron archivos nuevos para procesar en '{raw_folder_prefix}'.")
-            return True, 0
+            _update_watermark(discovered, set(), watermark, manifest_prefix)
+            return True, 0, 0
 
-        logger.info(f"Se encontraron {len(files_to_process)} archivos nuevos en total.")
-        
-        batch_size = config.PROCESSING_BATCH_SIZE
-        files_for_this_run = files_to_process[:batch_size]
+        logger.info(f"Se encontraron {len(files_to_process)} archivos para procesar en total.")
         
-        logger.info(f"Se procesará un lote de {len(files_for_this_run)} archivos (configuración de lote: {batch_size}).")
-
-        processed_count = 0
-        for file_path in files_for_this_run:
-            try:
-                logger.info(f"Procesando archivo: {file_path}")
-                
-                path_parts = file_path.split('/')
-                date_partition = [part for part in path_parts if 'date=' in part][0]
-                file_name = path_parts[-1]
-                
-                raw_df = gcp_utils.read_csv_from_gcs(file_path)
-                logger.info(f"Aplicando la función de procesamiento: {process_function.__module__}")
-                clean_df = process_function(raw_df)
-
-                destination_path = f"gs://{config.GCS_BUCKET_NAME}/clean/fact_{fact_name}/{date_partition}/{file_name.replace('.csv', '.parquet')}"
-                gcp_utils.write_parquet_to_gcs(clean_df, destination_path)
-                
-                logs_utils.append_to_log(file_path, log_path, config.GCS_BUCKET_NAME)
-                
-                logger.info(f"Archivo procesado y guardado exitosamente en {destination_path}.")
-                processed_count += 1
-
-            except Exception as e:
-                logger.error(f"ERROR al procesar el archivo '{file_path}': {e}", exc_info=True)
-                continue 
-
-        logger.info(f"Finalizó el lote. Se procesaron {processed_count} de {len(files_for_this_run)} archivos para '{fact_name}'.")
-        return True, processed_count
+        if config.BACKLOG_DRAIN:
+            logger.info(f"Modo drenaje: se procesarán los {len(pending)} archivos pendientes.")
+        elif deadline is not None:
+            logger.info(f"Se procesarán archivos mientras entren en el presupuesto ({max(0.0, deadline - time.monotonic()):.0f}s restantes).")
+        else:
+            pending = pending[:config.PROCESSING_BATCH_SIZE]
+            logger.info(f"Se procesará un lote de {len(pending)} archivos (configuración de lote: {config.PROCESSING_BATCH_SIZE}).")
+
+        results, left = process_pending_files(pending, fact_name, processor, manifest_prefix, file_slots, deadline)
+        if left:
+            logger.info(f"Presupuesto de tiempo agotado: {len(left)} archivos quedan para la próxima ejecución.")
+
+        for file_path, success in results.items():
+            metrics.set_file_result(fact_name, file_path, success)
+        succeeded_files = {file_path for file_path, success in results.items() if success}
+        processed_count = len(succeeded_files)
+
+        _update_watermark(discovered, set(files_to_process) - succeeded_files, watermark, manifest_prefix)
+
+        latest_entries = {}
+        if superseded or (config.COMPACT_AFTER_TASK and succeeded_files):
+            latest_entries = manifest_utils.load_manifest_entries(manifest_prefix, config.STORAGE_ROOT)
+
+        if superseded:
+            # Los Parquet desactualizados se eliminan cuando todas sus fuentes quedaron registradas de nuevo
+            remaining = change_detection.retire_superseded(superseded, latest_entries, config.STORAGE_ROOT)
+            if remaining != superseded:
+                change_detection.save_superseded(remaining, manifest_prefix, config.STORAGE_ROOT)
+
+        touched_partitions = {partition for file_path in succeeded_files for partition in _output_partitions(file_path, latest_entries.get(file_path))}
+        if config.COMPACT_AFTER_TASK and touched_partitions:
+            from utils import compaction_utils, parquet_profiles
+            compacted, _ = compaction_utils.compact_fact(config.STORAGE_ROOT, fact_name, sorted(touched_partitions), parquet_profiles.resolve(fact_name, processor))
+            logger.info(f"Compactación posterior: {compacted} de {len(touched_partitions)} particiones compactadas para '{fact_name}'.")
+            for child_name in _child_fact_names(processor):
+                compacted, _ = compaction_utils.compact_fact(config.STORAGE_ROOT, child_name, sorted(touched_partitions), parquet_profiles.resolve(child_name), source_fact=fact_name)
+                logger.info(f"Compactación posterior: {compacted} de {len(touched_partitions)} particiones compactadas para '{child_name}'.")
+
+        failed_count = len(results) - processed_count
+        logger.info(f"Finalizó el lote. Se procesaron {processed_count} de {len(results)} archivos para '{fact_name}'.")
+        return True, processed_count, failed_count
 
     except Exception as e:
         logger.error(f"ERROR CRÍTICO en la tarea de procesamiento de '{fact_name}': {e}", exc_info=True)
-        return False, 0
+        return False, 0, 0
 
 # --------------------------------------------------------------------------------
-# 3. ORQUESTADOR PRINCIPAL
-#    Itera sobre la lista de tareas y ejecuta cada una.
+# 4. ORQUESTADOR PRINCIPAL
+#    Ejecuta todas las tareas, en paralelo o una detrás de otra según la
+#    configuración, y arma un resumen combinado por tarea.
 # --------------------------------------------------------------------------------
+def run_all_tasks(tasks: list[dict]) -> dict:
+    """
+    Ejecuta las tareas de hechos y devuelve un resumen por tarea.
+
+    Con PARALLEL_FACT_TASKS activo, las tareas corren a la vez y comparten un
+    tope global de MAX_CONCURRENT_FILES archivos en proceso simultáneo.
+
+    Con RUN_TIME_BUDGET_SECONDS > 0 (y sin BACKLOG_DRAIN), todas las tareas
+    comparten un mismo límite: el presupuesto menos RUN_TIME_RESERVE_SECONDS,
+    contado desde ahora.
+
+    Returns:
+        dict: {nombre_tarea: {"success": bool, "processed": int, "failed": int}}
+    """
+    file_slots = threading.BoundedSemaphore(max(1, config.MAX_CONCURRENT_FILES))
+    summary = {}
+
+    deadline = None
+    if config.RUN_TIME_BUDGET_SECONDS > 0 and not config.BACKLOG_DRAIN:
+        deadline = time.monotonic() + config.RUN_TIME_BUDGET_SECONDS - config.RUN_TIME_RESERVE_SECONDS
+
+    # El motor se valida antes de empezar para que uno mal configurado falle sin
+    # procesar nada; el módulo procesador se importa al procesar el primer archivo
+    processors = {
+        task["name"]: engines.lazy(task["processor"], task.get("engine") or config.PROCESSING_ENGINE, config.SHARD_WORKERS, config.SHARD_MIN_ROWS)
+        for task in tasks
+    }
+
+    def _run(task):
+        start = time.perf_counter()
+        success, processed, failed = run_fact_processing_task(
+            task["name"], processors[task["name"]], task["manifest_prefix"], file_slots, task.get("log_file"), deadline
+        )
+        metrics.record_task(task["name"], success, processed, failed, time.perf_counter() - start)
+        return task["name"], {"success": success, "processed": processed, "failed": failed}
+
+    try:
+        if config.PARALLEL_FACT_TASKS and len(tasks) > 1:
+            logger.info(f"Ejecutando {len(tasks)} tareas de hechos en paralelo (tope global: {config.MAX_CONCURRENT_FILES} archivos).")
+            with ThreadPoolExecutor(max_workers=len(tasks), thread_name_prefix="fact_task") as executor:
+                for name, result in executor.map(_run, tasks):
+                    summary[name] = result
+        else:
+            for task in tasks:
+                name, result = _run(task)
+                summary[name] = result
+    finally:
+        # El pool de shards (SHARD_WORKERS) sólo existe si algún procesador se cargó repartido
+        sharding = sys.modules.get('src.processors.sharding')
+        if sharding is not None:
+            sharding.shutdown_pool()
+
+    return summary
+
 if __name__ == "__main__":
     logger.info("--- INICIANDO PIPELINE DE PROCESAMIENTO DE TABLAS DE HECHOS ---")
-    
-    total_success_tasks = 0
-    total_failed_tasks = 0
+    logger.debug(f"GCP_PROJECT_ID: {config.GCP_PROJECT_ID}, GOOGLE_APPLICATION_CREDENTIALS: {config.GOOGLE_APPLICATION_CREDENTIALS}")
+    metrics.reset()
 
-    for task in FACT_PROCESSING_TASKS:
-        fact_name = task["name"]
-        processor = task["processor_func"]
-        log_file = task["log_file"]
-        
-        success, files_processed = run_fact_processing_task(fact_name, processor, log_file)
-        
-        if success:
-            total_success_tasks += 1
-        else:
-            total_failed_tasks += 1
+    summary = run_all_tasks(FACT_PROCESSING_TASKS)
+
+    total_success_tasks = sum(1 for result in summary.values() if result["success"])
+    total_failed_tasks = len(summary) - total_success_tasks
 
     logger.info("--- PIPELINE DE HECHOS FINALIZADO ---")
-    logger.info(f"Resumen: {total_success_tasks} tareas de hechos exitosas, {total_failed_tasks} tareas fallidas.")
\ No newline at end of file
+    for name, result in summary.items():
+        status = "OK" if result["success"] else "FALLIDA"
+        logger.info(f"Tarea '{name}': {status} - {result['processed']} archivos procesados, {result['failed']} archivos fallidos.")
+    logger.info(f"Resumen: {total_success_tasks} tareas de hechos exitosas, {total_failed_tasks} tareas fallidas.")
+
+    if config.METRICS_ENABLED:
+        report = metrics.build_report()
+        metrics.log_summary(report)
+        try:
+            report_uri = metrics.write_report(report)
+            if report_uri:
+                logger.info(f"Reporte de la ejecución guardado en {report_uri}")
+        except Exception as e:
+            logger.warning(f"No se pudo guardar el reporte de la ejecución: {e}")
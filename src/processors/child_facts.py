@@ -0,0 +1,156 @@
+import ast
+import json
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.json as pj
+
+from src.processors import fact_schema
+from utils import metrics
+from utils.logger import get_logger
+from utils.microbatch_utils import LINEAGE_COLUMN
+
+logger = get_logger(__name__)
+
+# --------------------------------------------------------------------------------
+# Tablas de hechos hijas a partir de las relaciones embebidas
+#
+# Algunas columnas de salida (ej. 'discounts_data' en sales, 'subitems_data' en
+# sales_orders) guardan la lista de referencias JSON:API de la fila tal como la
+# serializó el exportador: "[{'type': 'Discount', 'id': '12'}, ...]". Cada
+# consulta que las necesita tiene que volver a parsearlas fila por fila. Con
+# CHILD_FACTS_ENABLED, esas columnas se parsean una sola vez al escribir y se
+# normalizan en tablas hijas: una fila por referencia, con las columnas de la
+# fila padre que declara el procesador (su clave y su clave de fecha), la
+# posición de la referencia en la lista, su id como clave entera y su tipo.
+#
+# El parseo es en lote: las listas se pasan a JSON con un reemplazo de
+# comillas vectorizado, se arma un único buffer NDJSON ('{"refs": <lista>}'
+# por fila) y lo lee el lector JSON multihilo de Arrow con un esquema explícito.
+# La explosión a filas hijas usa los largos de las listas, sin bucles por fila.
+# Si alguna lista no es JSON válido después del reemplazo (ej. un texto con
+# apóstrofos o ids numéricos), la columna se parsea fila por fila como literal
+# de Python y las filas que tampoco se pueden leer quedan sin hijas.
+#
+# Un procesador declara:
+#   CHILD_FACTS = {tabla hija: (columna con las referencias, clave hija)}
+#   CHILD_FACT_PARENT_COLUMNS = [columnas de la fila padre que lleva cada fila hija]
+# --------------------------------------------------------------------------------
+POSITION_COLUMN = 'position'
+REF_TYPE_COLUMN = 'ref_type'
+
+_REF_TYPE = pa.struct([('type', pa.string()), ('id', pa.string())])
+_PARSE_SCHEMA = pa.schema([('refs', pa.list_(_REF_TYPE))])
+
+def child_schema(processor, child_key: str) -> pa.Schema:
+    """Esquema de una tabla hija: columnas de la fila padre (con sus tipos), posición, clave hija y tipo."""
+    return pa.schema(
+        [processor.OUTPUT_SCHEMA.field(col) for col in processor.CHILD_FACT_PARENT_COLUMNS] + [
+            pa.field(POSITION_COLUMN, pa.int64()),
+            pa.field(child_key, pa.int64()),
+            pa.field(REF_TYPE_COLUMN, fact_schema.CATEGORY_TYPE),
+        ]
+    )
+
+def _json_lines(values: pa.Array) -> pa.Buffer:
+    """Un buffer NDJSON con una línea '{"refs": <lista>}' por valor; los nulos y vacíos quedan 'null'."""
+    text = pc.replace_substring(values, "'", '"')
+    text = pc.if_else(pc.equal(pc.utf8_trim_whitespace(text), ''), pa.scalar(None, pa.string()), text)
+    lines = pc.binary_join_element_wise('{"refs": ', text, '}\n', '', null_handling='replace', null_replacement='null')
+    # Las líneas de un StringArray son contiguas: su buffer de datos ya es el NDJSON completo
+    offsets = np.frombuffer(lines.buffers()[1], dtype=np.int32)[lines.offset:lines.offset + len(lines) + 1]
+    return lines.buffers()[2].slice(int(offsets[0]), int(offsets[-1] - offsets[0]))
+
+def _literal_refs(text: str | None) -> list[dict] | None:
+    if text is None or not text.strip():
+        return None
+    try:
+        items = json.loads(text)
+    except ValueError:
+        items = ast.literal_eval(text)
+    return [
+        {'type': None if item.get('type') is None else str(item['type']), 'id': None if item.get('id') is None else str(item['id'])}
+        for item in items
+    ]
+
+def _parse_refs_by_row(values: pa.Array, column: str) -> pa.ListArray:
+    refs = []
+    invalid = 0
+    for text in values.to_pylist():
+        try:
+            refs.append(_literal_refs(text))
+        except (ValueError, SyntaxError, TypeError, AttributeError):
+            invalid += 1
+            refs.append(None)
+    if invalid:
+        logger.warning(f"{invalid} de {len(values)} valores de '{column}' no son listas de referencias válidas; quedan sin filas hijas.")
+    return pa.array(refs, type=_PARSE_SCHEMA.field('refs').type)
+
+def parse_refs(values: pa.Array | pa.ChunkedArray, column: str = '') -> pa.ListArray:
+    """
+    Parsea una columna de listas de referencias serializadas.
+
+    Returns:
+        pa.ListArray: Una lista de structs {'type', 'id'} por valor (nula si el valor es nulo o vacío).
+    """
+    if isinstance(values, pa.ChunkedArray):
+        values = values.combine_chunks()
+    if not values.type.equals(pa.string()):
+        values = values.cast(pa.string())
+    if len(values) == 0:
+        return pa.array([], type=_PARSE_SCHEMA.field('refs').type)
+    try:
+        parsed = pj.read_json(
+            pa.BufferReader(_json_lines(values)),
+            parse_options=pj.ParseOptions(explicit_schema=_PARSE_SCHEMA, unexpected_field_behavior='ignore'),
+        )
+        if parsed.num_rows == len(values):
+            return parsed['refs'].combine_chunks()
+        logger.warning(f"El parseo en lote de '{column}' devolvió {parsed.num_rows} filas de {len(values)}; se parsea fila por fila.")
+    except pa.ArrowInvalid as e:
+        logger.warning(f"'{column}' no se pudo parsear en lote ({e}); se parsea fila por fila.")
+    return _parse_refs_by_row(values, column)
+
+def explode(table: pa.Table, column: str, child_key: str, carry: list[str]) -> pa.Table:
+    """
+    Una fila por referencia de `column`, con las columnas `carry` de su fila
+    padre, su posición en la lista, su id (en `child_key`, todavía como texto) y su tipo.
+    """
+    refs = parse_refs(table[column], column)
+    lengths = pc.fill_null(pc.list_value_length(refs), 0).to_numpy()
+    parents = np.repeat(np.arange(len(lengths)), lengths)
+    starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    flat = pc.list_flatten(refs)
+
+    arrays = {col: table[col].take(parents) for col in carry}
+    arrays[POSITION_COLUMN] = pa.array(np.arange(len(parents)) - starts, type=pa.int64())
+    arrays[child_key] = flat.field('id')
+    arrays[REF_TYPE_COLUMN] = flat.field('type')
+    return pa.table(arrays)
+
+def extract(table: pa.Table, processor) -> dict[str, pa.Table]:
+    """
+    Arma las tablas hijas que declara el procesador a partir de su salida.
+
+    Si la salida tiene la columna de linaje de los micro-lotes (LINEAGE_COLUMN),
+    cada fila hija conserva la de su fila padre.
+
+    Args:
+        table (pa.Table): Salida del procesador (con OUTPUT_SCHEMA).
+        processor: Procesador con CHILD_FACTS y CHILD_FACT_PARENT_COLUMNS.
+
+    Returns:
+        dict[str, pa.Table]: {tabla hija: tabla con child_schema}, en el orden de CHILD_FACTS.
+    """
+    carry = list(processor.CHILD_FACT_PARENT_COLUMNS)
+    if LINEAGE_COLUMN in table.column_names:
+        carry.append(LINEAGE_COLUMN)
+
+    children = {}
+    with metrics.stage('child_facts', rows_in=table.num_rows) as m:
+        for child_name, (column, child_key) in processor.CHILD_FACTS.items():
+            child = explode(table, column, child_key, carry)
+            children[child_name] = fact_schema.enforce_schema(child, child_schema(processor, child_key), f"fact_{child_name}")
+        m['rows_out'] = sum(child.num_rows for child in children.values())
+    return children
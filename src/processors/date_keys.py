@@ -0,0 +1,74 @@
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import pytz
+
+ARGENTINA_TIMEZONE = 'America/Argentina/Buenos_Aires'
+
+@lru_cache(maxsize=None)
+def get_timezone(name: str = ARGENTINA_TIMEZONE):
+    """Devuelve (y cachea) la zona horaria de pytz para no resolverla en cada llamada."""
+    return pytz.timezone(name)
+
+def to_local_time(values: pd.Series, timezone_name: str = ARGENTINA_TIMEZONE) -> pd.Series:
+    """
+    Convierte una columna de fechas (texto o timestamps) a la hora local indicada.
+
+    Los textos se interpretan como ISO 8601 (con 'T' o espacio, fracciones de
+    segundo opcionales y 'Z' u offset; sin zona se asume UTC) valor por valor,
+    en lugar de inferir un único formato a partir del primero. Los valores
+    inválidos quedan como NaT.
+    """
+    timestamps = pd.to_datetime(values, errors='coerce', utc=True, format='ISO8601')
+    return timestamps.dt.tz_convert(get_timezone(timezone_name))
+
+def compute_date_time_keys(local_timestamps: pd.Series) -> tuple[pd.Series, pd.Series]:
+    """
+    Calcula las claves de fecha (YYYYMMDD) y de hora (minuto del día) con
+    aritmética entera sobre los timestamps, sin formatear texto fila por fila.
+
+    Args:
+        local_timestamps (pd.Series): Timestamps ya convertidos a la zona horaria local.
+
+    Returns:
+        tuple[pd.Series, pd.Series]: (date_key, time_key), ambas 'Int64' con <NA> donde había NaT.
+    """
+    # Hora de pared local (sin zona) truncada al minuto
+    wall_time = local_timestamps.dt.tz_localize(None) if local_timestamps.dt.tz is not None else local_timestamps
+    minutes = wall_time.to_numpy(dtype='datetime64[ns]').astype('datetime64[m]')
+    is_nat = np.isnat(minutes)
+
+    days = minutes.astype('datetime64[D]')
+    months = days.astype('datetime64[M]')
+    years = months.astype('datetime64[Y]')
+
+    with np.errstate(invalid='ignore'):
+        year = years.astype(np.int64) + 1970
+        month = (months - years).astype(np.int64) + 1
+        day = (days - months).astype(np.int64) + 1
+        date_key = year * 10000 + month * 100 + day
+        time_key = (minutes - days).astype(np.int64)
+
+    date_key[is_nat] = 0
+    time_key[is_nat] = 0
+
+    index = local_timestamps.index
+    return (
+        pd.Series(pd.arrays.IntegerArray(date_key, is_nat.copy()), index=index),
+        pd.Series(pd.arrays.IntegerArray(time_key, is_nat.copy()), index=index),
+    )
+
+def add_date_time_keys(df: pd.DataFrame, source_column: str, prefix: str, timezone_name: str = ARGENTINA_TIMEZONE) -> pd.DataFrame:
+    """
+    Convierte una columna de fecha a hora local, agrega '{prefix}_date_key' y
+    '{prefix}_time_key' y elimina la columna original.
+
+    Si la columna no existe, devuelve el DataFrame sin cambios.
+    """
+    if source_column in df.columns:
+        local_timestamps = to_local_time(df[source_column], timezone_name)
+        df[f'{prefix}_date_key'], df[f'{prefix}_time_key'] = compute_date_time_keys(local_timestamps)
+        df = df.drop(columns=[source_column])
+
+    return df
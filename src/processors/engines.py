@@ -0,0 +1,81 @@
+import importlib
+import threading
+
+# --------------------------------------------------------------------------------
+# Motores de ejecución de los procesadores
+#
+# 'pandas' usa el módulo procesador tal cual. 'polars' lo envuelve en
+# polars_engine.PolarsProcessor, que ejecuta la misma lógica sobre Polars
+# (multihilo) con salida idéntica. Polars se importa sólo si se elige ese motor.
+#
+# Con shard_workers > 1, el procesador resultante se envuelve en
+# sharding.ShardedProcessor, que reparte los archivos grandes entre procesos.
+#
+# `lazy` recibe el nombre del módulo procesador y devuelve un LazyProcessor:
+# el módulo (con pandas y pyarrow) y el motor se cargan recién cuando se usa
+# el procesador, de modo que una ejecución sin archivos nuevos no los importa.
+# --------------------------------------------------------------------------------
+ENGINES = ('pandas', 'polars')
+
+def resolve(processor, engine: str = 'pandas', shard_workers: int = 0, shard_min_rows: int = 0):
+    """
+    Devuelve el procesador a usar para el motor indicado.
+
+    Args:
+        processor: Módulo procesador (ej. sales_processor).
+        engine (str): 'pandas' o 'polars'.
+        shard_workers (int): Procesos entre los que se reparte la transformación
+            de un archivo grande (0 o 1 = en el mismo proceso).
+        shard_min_rows (int): Filas a partir de las cuales un archivo se reparte.
+
+    Returns:
+        El módulo procesador o un adaptador con la misma interfaz (`process`,
+        RAW_COLUMN_TYPES, COLUMNS_TO_DELETE).
+    """
+    if shard_workers > 1:
+        if not getattr(processor, 'ROW_LOCAL', False):
+            raise ValueError(f"El procesador '{processor.__name__}' no declara ROW_LOCAL: no se puede transformar por shards.")
+        from src.processors import sharding
+        return sharding.ShardedProcessor(processor, engine, shard_workers, shard_min_rows)
+    if engine == 'pandas':
+        return processor
+    if engine == 'polars':
+        from src.processors import polars_engine
+        return polars_engine.PolarsProcessor(processor)
+    raise ValueError(f"Motor de procesamiento desconocido: '{engine}' (opciones: {', '.join(ENGINES)}).")
+
+class LazyProcessor:
+    """
+    Procesador que importa su módulo y resuelve su motor (ver `resolve`) la
+    primera vez que se accede a alguno de sus atributos.
+
+    `__name__` es el nombre del módulo y está disponible sin importarlo.
+    """
+
+    def __init__(self, module_name: str, engine: str = 'pandas', shard_workers: int = 0, shard_min_rows: int = 0):
+        self.__name__ = module_name
+        self._args = (engine, shard_workers, shard_min_rows)
+        self._processor = None
+        self._lock = threading.Lock()
+
+    def _resolve(self):
+        if self._processor is None:
+            with self._lock:
+                if self._processor is None:
+                    self._processor = resolve(importlib.import_module(self.__name__), *self._args)
+        return self._processor
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self._resolve(), name)
+
+def lazy(module_name: str, engine: str = 'pandas', shard_workers: int = 0, shard_min_rows: int = 0) -> LazyProcessor:
+    """
+    Como `resolve`, pero recibe el nombre del módulo procesador (ej.
+    'src.processors.sales_processor') y no lo importa hasta usarlo. El motor se
+    valida ahora, para que un motor mal configurado falle sin procesar nada.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Motor de procesamiento desconocido: '{engine}' (opciones: {', '.join(ENGINES)}).")
+    return LazyProcessor(module_name, engine, shard_workers, shard_min_rows)
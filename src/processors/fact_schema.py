@@ -0,0 +1,195 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from utils.logger import get_logger
+from utils.microbatch_utils import LINEAGE_COLUMN
+
+logger = get_logger(__name__)
+
+# --------------------------------------------------------------------------------
+# Esquema declarativo de salida de las tablas de hechos
+#
+# Cada procesador declara FACT_SCHEMA ({columna: dtype de pandas}) una sola vez;
+# de ahí sale el esquema de Arrow con el que se escribe el Parquet. El cast se
+# hace en una única pasada columna por columna directamente a Arrow, sin
+# convertir de vuelta a pandas, con el orden de columnas fijado por el esquema.
+# Los valores que no se pueden convertir quedan nulos y se informan en una
+# lista de problemas en lugar de dejar la columna con otro tipo.
+#
+# Las columnas 'category' (textos de baja cardinalidad) se escriben como
+# diccionario de Arrow: cada valor distinto se guarda una vez y cada fila es un
+# índice entero, tanto en memoria como en el Parquet.
+#
+# Las columnas que no están en el esquema (por ejemplo, un campo nuevo de la
+# API) se descartan. El procesador no sabe de qué archivo vienen los datos, así
+# que las anota en los metadatos de la salida (DROPPED_COLUMNS_METADATA_KEY) y
+# el orquestador las quita de ahí y las informa por archivo (pop_dropped_columns).
+# --------------------------------------------------------------------------------
+CATEGORY_TYPE = pa.dictionary(pa.int32(), pa.string())
+
+DROPPED_COLUMNS_METADATA_KEY = b'fact_processing.dropped_columns'
+
+_ARROW_OUTPUT_TYPES = {
+    'int64': pa.int64(),
+    'Int64': pa.int64(),
+    'float64': pa.float64(),
+    'string': pa.string(),
+    'boolean': pa.bool_(),
+    'category': CATEGORY_TYPE,
+}
+
+def arrow_schema(fact_schema: dict) -> pa.Schema:
+    """
+    Convierte un FACT_SCHEMA ({columna: dtype de pandas}) en un esquema de Arrow
+    con el mismo orden de columnas.
+    """
+    unknown = {col: dtype for col, dtype in fact_schema.items() if dtype not in _ARROW_OUTPUT_TYPES}
+    if unknown:
+        raise ValueError(f"Tipos no soportados en el esquema de salida: {unknown}")
+    return pa.schema([pa.field(col, _ARROW_OUTPUT_TYPES[dtype]) for col, dtype in fact_schema.items()])
+
+def _dictionary_encode(values: pa.Array | pa.ChunkedArray, target: pa.DataType) -> pa.Array:
+    """
+    Codifica como diccionario con los valores en orden de aparición, sin
+    categorías sin uso: el resultado no depende de cómo el motor o la
+    concatenación de micro-lotes armó el diccionario de entrada.
+    """
+    if not values.type.equals(target.value_type):
+        values = values.cast(target.value_type)
+    encoded = values.dictionary_encode()
+    if isinstance(encoded, pa.ChunkedArray):
+        encoded = encoded.combine_chunks()
+    return encoded.cast(target)
+
+def unify_dictionaries(table: pa.Table) -> pa.Table:
+    """
+    Vuelve a codificar las columnas de diccionario de una tabla armada por
+    partes (cada una con su propio diccionario) con un único diccionario en
+    orden de aparición, como si se hubiera procesado de una sola vez.
+    """
+    for i, field in enumerate(table.schema):
+        if pa.types.is_dictionary(field.type):
+            table = table.set_column(i, field, _dictionary_encode(table.column(i), field.type))
+    return table
+
+def _coerce(series: pd.Series, target: pa.DataType) -> pa.Array:
+    """Conversión permisiva: los valores que no se pueden representar en `target` quedan nulos."""
+    if pa.types.is_dictionary(target):
+        return _dictionary_encode(pa.array(series.astype('string'), type=pa.string(), from_pandas=True), target)
+    if pa.types.is_string(target):
+        return pa.array(series.astype('string'), type=target, from_pandas=True)
+    if pa.types.is_boolean(target):
+        return pa.array(series.astype('boolean'), type=target, from_pandas=True)
+
+    values = pd.to_numeric(series, errors='coerce')
+    if pa.types.is_integer(target):
+        values = values.astype('float64')
+        # Decimales no enteros o fuera de rango no se truncan: se anulan
+        with np.errstate(invalid='ignore'):
+            values = values.where((values == np.floor(values)) & (values.abs() < 2 ** 63))
+    return pa.array(values, type=target, from_pandas=True)
+
+def _cast_column(values: pd.Series | pa.ChunkedArray, field: pa.Field, issues: list[dict]) -> pa.Array:
+    is_arrow = isinstance(values, pa.ChunkedArray)
+    try:
+        if pa.types.is_dictionary(field.type):
+            return _dictionary_encode(values if is_arrow else pa.Array.from_pandas(values), field.type)
+        if is_arrow:
+            return values.cast(field.type).combine_chunks()
+        return pa.Array.from_pandas(values).cast(field.type)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError) as e:
+        series = values.to_pandas() if is_arrow else values
+        array = _coerce(series, field.type)
+        invalid = int(array.null_count - series.isna().sum())
+        issues.append({
+            'column': field.name,
+            'issue': 'cast_error',
+            'source_dtype': str(values.type if is_arrow else values.dtype),
+            'target_type': str(field.type),
+            'invalid_values': invalid,
+            'error': str(e),
+        })
+        return array
+
+def cast_to_schema(df: pd.DataFrame | pa.Table, schema: pa.Schema) -> tuple[pa.Table, list[dict]]:
+    """
+    Convierte un DataFrame (o una tabla de Arrow de otro motor) en una tabla de
+    Arrow con exactamente las columnas y los tipos de `schema`, en su orden.
+
+    - Columnas del esquema ausentes en el DataFrame: se agregan completamente nulas.
+    - Columnas del DataFrame que no están en el esquema: se descartan y se
+      anotan además en los metadatos de la tabla (ver `pop_dropped_columns`).
+    - Valores que no se pueden convertir: quedan nulos.
+
+    Todo lo anterior se informa en la lista de problemas. La columna de linaje
+    de los micro-lotes (LINEAGE_COLUMN), si está, se conserva al final sin cambios.
+
+    Args:
+        df (pd.DataFrame | pa.Table): Datos ya transformados.
+        schema (pa.Schema): Esquema de salida (ver `arrow_schema`).
+
+    Returns:
+        tuple[pa.Table, list[dict]]: (tabla, problemas encontrados; vacía si no hubo)
+    """
+    columns = df.column_names if isinstance(df, pa.Table) else list(df.columns)
+    issues = []
+    arrays = []
+    for field in schema:
+        if field.name in columns:
+            arrays.append(_cast_column(df[field.name], field, issues))
+        else:
+            issues.append({'column': field.name, 'issue': 'missing_column', 'target_type': str(field.type)})
+            arrays.append(pa.nulls(len(df), field.type))
+
+    unexpected = [col for col in columns if col not in schema.names and col != LINEAGE_COLUMN]
+    if unexpected:
+        issues.append({'columns': unexpected, 'issue': 'unexpected_columns'})
+
+    if LINEAGE_COLUMN in columns:
+        # Se mantiene diccionarizada: una cadena por archivo de origen, no por fila
+        values = df[LINEAGE_COLUMN]
+        lineage = values.combine_chunks() if isinstance(values, pa.ChunkedArray) else pa.Array.from_pandas(values)
+        arrays.append(lineage)
+        schema = schema.append(pa.field(LINEAGE_COLUMN, lineage.type))
+
+    if unexpected:
+        schema = schema.with_metadata({**(schema.metadata or {}), DROPPED_COLUMNS_METADATA_KEY: json.dumps(unexpected).encode()})
+    return pa.Table.from_arrays(arrays, schema=schema), issues
+
+def pop_dropped_columns(table: pa.Table) -> tuple[pa.Table, list[str]]:
+    """
+    Quita de los metadatos de una salida de `cast_to_schema` las columnas que
+    se descartaron por no estar en el esquema.
+
+    Returns:
+        tuple[pa.Table, list[str]]: (tabla sin esa anotación, columnas descartadas; vacía si no hubo)
+    """
+    metadata = dict(table.schema.metadata or {})
+    dropped = metadata.pop(DROPPED_COLUMNS_METADATA_KEY, None)
+    if dropped is None:
+        return table, []
+    return table.replace_schema_metadata(metadata or None), json.loads(dropped)
+
+def enforce_schema(df: pd.DataFrame | pa.Table, schema: pa.Schema, table_name: str) -> pa.Table:
+    """
+    Aplica `cast_to_schema` y registra cada problema como una advertencia con
+    el detalle en JSON. Las columnas descartadas no se registran acá: quedan en
+    los metadatos para informarlas por archivo (ver `pop_dropped_columns`).
+
+    Args:
+        df (pd.DataFrame | pa.Table): Datos ya transformados.
+        schema (pa.Schema): Esquema de salida.
+        table_name (str): Nombre de la tabla para el log (ej. 'fact_sales').
+
+    Returns:
+        pa.Table: Tabla lista para escribir en Parquet.
+    """
+    table, issues = cast_to_schema(df, schema)
+    for issue in issues:
+        if issue['issue'] == 'unexpected_columns':
+            continue
+        logger.warning(f"Esquema de '{table_name}': {json.dumps(issue, ensure_ascii=False)}")
+    return table
@@ -0,0 +1,201 @@
+from functools import lru_cache
+
+import pandas as pd
+import polars as pl
+import pyarrow as pa
+
+from src.processors import date_keys, fact_schema, sales_orders_processor, sales_processor
+from utils import dimension_cache, metrics
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# --------------------------------------------------------------------------------
+# Motor Polars para los procesadores de hechos
+#
+# Reimplementa `process` de cada procesador sobre Polars (columnar y
+# multihilo) reutilizando sus declaraciones de módulo: COLUMNS_TO_DELETE,
+# COLUMN_RENAMES y OUTPUT_SCHEMA. La entrada es la tabla de Arrow del lector de
+# CSV, sin pasar por pandas, y la salida pasa por el mismo
+# fact_schema.enforce_schema que el motor pandas, por lo que el Parquet
+# resultante es idéntico (ver benchmarks/engine_parity.py).
+# --------------------------------------------------------------------------------
+def _to_polars(data: pd.DataFrame | pa.Table) -> pl.DataFrame:
+    if isinstance(data, pa.Table):
+        return pl.from_arrow(data)
+    return pl.from_pandas(data)
+
+def _clean_columns(frame: pl.DataFrame, columns_to_delete: list[str], renames: dict) -> pl.DataFrame:
+    """Descarta y renombra columnas ignorando las que no existen, como `drop(errors='ignore')`."""
+    frame = frame.drop([col for col in columns_to_delete if col in frame.columns])
+    return frame.rename({old: new for old, new in renames.items() if old in frame.columns})
+
+# Formato de la API ('2025-07-26T03:00:00.000Z'): se intenta primero sobre toda la columna
+_API_TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S%.fZ'
+
+# Resto de las variantes ISO 8601 que acepta pd.to_datetime(format='ISO8601'),
+# una vez normalizados el separador 'T' y la 'Z' final (ver _parse_iso8601)
+_ISO8601_FORMATS = [
+    '%Y-%m-%d %H:%M:%S%.f%z',
+    '%Y-%m-%d %H:%M:%S%.f',
+    '%Y-%m-%d %H:%M%z',
+    '%Y-%m-%d %H:%M',
+    '%Y-%m-%d',
+    '%Y%m%dT%H%M%S%z',
+]
+
+def _parse_iso8601(text: pl.Series) -> pl.Series:
+    """
+    Equivalente a pd.to_datetime(errors='coerce', utc=True, format='ISO8601'):
+    cada valor se interpreta con el primer formato que lo acepta; sin zona se
+    asume UTC y los inválidos quedan nulos. Sólo los valores que no tienen el
+    formato de la API pasan por el resto de los formatos.
+    """
+    parsed = text.str.to_datetime(_API_TIMESTAMP_FORMAT, strict=False, time_zone='UTC', time_unit='ns')
+    retry = parsed.is_null() & text.is_not_null()
+    if not retry.any():
+        return parsed
+
+    pending = text.filter(retry).str.strip_chars().str.replace(r'Z$', '+00:00').str.replace(r'^(\d{4}-\d{2}-\d{2})T', '$1 ')
+    fallback = pl.select(pl.coalesce(
+        pending.str.to_datetime(fmt, strict=False, time_zone='UTC', time_unit='ns') for fmt in _ISO8601_FORMATS
+    )).to_series()
+    return parsed.scatter(retry.arg_true(), fallback)
+
+def _date_time_keys(frame: pl.DataFrame, source_column: str, prefix: str, timezone_name: str = date_keys.ARGENTINA_TIMEZONE) -> pl.DataFrame:
+    """
+    Equivalente a date_keys.add_date_time_keys: convierte la columna a la hora
+    local, agrega '{prefix}_date_key' (YYYYMMDD) y '{prefix}_time_key' (minuto
+    del día) y elimina la original. Los valores inválidos quedan nulos.
+    """
+    if source_column not in frame.columns:
+        return frame
+
+    column = frame[source_column]
+    if isinstance(column.dtype, pl.Datetime):
+        timestamps = column.dt.replace_time_zone('UTC') if column.dtype.time_zone is None else column
+    else:
+        timestamps = _parse_iso8601(column.cast(pl.String))
+    local = timestamps.dt.convert_time_zone(timezone_name)
+
+    return frame.with_columns(
+        (local.dt.year().cast(pl.Int64) * 10000 + local.dt.month().cast(pl.Int64) * 100 + local.dt.day().cast(pl.Int64)).alias(f'{prefix}_date_key'),
+        (local.dt.hour().cast(pl.Int64) * 60 + local.dt.minute().cast(pl.Int64)).alias(f'{prefix}_time_key'),
+    ).drop(source_column)
+
+def _normalize_key(column: str, dtype: pl.DataType) -> pl.Expr:
+    """Equivalente a dimension_cache.normalize_key: enteros sin decimales y textos sin espacios."""
+    expr = pl.col(column)
+    if dtype.is_numeric():
+        # Los flotantes no enteros no se pueden normalizar como entero y quedan nulos
+        return expr.cast(pl.Int64, strict=False).cast(pl.String)
+    return expr.cast(pl.String).str.strip_chars()
+
+@lru_cache(maxsize=8)
+def _dimension_frame(index: dimension_cache.DimensionIndex) -> pl.DataFrame:
+    """Entradas de un índice de dimensión como DataFrame de Polars (se arma una vez por índice)."""
+    return pl.from_pandas(index.entries())
+
+# --------------------------------------------------------------------------------
+# fact_sales
+# --------------------------------------------------------------------------------
+_SALE_TYPE_MAPPING = {
+    'EAT-IN': 1,
+    'TAKEAWAY': 2,
+    'DELIVERY': 3
+}
+
+@metrics.timed_step
+def process_sales(data: pd.DataFrame | pa.Table) -> pa.Table:
+    """Equivalente a sales_processor.process sobre Polars."""
+    p = sales_processor
+    frame = _clean_columns(_to_polars(data), p.COLUMNS_TO_DELETE, p.COLUMN_RENAMES)
+    frame = frame.with_columns(pl.lit(1, dtype=pl.Int64).alias('restaurant_key'))
+    frame = _date_time_keys(frame, 'attributes.createdAt', 'start')
+    frame = _date_time_keys(frame, 'attributes.closedAt', 'closed')
+    frame = frame.with_columns(
+        pl.col('sale_type').cast(pl.String).str.to_uppercase()
+        .replace_strict(_SALE_TYPE_MAPPING, default=None, return_dtype=pl.Int64)
+        .alias('sale_type_key')
+    ).drop('sale_type')
+
+    return fact_schema.enforce_schema(frame.rechunk().to_arrow(), p.OUTPUT_SCHEMA, 'fact_sales')
+
+# --------------------------------------------------------------------------------
+# fact_sales_orders
+# --------------------------------------------------------------------------------
+def _join_item_key(frame: pl.DataFrame) -> pl.DataFrame:
+    """Equivalente a sales_orders_processor.update_item_key: join con el índice de dim_items."""
+    try:
+        items_index = dimension_cache.get_dimension_index(*sales_orders_processor.ITEMS_LOOKUP)
+        dimension = _dimension_frame(items_index)
+        key_columns = items_index.key_columns
+        probe_keys = [f'__key_{i}' for i in range(len(key_columns))]
+
+        frame = frame.with_columns(
+            _normalize_key(col, frame.schema[col]).alias(key) for col, key in zip(key_columns, probe_keys)
+        )
+        joined = frame.join(
+            dimension.rename(dict(zip(key_columns, probe_keys))),
+            on=probe_keys, how='left', maintain_order='left',
+        )
+        return joined.drop(probe_keys + key_columns)
+
+    except Exception as e:
+        logger.error(f"❌ ERROR en update_item_key (polars): {e}")
+        logger.info("Retornando DataFrame sin modificar debido al error")
+        return frame
+
+@metrics.timed_step
+def process_sales_orders(data: pd.DataFrame | pa.Table) -> pa.Table:
+    """Equivalente a sales_orders_processor.process sobre Polars."""
+    p = sales_orders_processor
+    frame = _clean_columns(_to_polars(data), p.COLUMNS_TO_DELETE, p.COLUMN_RENAMES)
+    frame = frame.with_columns(
+        pl.lit('Product').alias('item_type'),
+        # Como en pandas con dtypes nulables, 0/0 queda nulo (no NaN); x/0 queda infinito
+        (pl.col('total_price').cast(pl.Float64) / pl.col('quantity_ordered').cast(pl.Float64)).fill_nan(None).alias('unit_price'),
+    )
+    frame = _date_time_keys(frame, 'created_at', 'created')
+    result = _join_item_key(frame).rechunk()
+
+    if 'item_key' in result.columns:
+        missing = result['item_key'].null_count()
+        if missing:
+            logger.warning(f"{missing} de {result.height} registros sin item_key en dim_items.")
+
+    return fact_schema.enforce_schema(result.to_arrow(), p.OUTPUT_SCHEMA, 'fact_sales_orders')
+
+# --------------------------------------------------------------------------------
+# Adaptador con la interfaz de un módulo procesador
+# --------------------------------------------------------------------------------
+_PROCESSES = {
+    sales_processor.__name__: process_sales,
+    sales_orders_processor.__name__: process_sales_orders,
+}
+
+class PolarsProcessor:
+    """
+    Expone la misma interfaz que el módulo procesador que envuelve
+    (`process`, RAW_COLUMN_TYPES, COLUMNS_TO_DELETE, WRITE_PROFILE, CHILD_FACTS,
+    PARTITION_DATE_KEY) pero transforma con Polars.
+    ARROW_INPUT indica al orquestador que lea el CSV como tabla de Arrow.
+    """
+    ARROW_INPUT = True
+
+    def __init__(self, module):
+        if module.__name__ not in _PROCESSES:
+            raise ValueError(f"El procesador '{module.__name__}' no tiene implementación para el motor polars.")
+        self.module = module
+        self.__name__ = f"{module.__name__}[polars]"
+        self.RAW_COLUMN_TYPES = getattr(module, 'RAW_COLUMN_TYPES', None)
+        self.COLUMNS_TO_DELETE = getattr(module, 'COLUMNS_TO_DELETE', None)
+        self.OUTPUT_SCHEMA = module.OUTPUT_SCHEMA
+        self.WRITE_PROFILE = getattr(module, 'WRITE_PROFILE', None)
+        self.CHILD_FACTS = getattr(module, 'CHILD_FACTS', None)
+        self.CHILD_FACT_PARENT_COLUMNS = getattr(module, 'CHILD_FACT_PARENT_COLUMNS', None)
+        self.PARTITION_DATE_KEY = getattr(module, 'PARTITION_DATE_KEY', None)
+        self._process = _PROCESSES[module.__name__]
+
+    def process(self, data: pd.DataFrame | pa.Table) -> pa.Table:
+        return self._process(data)
@@ -1,37 +1,107 @@
 import pandas as pd
-import pytz
-from utils import gcp_utils
-
+import pyarrow as pa
+from src.processors import date_keys, fact_schema
+from utils import dimension_cache, metrics
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# --------------------------------------------------------------------------------
+# Esquema declarativo de la tabla de hechos
+# --------------------------------------------------------------------------------
+COLUMNS_TO_DELETE = [
+    'type', 'relationships.product.data.type', 
+    'relationships.priceList.data', 'relationships.priceList.data.type',
+    'relationships.sale.data.type'
+]
+
+COLUMN_RENAMES = {
+    'id': 'order_key',
+    'attributes.canceled': 'canceled',
+    'attributes.cancellationComment': 'cancellation_comment',
+    'attributes.comment': 'comments',
+    'attributes.createdAt': 'created_at',
+    'attributes.price': 'total_price',
+    'attributes.quantity': 'quantity_ordered',
+    'attributes.status': 'status',
+    'attributes.paid': 'paid',
+    'relationships.product.data.id': 'original_key',
+    'relationships.subitems.data': 'subitems_data',
+    'relationships.priceList.data.id': 'price_list_key',
+    'relationships.sale.data.id': 'sales_key'
+}
+
+# 'Int64' (con I mayúscula) soporta nulos; 'category' es texto de baja cardinalidad (diccionario)
+FACT_SCHEMA = {
+    'order_key': 'int64',
+    'canceled': 'category',
+    'cancellation_comment': 'string',
+    'comments': 'string',
+    'total_price': 'float64',
+    'quantity_ordered': 'Int64',
+    'status': 'category',
+    'paid': 'category',
+    'item_key': 'Int64',
+    'subitems_data': 'string',
+    'sales_key': 'Int64',
+    'unit_price': 'float64',
+    'created_date_key': 'Int64',
+    'created_time_key': 'Int64',
+    'price_list_key': 'Int64',
+}
+
+# Esquema de Arrow del Parquet de salida (orden y tipos de FACT_SCHEMA)
+OUTPUT_SCHEMA = fact_schema.arrow_schema(FACT_SCHEMA)
+
+# Perfil de escritura del Parquet (ver utils.parquet_profiles): filas ordenadas
+# por fecha, venta y orden para que las estadísticas de cada row group sean
+# selectivas, diccionario sólo en columnas de baja cardinalidad y deltas para las claves
+WRITE_PROFILE = {
+    'sort_by': ['created_date_key', 'sales_key', 'order_key'],
+    'use_dictionary': [
+        'canceled', 'cancellation_comment', 'comments', 'quantity_ordered', 'status', 'paid',
+        'item_key', 'subitems_data', 'created_date_key', 'price_list_key',
+    ],
+    'column_encoding': {'order_key': 'DELTA_BINARY_PACKED', 'sales_key': 'DELTA_BINARY_PACKED'},
+}
+
+# Fecha de negocio (YYYYMMDD, hora argentina) que define la partición de cada
+# fila con PARTITION_BY_BUSINESS_DATE: la de creación de la orden
+PARTITION_DATE_KEY = 'created_date_key'
+
+# Relaciones embebidas que se normalizan como tablas de hechos hijas con
+# CHILD_FACTS_ENABLED (ver child_facts): {tabla hija: (columna, clave hija)}.
+# Cada fila hija lleva la orden, su venta y su fecha.
+CHILD_FACTS = {
+    'sales_order_subitems': ('subitems_data', 'subitem_key'),
+}
+CHILD_FACT_PARENT_COLUMNS = ['order_key', 'sales_key', 'created_date_key']
+
+# Transforma cada fila sin mirar las demás: se puede aplicar por shards (ver sharding)
+ROW_LOCAL = True
+
+# Búsquedas en dimensiones: (dimensión, columnas clave, columna de valor)
+ITEMS_LOOKUP = ('items', ['item_type', 'original_key'], 'item_key')
+DIMENSION_LOOKUPS = [ITEMS_LOOKUP]
+
+# Tipos con los que se leen las columnas crudas: las renombradas heredan el tipo
+# final de FACT_SCHEMA; el resto se declara explícitamente.
+RAW_COLUMN_TYPES = {
+    **{raw: FACT_SCHEMA[new] for raw, new in COLUMN_RENAMES.items() if new in FACT_SCHEMA},
+    'attributes.createdAt': 'string',
+    'relationships.product.data.id': 'string',
+}
+
+@metrics.timed_step
 def _clean_data(df: pd.DataFrame) -> pd.DataFrame:
     """
     Removes and renames columns, adds unit_price.
 
     """
     
-    columns_to_delete = [
-        'type', 'relationships.product.data.type', 
-        'relationships.priceList.data', 'relationships.priceList.data.type',
-        'relationships.sale.data.type'
-    ]
-    df = df.drop(columns=columns_to_delete, errors='ignore')
-
-    new_column_names = {
-        'id': 'order_key',
-        'attributes.canceled': 'canceled',
-        'attributes.cancellationComment': 'cancellation_comment',
-        'attributes.comment': 'comments',
-        'attributes.createdAt': 'created_at',
-        'attributes.price': 'total_price',
-        'attributes.quantity': 'quantity_ordered',
-        'attributes.status': 'status',
-        'attributes.paid': 'paid',
-        'relationships.product.data.id': 'original_key',
-        'relationships.subitems.data': 'subitems_data',
-        'relationships.priceList.data.id': 'price_list_key',
-        'relationships.sale.data.id': 'sales_key'
-    }
-
-    df = df.rename(columns=new_column_names)
+    df = df.drop(columns=COLUMNS_TO_DELETE, errors='ignore')
+
+    df = df.rename(columns=COLUMN_RENAMES)
 
     df['item_type'] = 'Product'
 
@@ -39,109 +109,56 @@ def _clean_data(df: pd.DataFrame) -> pd.DataFrame:
 
     return df
 
+@metrics.timed_step
 def _process_date(df: pd.DataFrame, source_column: str, prefix: str) -> pd.DataFrame:
     """
-    Converts a datetime column to local timezone and extracts date/time keys.
+    Converts a datetime column to local timezone and extracts date/time keys
+    using the shared vectorized implementation in date_keys.
 
     """
-    if source_column in df.columns:
-        df[source_column] = pd.to_datetime(df[source_column], errors='coerce', utc=True)
-        argentina_timezone = pytz.timezone('America/Argentina/Buenos_Aires')
-        df[source_column] = df[source_column].dt.tz_convert(argentina_timezone)
-
-        df[f'{prefix}_date_key'] = df[source_column].dt.strftime('%Y%m%d').astype('Int64')
-        df[f'{prefix}_time_key'] = (df[source_column].dt.hour * 60 + df[source_column].dt.minute).astype('Int64')
-
-        df = df.drop(columns=[source_column])
-    
-    return df
+    return date_keys.add_date_time_keys(df, source_column, prefix)
 
+@metrics.timed_step
 def update_item_key(df: pd.DataFrame) -> pd.DataFrame:
-    
-    from utils.logger import get_logger
-    logger = get_logger(__name__)
-    
+    """
+    Reemplaza (item_type, original_key) por el 'item_key' de la dimensión dim_items.
+
+    Usa el índice cacheado del snapshot más reciente de dim_items, por lo que la
+    dimensión se descarga una vez por ejecución y no una vez por archivo.
+    """
     try:
-        # Debug: Ver qué columnas tiene el DataFrame de sales_orders
-        logger.info(f"=== DEBUG: Columnas disponibles en sales_orders: {list(df.columns)} ===")
-        
-        # HARDCODED: Usar el archivo específico que mencionaste
-        file_to_read = "gs://data-warehouse-resto/clean/dim_items/date=2025-07-26/dim_items.parquet"
-        logger.info(f"=== MODO HARDCODED: Intentando leer {file_to_read} ===")
-        
-        df_items = gcp_utils.read_parquet_from_gcs(file_to_read)
-        logger.info(f"✅ Archivo leído exitosamente! {len(df_items)} registros")
-        
-        # Seleccionar solo las columnas necesarias para el merge
-        df_items_subset = df_items[['item_type', 'item_key', 'original_key']].copy()
-        
-        # Realizar el merge con las columnas correctas
-        logger.info("=== DEBUG: Intentando merge con item_type y original_key ===")
-        df_sales_orders = pd.merge(
-            df,
-            df_items_subset,
-            on=['item_type', 'original_key'],
-            how='left'
-        )
-        
-        # Limpiar columnas temporales
-        df_sales_orders = df_sales_orders.drop(columns=['item_type', 'original_key'])
-        
-        logger.info(f"✅ Merge completado! DataFrame resultante tiene {len(df_sales_orders)} registros")
-        return df_sales_orders
-        
+        items_index = dimension_cache.get_dimension_index(*ITEMS_LOOKUP)
+        df['item_key'] = items_index.lookup(df['item_type'], df['original_key'])
+
+        missing = int(df['item_key'].isna().sum())
+        if missing:
+            logger.warning(f"{missing} de {len(df)} registros sin item_key en dim_items.")
+
+        return df.drop(columns=['item_type', 'original_key'])
+
     except Exception as e:
         logger.error(f"❌ ERROR en update_item_key: {e}")
         logger.info("Retornando DataFrame sin modificar debido al error")
         return df
 
-def enforce_fact_sales_schema(df: pd.DataFrame) -> pd.DataFrame:
+@metrics.timed_step
+def enforce_fact_sales_schema(df: pd.DataFrame) -> pa.Table:
     """
-    Aplica el esquema de tipos de datos correcto a un DataFrame de ventas.
+    Convierte el DataFrame transformado en una tabla de Arrow con OUTPUT_SCHEMA:
+    las columnas de FACT_SCHEMA, en ese orden y con sus tipos, en una sola pasada.
 
-    Maneja correctamente los valores nulos para enteros y convierte
-    la columna de fecha a un tipo de dato de fecha nativo.
+    Los valores que no se pueden convertir quedan nulos y se informan en el log
+    (ver fact_schema.cast_to_schema).
 
     Args:
         df: El DataFrame de pandas de entrada.
 
     Returns:
-        Un nuevo DataFrame con los tipos de datos corregidos.
+        pa.Table: La tabla lista para escribir en Parquet.
     """
-    # 'Int64' (con I mayúscula) soporta nulos
-    schema_types = {
-        'order_key': 'int64',
-        'canceled': 'string',
-        'cancellation_comment': 'string',
-        'comments': 'string',
-        'total_price': 'float64',
-        'quantity_ordered': 'Int64',
-        'status': 'string',
-        'paid': 'string',
-        'item_key': 'Int64',
-        'subitems_data': 'string',
-        'sales_key': 'Int64',
-        'unit_price': 'float64',
-        'created_date_key': 'Int64',
-        'created_time_key': 'Int64',
-    }
-    
-    # Itera sobre el diccionario y aplica los tipos de forma segura
-    for col, dtype in schema_types.items():
-        if col in df.columns:
-            try:
-                df[col] = df[col].astype(dtype)
-            except (ValueError, TypeError) as e:
-                print(f"No se pudo convertir la columna '{col}' a {dtype}. Error: {e}")
-
-    # Maneja la columna de fecha de forma especial para asegurar la conversión
-    if 'date' in df.columns:
-        # errors='coerce' convierte fechas inválidas en NaT (Not a Time)
-        df['date'] = pd.to_datetime(df['date'], errors='coerce').dt.date
-
-    return df
+    return fact_schema.enforce_schema(df, OUTPUT_SCHEMA, 'fact_sales_orders')
 
-def process(df: pd.DataFrame) -> pd.DataFrame:
+def process(df: pd.DataFrame) -> pa.Table:
     """
     Punto de entrada principal para procesar el DataFrame de fact_sales.
     Esta es la función que será llamada por el orquestador (main.py).
@@ -150,7 +167,7 @@ def process(df: pd.DataFrame) -> pd.DataFrame:
         df (pd.DataFrame): El DataFrame crudo leído desde GCS.
 
     Returns:
-        pd.DataFrame: El DataFrame limpio y procesado.
+        pa.Table: La tabla limpia y procesada, con el esquema OUTPUT_SCHEMA.
     """
     df_clean = _clean_data(df)
     df_final = _process_date(df_clean, 'created_at', 'created')
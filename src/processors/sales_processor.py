@@ -1,6 +1,103 @@
 import pandas as pd
-import pytz
-
+import pyarrow as pa
+from src.processors import date_keys, fact_schema
+from utils import metrics
+
+# --------------------------------------------------------------------------------
+# Esquema declarativo de la tabla de hechos
+# --------------------------------------------------------------------------------
+COLUMNS_TO_DELETE = [
+    'type', 
+    'attributes.customerName',
+    'attributes.anonymousCustomer', 'attributes.anonymousCustomer.name',
+    'attributes.expectedPayments',
+    'relationships.customer.data', 'relationships.items.data',
+    'relationships.payments.data', 
+    'relationships.table.data', 'relationships.table.data.type',
+    'relationships.waiter.data', 'relationships.waiter.data.type', 
+    'relationships.saleIdentifier.data', 'relationships.table.data',
+    'relationships.customer.data.type', 'attributes.customerName'
+]
+
+COLUMN_RENAMES = {
+    'id': 'sales_key',
+    'attributes.comment': 'comments',
+    'attributes.people': 'party_size',
+    'attributes.total': 'total_sale',
+    'attributes.saleType': 'sale_type',
+    'attributes.saleState': 'sale_state',
+    'relationships.discounts.data': 'discounts_data',
+    'relationships.tips.data': 'tips_data',
+    'relationships.shippingCosts.data': 'shipping_costs_data',
+    'relationships.table.data.id': 'table_key',
+    'relationships.waiter.data.id': 'employee_key',
+    'relationships.customer.data.id': 'customer_key'
+}
+
+# 'Int64' (con I mayúscula) soporta nulos; 'category' es texto de baja cardinalidad (diccionario)
+FACT_SCHEMA = {
+    'sales_key': 'int64',
+    'comments': 'string',
+    'party_size': 'Int64',
+    'total_sale': 'float64',
+    'sale_type_key': 'Int64',
+    'sale_state': 'category',
+    'discounts_data': 'string',
+    'tips_data': 'string',
+    'shipping_costs_data': 'string',
+    'table_key': 'Int64',
+    'employee_key': 'Int64',
+    'customer_key': 'Int64',
+    'restaurant_key': 'Int64',
+    'start_date_key': 'Int64',
+    'start_time_key': 'Int64',
+    'closed_date_key': 'Int64',
+    'closed_time_key': 'Int64',
+}
+
+# Esquema de Arrow del Parquet de salida (orden y tipos de FACT_SCHEMA)
+OUTPUT_SCHEMA = fact_schema.arrow_schema(FACT_SCHEMA)
+
+# Perfil de escritura del Parquet (ver utils.parquet_profiles): filas ordenadas
+# por fecha y venta para que las estadísticas de cada row group sean selectivas,
+# diccionario sólo en columnas de baja cardinalidad y deltas para la clave
+WRITE_PROFILE = {
+    'sort_by': ['start_date_key', 'sales_key'],
+    'use_dictionary': [
+        'comments', 'party_size', 'sale_type_key', 'sale_state', 'discounts_data', 'tips_data',
+        'shipping_costs_data', 'table_key', 'employee_key', 'customer_key', 'restaurant_key',
+        'start_date_key', 'closed_date_key',
+    ],
+    'column_encoding': {'sales_key': 'DELTA_BINARY_PACKED'},
+}
+
+# Fecha de negocio (YYYYMMDD, hora argentina) que define la partición de cada
+# fila con PARTITION_BY_BUSINESS_DATE: la de apertura de la venta
+PARTITION_DATE_KEY = 'start_date_key'
+
+# Relaciones embebidas que se normalizan como tablas de hechos hijas con
+# CHILD_FACTS_ENABLED (ver child_facts): {tabla hija: (columna, clave hija)}.
+# Cada fila hija lleva la venta y su fecha, para filtrar y unir sin leer fact_sales.
+CHILD_FACTS = {
+    'sales_discounts': ('discounts_data', 'discount_key'),
+    'sales_tips': ('tips_data', 'tip_key'),
+    'sales_shipping_costs': ('shipping_costs_data', 'shipping_cost_key'),
+}
+CHILD_FACT_PARENT_COLUMNS = ['sales_key', 'start_date_key']
+
+# Transforma cada fila sin mirar las demás: se puede aplicar por shards (ver sharding)
+ROW_LOCAL = True
+
+# Tipos con los que se leen las columnas crudas: las renombradas heredan el tipo
+# final de FACT_SCHEMA; el resto se declara explícitamente.
+RAW_COLUMN_TYPES = {
+    **{raw: FACT_SCHEMA[new] for raw, new in COLUMN_RENAMES.items() if new in FACT_SCHEMA},
+    'attributes.saleType': 'string',
+    'attributes.createdAt': 'string',
+    'attributes.closedAt': 'string',
+}
+
+@metrics.timed_step
 def _clean_data(df: pd.DataFrame) -> pd.DataFrame:
     """
     Removes in-course tables, removes and renames columns, adds restaurant_key.
@@ -8,56 +105,23 @@ def _clean_data(df: pd.DataFrame) -> pd.DataFrame:
     """
     #df = df[(df['attributes.saleState'] != 'IN-COURSE') & (df['attributes.saleState'] != 'PENDING')]
     
-    columns_to_delete = [
-        'type', 
-        'attributes.customerName',
-        'attributes.anonymousCustomer', 'attributes.anonymousCustomer.name',
-        'attributes.expectedPayments',
-        'relationships.customer.data', 'relationships.items.data',
-        'relationships.payments.data', 
-        'relationships.table.data', 'relationships.table.data.type',
-        'relationships.waiter.data', 'relationships.waiter.data.type', 
-        'relationships.saleIdentifier.data', 'relationships.table.data',
-        'relationships.customer.data.type', 'attributes.customerName'
-    ]
-    df = df.drop(columns=columns_to_delete, errors='ignore')
-
-    new_column_names = {
-        'id': 'sales_key',
-        'attributes.comment': 'comments',
-        'attributes.people': 'party_size',
-        'attributes.total': 'total_sale',
-        'attributes.saleType': 'sale_type',
-        'attributes.saleState': 'sale_state',
-        'relationships.discounts.data': 'discounts_data',
-        'relationships.tips.data': 'tips_data',
-        'relationships.shippingCosts.data': 'shipping_costs_data',
-        'relationships.table.data.id': 'table_key',
-        'relationships.waiter.data.id': 'employee_key',
-        'relationships.customer.data.id': 'customer_key'
-    }
-    df = df.rename(columns=new_column_names)
+    df = df.drop(columns=COLUMNS_TO_DELETE, errors='ignore')
+
+    df = df.rename(columns=COLUMN_RENAMES)
 
     df['restaurant_key'] = 1
     return df
 
+@metrics.timed_step
 def _process_date(df: pd.DataFrame, source_column: str, prefix: str) -> pd.DataFrame:
     """
-    Converts a datetime column to local timezone and extracts date/time keys.
+    Converts a datetime column to local timezone and extracts date/time keys
+    using the shared vectorized implementation in date_keys.
     (Función auxiliar 'privada' para este módulo)
     """
-    if source_column in df.columns:
-        df[source_column] = pd.to_datetime(df[source_column], errors='coerce', utc=True)
-        argentina_timezone = pytz.timezone('America/Argentina/Buenos_Aires')
-        df[source_column] = df[source_column].dt.tz_convert(argentina_timezone)
-
-        df[f'{prefix}_date_key'] = df[source_column].dt.strftime('%Y%m%d').astype('Int64')
-        df[f'{prefix}_time_key'] = (df[source_column].dt.hour * 60 + df[source_column].dt.minute).astype('Int64')
-
-        df = df.drop(columns=[source_column])
-    
-    return df
+    return date_keys.add_date_time_keys(df, source_column, prefix)
 
+@metrics.timed_step
 def transform_sale_type(df: pd.DataFrame) -> pd.DataFrame:
     """
     Transforma la columna 'sale_type' de un DataFrame, mapeando los valores
@@ -84,56 +148,24 @@ def transform_sale_type(df: pd.DataFrame) -> pd.DataFrame:
 
     return df
 
-def enforce_fact_sales_schema(df: pd.DataFrame) -> pd.DataFrame:
+@metrics.timed_step
+def enforce_fact_sales_schema(df: pd.DataFrame) -> pa.Table:
     """
-    Aplica el esquema de tipos de datos correcto a un DataFrame de ventas.
+    Convierte el DataFrame transformado en una tabla de Arrow con OUTPUT_SCHEMA:
+    las columnas de FACT_SCHEMA, en ese orden y con sus tipos, en una sola pasada.
 
-    Maneja correctamente los valores nulos para enteros y convierte
-    la columna de fecha a un tipo de dato de fecha nativo.
+    Los valores que no se pueden convertir quedan nulos y se informan en el log
+    (ver fact_schema.cast_to_schema).
 
     Args:
         df: El DataFrame de pandas de entrada.
 
     Returns:
-        Un nuevo DataFrame con los tipos de datos corregidos.
+        pa.Table: La tabla lista para escribir en Parquet.
     """
-    # 'Int64' (con I mayúscula) soporta nulos
-    schema_types = {
-        'sales_key': 'int64',
-        'comments': 'string',
-        'party_size': 'Int64',
-        'total_sale': 'float64',
-        'sale_type_key': 'Int64',
-        'sale_state': 'string',
-        'discounts_data': 'string',
-        'tips_data': 'string',
-        'shipping_costs_data': 'string',
-        'table_key': 'Int64',
-        'employee_key': 'Int64',
-        'customer_key': 'Int64',
-        'restaurant_key': 'Int64',
-        'start_date_key': 'Int64',
-        'start_time_key': 'Int64',
-        'closed_date_key': 'Int64',
-        'closed_time_key': 'Int64',
-    }
-    
-    # Itera sobre el diccionario y aplica los tipos de forma segura
-    for col, dtype in schema_types.items():
-        if col in df.columns:
-            try:
-                df[col] = df[col].astype(dtype)
-            except (ValueError, TypeError) as e:
-                print(f"No se pudo convertir la columna '{col}' a {dtype}. Error: {e}")
-
-    # Maneja la columna de fecha de forma especial para asegurar la conversión
-    if 'date' in df.columns:
-        # errors='coerce' convierte fechas inválidas en NaT (Not a Time)
-        df['date'] = pd.to_datetime(df['date'], errors='coerce').dt.date
-
-    return df
+    return fact_schema.enforce_schema(df, OUTPUT_SCHEMA, 'fact_sales')
 
-def process(df: pd.DataFrame) -> pd.DataFrame:
+def process(df: pd.DataFrame) -> pa.Table:
     """
     Punto de entrada principal para procesar el DataFrame de fact_sales.
     Esta es la función que será llamada por el orquestador (main.py).
@@ -142,7 +174,7 @@ def process(df: pd.DataFrame) -> pd.DataFrame:
         df (pd.DataFrame): El DataFrame crudo leído desde GCS.
 
     Returns:
-        pd.DataFrame: El DataFrame limpio y procesado.
+        pa.Table: La tabla limpia y procesada, con el esquema OUTPUT_SCHEMA.
     """
     df_clean = _clean_data(df)
     df_with_dates = _process_date(df_clean, 'attributes.createdAt', 'start')
@@ -0,0 +1,176 @@
+import importlib
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import repeat
+
+import pandas as pd
+import pyarrow as pa
+
+from src.processors import fact_schema
+from utils import dimension_cache
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# --------------------------------------------------------------------------------
+# Transformación de un archivo grande repartida en varios procesos
+#
+# Un CSV grande (cierre de mes, reprocesos) se transforma en un solo núcleo
+# aunque haya varios archivos en paralelo. Los procesadores que declaran
+# ROW_LOCAL = True transforman cada fila sin mirar las demás, por lo que su
+# `process` se puede aplicar por partes: los datos crudos se cortan en shards
+# de filas contiguas, cada shard se transforma en un proceso de un pool
+# compartido y las salidas se concatenan en el orden original. Las columnas de
+# diccionario se vuelven a codificar sobre la tabla completa, de modo que el
+# Parquet es idéntico al de la transformación en un solo proceso (ver
+# benchmarks/sharded_transform.py).
+#
+# Los índices de las dimensiones que usa cada procesador (DIMENSION_LOOKUPS) se
+# resuelven en el proceso principal con utils.dimension_cache y se envían una
+# sola vez a cada proceso del pool, al crearlo. Si el índice cambia (snapshot
+# nuevo de la dimensión), el pool se reemplaza. Las tablas de Arrow viajan en
+# formato IPC, que sólo copia las filas del shard.
+#
+# Los procesos se crean con 'spawn': el orquestador tiene hilos en ejecución y
+# hacer fork con hilos activos puede dejar locks tomados en los hijos.
+#
+# Repartir cuesta serializar cada shard, transferirlo y volver a codificar los
+# diccionarios; sólo compensa con archivos grandes y con CPUs libres. Nunca se
+# usan más procesos que CPUs disponibles, y con una sola CPU no se reparte.
+# El pool lo detiene main.run_all_tasks al terminar (shutdown_pool).
+# --------------------------------------------------------------------------------
+_pool = None
+_pool_key = None
+_pool_lock = threading.Lock()
+_lookups = set()  # {(dimensión, columnas clave, columna de valor)} de los procesadores registrados
+
+_worker_processors = {}
+
+def available_cpus() -> int:
+    """CPUs que puede usar este proceso (respeta la afinidad y los límites del contenedor, si el sistema los expone)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def _init_worker(indexes: list[tuple[str, dimension_cache.DimensionIndex]]):
+    """Registra en el proceso del pool los índices de dimensiones enviados por el principal."""
+    for dimension_name, index in indexes:
+        dimension_cache.register_index(dimension_name, index)
+
+def _to_ipc(table: pa.Table) -> pa.Buffer:
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+def _process_shard(module_name: str, engine: str, shard: pd.DataFrame | pa.Buffer) -> pa.Table:
+    """Transforma un shard en un proceso del pool con el procesador del módulo y motor indicados."""
+    processor = _worker_processors.get((module_name, engine))
+    if processor is None:
+        from src.processors import engines
+        processor = engines.resolve(importlib.import_module(module_name), engine)
+        _worker_processors[(module_name, engine)] = processor
+    if isinstance(shard, pa.Buffer):
+        shard = pa.ipc.open_stream(shard).read_all()
+    return processor.process(shard)
+
+def _broadcast_indexes() -> list[tuple[str, dimension_cache.DimensionIndex]]:
+    """Índices de todas las dimensiones de los procesadores registrados."""
+    indexes = []
+    for dimension_name, key_columns, value_column in sorted(_lookups):
+        try:
+            indexes.append((dimension_name, dimension_cache.get_dimension_index(dimension_name, list(key_columns), value_column)))
+        except Exception as e:
+            # Cada proceso intentará resolverla por su cuenta, con el mismo manejo de errores del procesador
+            logger.warning(f"No se pudo cargar la dimensión '{dimension_name}' para enviarla al pool: {e}")
+    return indexes
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    """Pool compartido; se recrea si cambia la cantidad de procesos o algún índice de dimensión."""
+    global _pool, _pool_key
+    with _pool_lock:
+        indexes = _broadcast_indexes()
+        key = (workers, tuple((dimension_name, id(index)) for dimension_name, index in indexes))
+        if _pool is None or _pool_key != key:
+            if _pool is not None:
+                # Los shards ya enviados al pool anterior terminan igual
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker, initargs=(indexes,),
+            )
+            _pool_key = key
+            logger.info(f"Pool de transformación por shards iniciado: {workers} procesos, {len(indexes)} dimensiones enviadas.")
+        return _pool
+
+def _discard_pool(pool: ProcessPoolExecutor):
+    """Descarta un pool roto (un proceso terminó de forma abrupta) para que el próximo uso cree otro."""
+    global _pool, _pool_key
+    with _pool_lock:
+        if _pool is pool:
+            _pool, _pool_key = None, None
+    pool.shutdown(wait=False)
+
+def shutdown_pool():
+    """Detiene el pool de procesos, si existe."""
+    global _pool, _pool_key
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+        _pool, _pool_key = None, None
+
+def split_rows(data: pd.DataFrame | pa.Table, shards: int) -> list[pd.DataFrame | pa.Table]:
+    """Corta los datos en `shards` partes de filas contiguas de tamaño parejo, en orden."""
+    rows = len(data)
+    bounds = [rows * i // shards for i in range(shards + 1)]
+    if isinstance(data, pa.Table):
+        return [data.slice(start, stop - start) for start, stop in zip(bounds, bounds[1:])]
+    return [data.iloc[start:stop] for start, stop in zip(bounds, bounds[1:])]
+
+class ShardedProcessor:
+    """
+    Expone la misma interfaz que el procesador que envuelve (`process`,
+    RAW_COLUMN_TYPES, COLUMNS_TO_DELETE, OUTPUT_SCHEMA, WRITE_PROFILE,
+    CHILD_FACTS, PARTITION_DATE_KEY, ARROW_INPUT) pero reparte la transformación de los datos de al menos
+    `min_rows` filas entre `workers` procesos.
+    """
+
+    def __init__(self, module, engine: str, workers: int, min_rows: int):
+        from src.processors import engines
+        self.module = module
+        self.engine = engine
+        self.workers = min(workers, available_cpus())
+        self.min_rows = min_rows
+        self.inner = engines.resolve(module, engine)
+        self.__name__ = f"{self.inner.__name__}[{self.workers} procesos]"
+        if self.workers < workers:
+            logger.warning(f"SHARD_WORKERS={workers} pero hay {available_cpus()} CPUs disponibles: '{module.__name__}' se reparte en {self.workers} procesos" + (" (no se reparte)." if self.workers < 2 else "."))
+        self.RAW_COLUMN_TYPES = getattr(self.inner, 'RAW_COLUMN_TYPES', None)
+        self.COLUMNS_TO_DELETE = getattr(self.inner, 'COLUMNS_TO_DELETE', None)
+        self.OUTPUT_SCHEMA = self.inner.OUTPUT_SCHEMA
+        self.WRITE_PROFILE = getattr(self.inner, 'WRITE_PROFILE', None)
+        self.CHILD_FACTS = getattr(self.inner, 'CHILD_FACTS', None)
+        self.CHILD_FACT_PARENT_COLUMNS = getattr(self.inner, 'CHILD_FACT_PARENT_COLUMNS', None)
+        self.PARTITION_DATE_KEY = getattr(self.inner, 'PARTITION_DATE_KEY', None)
+        self.ARROW_INPUT = getattr(self.inner, 'ARROW_INPUT', False)
+        with _pool_lock:
+            _lookups.update((name, tuple(keys), value) for name, keys, value in getattr(module, 'DIMENSION_LOOKUPS', []))
+
+    def process(self, data: pd.DataFrame | pa.Table) -> pa.Table:
+        if len(data) < max(self.min_rows, 2) or self.workers < 2:
+            return self.inner.process(data)
+
+        shards = split_rows(data, self.workers)
+        payloads = [_to_ipc(shard) if isinstance(shard, pa.Table) else shard for shard in shards]
+        del shards
+        pool = _get_pool(self.workers)
+        try:
+            outputs = list(pool.map(_process_shard, repeat(self.module.__name__), repeat(self.engine), payloads))
+        except BrokenProcessPool:
+            _discard_pool(pool)
+            raise
+        return fact_schema.unify_dictionaries(pa.concat_tables(outputs)).combine_chunks()
@@ -0,0 +1,49 @@
+import os
+
+import pytest
+
+from utils import env_config, storage
+
+# --------------------------------------------------------------------------------
+# Fixtures compartidas
+#
+# Las pruebas corren sobre LocalBackend en un directorio temporal. La
+# configuración se construye una sola vez por proceso (ver utils.env_config),
+# así que `configure` la descarta para que se vuelva a leer con las variables
+# de entorno de cada prueba.
+# --------------------------------------------------------------------------------
+@pytest.fixture
+def configure(monkeypatch):
+    """Fija variables de entorno y hace que la configuración se vuelva a leer."""
+    def _configure(**env):
+        for name, value in env.items():
+            monkeypatch.setenv(name, str(value))
+        env_config.config._config = None
+
+    # ENV distinto de 'local' evita cargar un .env del directorio de trabajo
+    _configure(ENV='test', RUN_REPORT_PREFIX='', LOG_LEVEL='WARNING')
+    yield _configure
+    env_config.config._config = None
+
+@pytest.fixture
+def storage_root(tmp_path, configure) -> str:
+    """Raíz de almacenamiento local vacía, configurada como STORAGE_ROOT."""
+    configure(STORAGE_ROOT=tmp_path)
+    return str(tmp_path)
+
+@pytest.fixture
+def write_object(storage_root):
+    """Escribe un archivo bajo la raíz de la prueba y devuelve su objeto del listado."""
+    def _write(key: str, content: str) -> dict:
+        backend = storage.get_backend(storage_root)
+        path = os.path.join(storage_root, key)
+        previous = backend.stat(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+        if previous is not None and backend.stat(key)['generation'] <= previous['generation']:
+            # Dos escrituras seguidas pueden caer en el mismo tick del reloj: una reescritura siempre cambia la generación
+            generation = previous['generation'] + 1_000_000
+            os.utime(path, ns=(generation, generation))
+        return {'path': backend.uri(key), 'key': key, 'md5': None, **backend.stat(key)}
+    return _write
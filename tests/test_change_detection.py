@@ -0,0 +1,131 @@
+from datetime import datetime, timedelta
+
+import pytz
+
+from utils import change_detection, manifest_utils
+
+MANIFEST_PREFIX = 'logs/manifest/fact_test/'
+
+def _register(objects: list[dict], storage_root: str) -> dict[str, dict]:
+    """Registra los objetos en el manifiesto como lo hace el pipeline y devuelve las entradas."""
+    sources = {obj['path']: obj for obj in objects}
+    manifest_utils.append_entries(list(sources), MANIFEST_PREFIX, storage_root, sources)
+    return manifest_utils.load_manifest_entries(MANIFEST_PREFIX, storage_root)
+
+def _paths(objects: list[dict]) -> list[str]:
+    return sorted(obj['path'] for obj in objects)
+
+def test_new_files_are_processed(storage_root, write_object):
+    a = write_object('raw/fact_test/date=2025-01-02/a.csv', 'x\n1\n')
+    b = write_object('raw/fact_test/date=2025-01-02/b.csv', 'x\n2\n')
+
+    to_process, changed, record_only = change_detection.classify([a, b], {}, storage_root)
+
+    assert _paths(to_process) == _paths([a, b])
+    assert changed == [] and record_only == []
+    # Los archivos a procesar llevan su MD5 para registrarlo
+    assert all(obj['md5'] for obj in to_process)
+
+def test_unchanged_files_are_skipped(storage_root, write_object):
+    a = write_object('raw/fact_test/date=2025-01-02/a.csv', 'x\n1\n')
+    change_detection.classify([a], {}, storage_root)
+    entries = _register([a], storage_root)
+
+    assert change_detection.classify([dict(a)], entries, storage_root) == ([], [], [])
+
+def test_rewritten_file_is_reprocessed(storage_root, write_object):
+    a = write_object('raw/fact_test/date=2025-01-02/a.csv', 'x\n1\n')
+    change_detection.classify([a], {}, storage_root)
+    entries = _register([a], storage_root)
+
+    rewritten = write_object('raw/fact_test/date=2025-01-02/a.csv', 'x\n1\n3\n')
+    to_process, changed, record_only = change_detection.classify([rewritten], entries, storage_root)
+
+    assert _paths(to_process) == _paths(changed) == [a['path']]
+    assert record_only == []
+
+def test_reuploaded_file_is_only_recorded(storage_root, write_object):
+    a = write_object('raw/fact_test/date=2025-01-02/a.csv', 'x\n1\n')
+    change_detection.classify([a], {}, storage_root)
+    entries = _register([a], storage_root)
+
+    # Mismo contenido, otra generación
+    reuploaded = write_object('raw/fact_test/date=2025-01-02/a.csv', 'x\n1\n')
+    to_process, changed, record_only = change_detection.classify([reuploaded], entries, storage_root)
+
+    assert to_process == [] and changed == []
+    assert _paths(record_only) == [a['path']]
+    assert record_only[0]['duplicate_of'] is None
+
+def test_identical_copies_are_recorded_as_duplicates(storage_root, write_object):
+    a = write_object('raw/fact_test/date=2025-01-02/a.csv', 'x\n1\n')
+    change_detection.classify([a], {}, storage_root)
+    entries = _register([a], storage_root)
+
+    copy = write_object('raw/fact_test/date=2025-01-03/copy.csv', 'x\n1\n')
+    other = write_object('raw/fact_test/date=2025-01-03/other.csv', 'x\n2\n')
+    second_copy = write_object('raw/fact_test/date=2025-01-03/other-copy.csv', 'x\n2\n')
+    to_process, _, record_only = change_detection.classify([copy, other, second_copy], entries, storage_root)
+
+    assert _paths(to_process) == [other['path']]
+    assert {obj['path']: obj['duplicate_of'] for obj in record_only} == {
+        copy['path']: a['path'],
+        second_copy['path']: other['path'],
+    }
+
+def test_detection_can_be_disabled(storage_root, write_object):
+    a = write_object('raw/fact_test/date=2025-01-02/a.csv', 'x\n1\n')
+    change_detection.classify([a], {}, storage_root)
+    entries = _register([a], storage_root)
+
+    rewritten = write_object('raw/fact_test/date=2025-01-02/a.csv', 'x\n9\n')
+    copy = write_object('raw/fact_test/date=2025-01-03/copy.csv', 'x\n1\n')
+    to_process, changed, record_only = change_detection.classify(
+        [rewritten, copy], entries, storage_root, detect_changes=False, detect_duplicates=False
+    )
+
+    assert _paths(to_process) == [copy['path']]
+    assert changed == [] and record_only == []
+
+def _pending(output: str, sources: list[str], detected_at: datetime) -> dict:
+    return {'output': output, 'generation': 1, 'sources': sources, 'detected_at': detected_at.isoformat()}
+
+def test_outstanding_objects_carry_the_registered_md5(storage_root, write_object):
+    a = write_object('raw/fact_test/date=2025-01-02/a.csv', 'x\n1\n')
+    entries = _register([{**a, 'md5': 'registrado'}], storage_root)
+    pending = [_pending('clean/fact_test/date=2025-01-02/microbatch-1.parquet', [a['path']], datetime.now(pytz.utc) + timedelta(seconds=1))]
+
+    # La fuente no se listó en esta ejecución: se consulta y, como es el mismo objeto, conserva su MD5
+    objects, kept = change_detection.outstanding_objects(pending, entries, {}, storage_root)
+
+    assert kept == pending
+    assert [(obj['path'], obj['md5']) for obj in objects] == [(a['path'], 'registrado')]
+
+def test_outstanding_objects_hash_rewritten_sources(storage_root, write_object):
+    a = write_object('raw/fact_test/date=2025-01-02/a.csv', 'x\n1\n')
+    entries = _register([{**a, 'md5': 'anterior'}], storage_root)
+    rewritten = write_object('raw/fact_test/date=2025-01-02/a.csv', 'x\n1\n2\n')
+    pending = [_pending('clean/fact_test/date=2025-01-02/microbatch-1.parquet', [a['path']], datetime.now(pytz.utc) + timedelta(seconds=1))]
+
+    objects, _ = change_detection.outstanding_objects(pending, entries, {rewritten['path']: rewritten}, storage_root)
+
+    assert len(objects) == 1
+    assert objects[0]['md5'] not in (None, 'anterior')
+
+def test_outstanding_objects_skip_reprocessed_and_missing_sources(storage_root, write_object):
+    a = write_object('raw/fact_test/date=2025-01-02/a.csv', 'x\n1\n')
+    b = write_object('raw/fact_test/date=2025-01-02/b.csv', 'x\n2\n')
+    detected_at = datetime.now(pytz.utc) - timedelta(hours=1)
+    entries = _register([a, b], storage_root)
+    missing = f"{a['path'].rsplit('/', 1)[0]}/missing.csv"
+    pending = [
+        # Sus fuentes ya se registraron después de la detección: no queda nada por reprocesar
+        _pending('clean/fact_test/date=2025-01-02/microbatch-1.parquet', [a['path'], b['path']], detected_at),
+        # Una fuente ya no existe: el Parquet no se puede rearmar y deja de estar pendiente
+        _pending('clean/fact_test/date=2025-01-02/microbatch-2.parquet', [missing], detected_at),
+    ]
+
+    objects, kept = change_detection.outstanding_objects(pending, entries, {}, storage_root)
+
+    assert objects == []
+    assert kept == pending[:1]
@@ -0,0 +1,51 @@
+from utils import manifest_utils, storage
+
+MANIFEST_PREFIX = 'logs/manifest/fact_test/'
+
+def _source(generation: int, size: int = 10, md5: str = 'abc') -> dict:
+    return {'generation': generation, 'size': size, 'md5': md5}
+
+def test_empty_manifest(storage_root):
+    assert manifest_utils.load_manifest_entries(MANIFEST_PREFIX, storage_root) == {}
+    assert manifest_utils.load_processed_log(MANIFEST_PREFIX, storage_root) == set()
+
+def test_latest_entry_wins(storage_root):
+    manifest_utils.append_to_log('raw/a.csv', MANIFEST_PREFIX, storage_root, _source(1), ['date=2025-01-02'])
+    manifest_utils.append_to_log('raw/a.csv', MANIFEST_PREFIX, storage_root, _source(2), ['date=2025-01-02', 'date=2025-01-01'])
+    manifest_utils.append_to_log('raw/b.csv', MANIFEST_PREFIX, storage_root)
+
+    entries = manifest_utils.load_manifest_entries(MANIFEST_PREFIX, storage_root)
+
+    assert set(entries) == {'raw/a.csv', 'raw/b.csv'}
+    assert entries['raw/a.csv']['generation'] == '2'
+    assert manifest_utils.entry_partitions(entries['raw/a.csv']) == ['date=2025-01-01', 'date=2025-01-02']
+    assert manifest_utils.entry_partitions(entries['raw/b.csv']) == []
+
+def test_append_entries_writes_one_segment(storage_root):
+    manifest_utils.append_entries(['raw/a.csv', 'raw/b.csv'], MANIFEST_PREFIX, storage_root, {'raw/a.csv': _source(1)})
+
+    segments = storage.get_backend(storage_root).list(f"{MANIFEST_PREFIX}segments/")
+    assert len(segments) == 1
+    assert manifest_utils.load_processed_log(MANIFEST_PREFIX, storage_root) == {'raw/a.csv', 'raw/b.csv'}
+
+def test_compaction_keeps_every_entry(storage_root, configure):
+    configure(MANIFEST_COMPACTION_THRESHOLD=3)
+    for i in range(4):
+        manifest_utils.append_to_log(f'raw/{i}.csv', MANIFEST_PREFIX, storage_root, _source(i))
+
+    # La lectura que supera el umbral compacta los segmentos en la base
+    first = manifest_utils.load_manifest_entries(MANIFEST_PREFIX, storage_root)
+    backend = storage.get_backend(storage_root)
+    assert backend.list(f"{MANIFEST_PREFIX}segments/") == []
+    assert backend.stat(f"{MANIFEST_PREFIX}{manifest_utils.BASE_FILE_NAME}") is not None
+
+    manifest_utils.append_to_log('raw/4.csv', MANIFEST_PREFIX, storage_root, _source(4))
+    second = manifest_utils.load_manifest_entries(MANIFEST_PREFIX, storage_root)
+    assert set(first) == {f'raw/{i}.csv' for i in range(4)}
+    assert set(second) == {f'raw/{i}.csv' for i in range(5)}
+    assert second['raw/3.csv']['generation'] == '3'
+
+def test_watermark_roundtrip(storage_root):
+    assert manifest_utils.load_watermark(MANIFEST_PREFIX, storage_root) is None
+    manifest_utils.save_watermark('date=2025-01-02', MANIFEST_PREFIX, storage_root)
+    assert manifest_utils.load_watermark(MANIFEST_PREFIX, storage_root) == 'date=2025-01-02'
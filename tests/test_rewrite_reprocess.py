@@ -0,0 +1,73 @@
+import ast
+import os
+
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pytest
+
+from benchmarks import synthetic
+from src.processors import sales_processor
+
+# --------------------------------------------------------------------------------
+# Reescritura de un CSV crudo ya procesado, de punta a punta
+#
+# Se procesan varios archivos, se reescribe uno con otras ventas y se vuelve a
+# ejecutar: la capa clean tiene que quedar exactamente con las ventas de los
+# CSV actuales (sin filas duplicadas ni las del contenido anterior) y las
+# tablas hijas, con las filas de esas ventas y ninguna otra.
+# --------------------------------------------------------------------------------
+RAW_PARTITION = 'raw/fact_sales/date=2025-07-26'
+
+MODES = {
+    'por archivo': {},
+    'micro-lotes': {'MICRO_BATCH_MODE': 'true'},
+    'fecha de negocio': {'PARTITION_BY_BUSINESS_DATE': 'true'},
+    'micro-lotes por fecha de negocio': {'MICRO_BATCH_MODE': 'true', 'PARTITION_BY_BUSINESS_DATE': 'true'},
+}
+
+def _write_raw_sales(storage_root: str, name: str, rows: int, seed: int, first_key: int) -> set[int]:
+    """Escribe un CSV crudo de fact_sales con claves únicas y devuelve sus sales_key."""
+    df = synthetic.generate_raw_sales(rows, seed=seed)
+    df['id'] = range(first_key, first_key + rows)
+    path = os.path.join(storage_root, RAW_PARTITION, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    previous = os.stat(path).st_mtime_ns if os.path.exists(path) else None
+    df.to_csv(path, index=False)
+    if previous is not None and os.stat(path).st_mtime_ns <= previous:
+        os.utime(path, ns=(previous + 1_000_000, previous + 1_000_000))
+    return set(df['id'])
+
+def _read_clean(storage_root: str, fact_name: str):
+    return ds.dataset(os.path.join(storage_root, 'clean', f'fact_{fact_name}'), format='parquet', partitioning='hive').to_table()
+
+def _run_sales(main):
+    tasks = [task for task in main.FACT_PROCESSING_TASKS if task['name'] == 'sales']
+    summary = main.run_all_tasks(tasks)
+    assert summary['sales']['success'] and summary['sales']['failed'] == 0
+    return summary['sales']['processed']
+
+@pytest.mark.parametrize('env', MODES.values(), ids=MODES.keys())
+def test_rewritten_file_replaces_its_rows(storage_root, configure, env):
+    configure(CHILD_FACTS_ENABLED='true', MEMORY_GOVERNOR='false', PROCESSING_BATCH_SIZE=100, **env)
+    import main
+
+    keys = {name: _write_raw_sales(storage_root, name, 300, seed, 1_000 * (seed + 1)) for seed, name in enumerate(['a.csv', 'b.csv', 'c.csv'])}
+    assert _run_sales(main) == 3
+
+    # Con un archivo nuevo en la misma ejecución, el micro-lote que reprocesa b.csv tiene otro nombre que el anterior
+    keys['b.csv'] = _write_raw_sales(storage_root, 'b.csv', 120, 9, 50_000)
+    keys['d.csv'] = _write_raw_sales(storage_root, 'd.csv', 80, 4, 60_000)
+    assert _run_sales(main) >= 2
+
+    sales = _read_clean(storage_root, 'sales')
+    sales_keys = sales['sales_key'].to_pylist()
+    expected = set().union(*keys.values())
+    assert len(sales_keys) == len(set(sales_keys)), "hay ventas duplicadas"
+    assert set(sales_keys) == expected
+
+    for child_name, (column, _) in sales_processor.CHILD_FACTS.items():
+        child = _read_clean(storage_root, child_name)
+        expected_rows = sum(len(ast.literal_eval(value)) for value in sales[column].to_pylist() if value)
+        assert child.num_rows == expected_rows, f"filas de fact_{child_name}"
+        orphans = pc.sum(pc.invert(pc.is_in(child['sales_key'], sales['sales_key']))).as_py() if child.num_rows else 0
+        assert orphans == 0, f"filas huérfanas en fact_{child_name}"
@@ -0,0 +1,79 @@
+import threading
+import time
+
+from utils import scheduler_utils
+
+_MB = 1024 * 1024
+
+def _units(*sizes_mb: float) -> list[dict]:
+    return [{'items': [f'raw/{i}.csv'], 'bytes': int(size * _MB)} for i, size in enumerate(sizes_mb)]
+
+def _measured_model(overhead_seconds: float, seconds_per_mb: float) -> scheduler_utils.CostModel:
+    """
+    Modelo con muchas observaciones de esos coeficientes (unidades de 1 archivo
+    sin bytes y de 1 MB sin costo fijo): no explora y las unidades instantáneas
+    de las pruebas casi no lo mueven.
+    """
+    weight = 1000.0
+    state = {'ff': weight, 'fm': 0.0, 'mm': weight, 'fs': weight * overhead_seconds, 'ms': weight * seconds_per_mb, 'observations': 100}
+    return scheduler_utils.CostModel(overhead_seconds, seconds_per_mb, state)
+
+def _run_unit(items: list[str]) -> dict:
+    return {path: True for path in items}
+
+def test_without_deadline_runs_everything():
+    units = _units(1, 2, 3)
+    results, late = scheduler_utils.run_within_budget(units, _run_unit, 2, _measured_model(100, 100), None)
+
+    assert results == {'raw/0.csv': True, 'raw/1.csv': True, 'raw/2.csv': True}
+    assert late == []
+
+def test_units_that_do_not_fit_are_left_in_order():
+    units = _units(100, 1, 200, 2)
+    deadline = time.monotonic() + 10
+    model = _measured_model(0, 1.0)
+
+    results, late = scheduler_utils.run_within_budget(units, _run_unit, 1, model, deadline)
+
+    assert results == {'raw/1.csv': True, 'raw/3.csv': True}
+    assert late == [units[0], units[2]]
+    assert model.observations == 102
+
+def test_first_unit_is_explored_without_measurements():
+    units = _units(1, 1)
+    model = scheduler_utils.CostModel(100, 0)
+
+    results, late = scheduler_utils.run_within_budget(units, _run_unit, 1, model, time.monotonic() + 10)
+
+    # Con sólo los valores iniciales nada entra, pero la primera unidad se ejecuta para medir
+    assert results == {'raw/0.csv': True}
+    assert late == [units[1]]
+    assert model.observations == 1
+
+def test_unit_is_rechecked_after_waiting_for_a_slot():
+    units = _units(1)
+    slots = threading.BoundedSemaphore(1)
+    slots.acquire()
+    # Otra tarea tiene el único lugar hasta después del límite
+    releaser = threading.Timer(0.5, slots.release)
+    releaser.start()
+    try:
+        results, late = scheduler_utils.run_within_budget(units, _run_unit, 1, _measured_model(0.01, 0), time.monotonic() + 0.2, slots)
+    finally:
+        releaser.join()
+
+    assert results == {}
+    assert late == units
+    # El lugar se devolvió aunque la unidad no se ejecutó
+    assert slots.acquire(blocking=False)
+
+def test_cost_model_learns_from_observations():
+    model = scheduler_utils.CostModel(1.0, 0.5)
+    for _ in range(20):
+        model.observe(10 * _MB, 1, 2.0)
+        model.observe(100 * _MB, 1, 11.0)
+
+    overhead, per_mb = model.coefficients()
+    assert abs(overhead - 1.0) < 0.1
+    assert abs(per_mb - 0.1) < 0.01
+    assert abs(model.estimate(50 * _MB) - 6.0) < 0.5
@@ -0,0 +1,316 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pytz
+
+from utils import storage
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# --------------------------------------------------------------------------------
+# Detección de archivos crudos reescritos y de copias idénticas
+#
+# El manifiesto guarda la generación, el tamaño y el MD5 de cada archivo crudo
+# procesado. Al listar, cada archivo ya registrado cuya generación o tamaño
+# cambió se compara por MD5: si el contenido es otro, se reprocesa; si es el
+# mismo (se volvió a subir igual), sólo se actualiza su entrada. Un archivo
+# nuevo con el mismo MD5 que otro ya registrado es una copia idéntica: se
+# registra con 'duplicate_of' y no se procesa. En GCS el MD5 viene en el
+# listado; en disco local se calcula leyendo sólo los archivos candidatos.
+#
+# Reprocesar un archivo reescrito no alcanza para corregir la capa clean si
+# sus filas quedaron en un Parquet compartido (micro-lote o compactado). Cada
+# Parquet de clean conoce sus fuentes: las salidas por archivo por su nombre y
+# las demás por el linaje de sus metadatos (LINEAGE_METADATA_KEY). Se buscan en
+# la partición del archivo crudo y en las que registró el manifiesto para él
+# (con PARTITION_BY_BUSINESS_DATE, sus filas pueden estar en otros días). Los Parquet
+# que contienen un archivo reescrito se anotan en
+# {manifest_prefix}superseded.json junto con todas sus fuentes; esas fuentes se
+# reprocesan y, cuando todas quedaron registradas de nuevo, el Parquet viejo se
+# elimina (salvo que la reescritura lo haya reemplazado con el mismo nombre).
+# Como en la compactación, en el medio un lector puede ver filas duplicadas,
+# pero nunca filas faltantes.
+#
+# Sólo se comparan los archivos listados. Con INCREMENTAL_DISCOVERY, el listado
+# empieza en el watermark: para no ignorar para siempre una corrección en una
+# partición anterior, cada CHANGE_DETECTION_FULL_LIST_HOURS se lista la tabla
+# completa ({manifest_prefix}full_listing.json guarda cuándo fue el último).
+# --------------------------------------------------------------------------------
+SUPERSEDED_FILE_NAME = 'superseded.json'
+FULL_LISTING_FILE_NAME = 'full_listing.json'
+SHARED_OUTPUT_PREFIXES = ('microbatch-', 'compacted-')
+
+def _matches(entry: dict, obj: dict) -> bool:
+    """Indica si el archivo listado es el mismo objeto que registró la entrada."""
+    if not entry.get('generation'):
+        # Entradas anteriores a la detección de cambios: sólo se conoce la ruta
+        return True
+    return entry['generation'] == str(obj.get('generation')) and entry.get('size') in (None, '', str(obj.get('size')))
+
+def fill_content_hashes(objects: list[dict], storage_root: str, max_workers: int = 16):
+    """Completa 'md5' en los objetos del listado que no lo traen, leyendo su contenido."""
+    missing = [obj for obj in objects if not obj.get('md5')]
+    if not missing:
+        return
+    backend = storage.get_backend(storage_root)
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(missing))), thread_name_prefix='content_hash') as executor:
+        for obj, digest in zip(missing, executor.map(lambda o: backend.content_hash(o['key']), missing)):
+            obj['md5'] = digest
+
+def classify(discovered: list[dict], entries: dict[str, dict], storage_root: str, detect_changes: bool = True, detect_duplicates: bool = True) -> tuple[list[dict], list[dict], list[dict]]:
+    """
+    Separa los archivos listados según lo que hay que hacer con cada uno.
+
+    Args:
+        discovered (list[dict]): Archivos listados ({'path', 'key', 'size', 'generation', 'md5'}).
+        entries (dict[str, dict]): Entradas del manifiesto (ver manifest_utils.load_manifest_entries).
+        storage_root (str): Raíz de almacenamiento (ver utils.storage).
+        detect_changes (bool): Reprocesar los archivos registrados cuyo contenido cambió.
+        detect_duplicates (bool): No procesar copias idénticas de archivos ya registrados.
+
+    Returns:
+        tuple[list[dict], list[dict], list[dict]]: (archivos a procesar, de ellos
+        los reescritos, archivos a registrar sin procesar: copias idénticas,
+        con 'duplicate_of', y archivos que se volvieron a subir sin cambios).
+    """
+    new, modified = [], []
+    for obj in discovered:
+        entry = entries.get(obj['path'])
+        if entry is None:
+            new.append(obj)
+        elif detect_changes and not _matches(entry, obj):
+            modified.append(obj)
+
+    fill_content_hashes(modified + (new if detect_duplicates else []), storage_root)
+
+    changed, record_only = [], []
+    for obj in modified:
+        entry = entries[obj['path']]
+        if entry.get('md5') and entry['md5'] == obj.get('md5'):
+            record_only.append({**obj, 'duplicate_of': entry.get('duplicate_of') or None})
+        elif entry.get('duplicate_of'):
+            # Nunca se procesó: con el contenido nuevo se evalúa como un archivo nuevo
+            new.append(obj)
+        else:
+            changed.append(obj)
+
+    to_process = list(changed)
+    if detect_duplicates:
+        changed_paths = {obj['path'] for obj in changed}
+        known = {
+            entry['md5']: entry.get('duplicate_of') or path
+            for path, entry in entries.items() if entry.get('md5') and path not in changed_paths
+        }
+        for obj in new:
+            original = known.get(obj.get('md5')) if obj.get('md5') else None
+            if original and original != obj['path']:
+                record_only.append({**obj, 'duplicate_of': original})
+            else:
+                to_process.append(obj)
+                if obj.get('md5'):
+                    known.setdefault(obj['md5'], obj['path'])
+    else:
+        to_process.extend(new)
+
+    return to_process, changed, record_only
+
+# --------------------------------------------------------------------------------
+# Fuentes de los Parquet de clean y reemplazo de los que quedaron desactualizados
+# --------------------------------------------------------------------------------
+def per_file_source_key(output_key: str, source_fact: str = None) -> str | None:
+    """
+    Clave del CSV crudo del que sale un Parquet por archivo
+    ('clean/fact_x/date=.../a.parquet' -> 'raw/fact_x/date=.../a.csv'),
+    o None si es un Parquet compartido (micro-lote o compactado).
+
+    Las filas de un archivo que caen en otra partición que la suya llevan su
+    fecha en el nombre: 'clean/fact_x/date=D/a@2025-01-02.parquet' sale de
+    'raw/fact_x/date=2025-01-02/a.csv'.
+
+    Con `source_fact`, el CSV es de esa tabla de hechos: es el caso de las
+    tablas hijas ('clean/fact_x_hija/...' sale de 'raw/fact_x/...').
+    """
+    name = output_key.rsplit('/', 1)[-1]
+    if name.startswith(SHARED_OUTPUT_PREFIXES) or not output_key.startswith('clean/'):
+        return None
+    relative = output_key[len('clean/'):-len('.parquet')]
+    if '@' in name:
+        fact_dir, _, stem = relative.split('/', 2)
+        stem, source_date = stem.rsplit('@', 1)
+        relative = f"{fact_dir}/date={source_date}/{stem}"
+    if source_fact:
+        relative = f"fact_{source_fact}/{relative.split('/', 1)[1]}"
+    return f"raw/{relative}.csv"
+
+def lineage_from_metadata(metadata: dict | None) -> list[list] | None:
+    """Linaje ([[ruta, registros], ...]) guardado en los metadatos de un Parquet, o None si no tiene."""
+    # Se importa acá para que clasificar el listado no cargue pandas ni pyarrow
+    from utils.microbatch_utils import LINEAGE_METADATA_KEY
+    if not metadata or LINEAGE_METADATA_KEY not in metadata:
+        return None
+    return json.loads(metadata[LINEAGE_METADATA_KEY])
+
+def output_lineage(output_key: str, metadata: dict | None, num_rows: int, storage_root: str, source_fact: str = None) -> list[list] | None:
+    """
+    Linaje de un Parquet de clean: el de sus metadatos o, para una salida por
+    archivo, su CSV de origen (de `source_fact`, si es una tabla hija). None si
+    no se puede determinar.
+    """
+    lineage = lineage_from_metadata(metadata)
+    if lineage is not None:
+        return lineage
+    source_key = per_file_source_key(output_key, source_fact)
+    return [[storage.get_backend(storage_root).uri(source_key), num_rows]] if source_key else None
+
+def _output_sources(backend, obj: dict, source_fact: str = None) -> list[str] | None:
+    source_key = per_file_source_key(obj['key'], source_fact)
+    if source_key:
+        return [backend.uri(source_key)]
+    import pyarrow.parquet as pq
+    # Sólo se lee el footer del Parquet
+    with backend.open_input(obj['path']) as f:
+        lineage = lineage_from_metadata(pq.read_schema(f).metadata)
+    return [path for path, _ in lineage] if lineage is not None else None
+
+def find_superseded_outputs(storage_root: str, fact_name: str, changed: list[dict], partitions_of, source_fact: str = None) -> list[dict]:
+    """
+    Busca los Parquet de clean que contienen filas de archivos crudos reescritos.
+
+    Args:
+        storage_root (str): Raíz de almacenamiento (ver utils.storage).
+        fact_name (str): Nombre de la tabla de hechos.
+        changed (list[dict]): Archivos reescritos (objetos del listado).
+        partitions_of (Callable[[str], list[str]]): Ruta cruda -> particiones de clean
+            ('date=YYYY-MM-DD') donde pueden estar sus filas.
+        source_fact (str, opcional): Tabla de los archivos crudos, si no es `fact_name` (tablas hijas).
+
+    Returns:
+        list[dict]: [{'output': clave, 'generation', 'sources': [rutas]}, ...]
+    """
+    backend = storage.get_backend(storage_root)
+    changed_paths = {obj['path'] for obj in changed}
+    partitions = sorted({partition for path in changed_paths for partition in partitions_of(path)})
+
+    superseded = []
+    for partition in partitions:
+        for obj in backend.list(f"clean/fact_{fact_name}/{partition}/", suffix='.parquet'):
+            if obj['key'].rsplit('/', 1)[-1].startswith(('_', '.')):
+                continue
+            sources = _output_sources(backend, obj, source_fact)
+            if sources is None:
+                logger.warning(f"No se conocen las fuentes de '{obj['key']}': si contiene filas de un archivo reescrito, quedarán duplicadas.")
+                continue
+            if changed_paths.intersection(sources):
+                superseded.append({'output': obj['key'], 'generation': obj['generation'], 'sources': sources})
+    return superseded
+
+def full_listing_due(manifest_prefix: str, storage_root: str, interval_hours: float) -> bool:
+    """Indica si pasaron `interval_hours` desde el último listado completo (o si nunca hubo uno)."""
+    if interval_hours <= 0:
+        return True
+    try:
+        content = storage.get_backend(storage_root).read_text(f"{manifest_prefix}{FULL_LISTING_FILE_NAME}")
+        last = datetime.fromisoformat(json.loads(content)['listed_at']) if content else None
+    except Exception as e:
+        logger.warning(f"No se pudo leer '{manifest_prefix}{FULL_LISTING_FILE_NAME}': {e}")
+        last = None
+    return last is None or (datetime.now(pytz.utc) - last).total_seconds() >= interval_hours * 3600
+
+def save_full_listing(manifest_prefix: str, storage_root: str):
+    """Registra que se acaba de revisar la tabla completa."""
+    content = json.dumps({'listed_at': datetime.now(pytz.utc).isoformat()})
+    storage.get_backend(storage_root).write_text(f"{manifest_prefix}{FULL_LISTING_FILE_NAME}", content, 'application/json')
+
+def load_superseded(manifest_prefix: str, storage_root: str) -> list[dict]:
+    """Parquet desactualizados pendientes de reemplazo de una tabla de hechos."""
+    try:
+        content = storage.get_backend(storage_root).read_text(f"{manifest_prefix}{SUPERSEDED_FILE_NAME}")
+        return json.loads(content).get('outputs', []) if content else []
+    except Exception as e:
+        logger.warning(f"No se pudo leer '{manifest_prefix}{SUPERSEDED_FILE_NAME}': {e}")
+        return []
+
+def save_superseded(outputs: list[dict], manifest_prefix: str, storage_root: str):
+    """Guarda los Parquet desactualizados pendientes (o elimina el archivo si no queda ninguno)."""
+    backend = storage.get_backend(storage_root)
+    key = f"{manifest_prefix}{SUPERSEDED_FILE_NAME}"
+    if not outputs:
+        backend.delete(key)
+        return
+    content = json.dumps({'outputs': outputs, 'updated_at': datetime.now(pytz.utc).isoformat()}, indent=2)
+    backend.write_text(key, content, 'application/json')
+
+def register_superseded(found: list[dict], pending_outputs: list[dict]) -> list[dict]:
+    """Agrega los Parquet encontrados a los pendientes, con el momento de la detección."""
+    detected_at = datetime.now(pytz.utc).isoformat()
+    known = {item['output']: item for item in pending_outputs}
+    for item in found:
+        # Si ya estaba pendiente, la nueva detección exige reprocesar otra vez todas sus fuentes
+        known[item['output']] = {**item, 'detected_at': detected_at}
+    return list(known.values())
+
+def outstanding_sources(pending_outputs: list[dict], entries: dict[str, dict]) -> set[str]:
+    """Fuentes de los Parquet pendientes que todavía no se reprocesaron desde la detección."""
+    return {
+        path for item in pending_outputs for path in item['sources']
+        if (entries.get(path) or {}).get('processing_timestamp_utc', '') <= item['detected_at']
+    }
+
+def outstanding_objects(pending_outputs: list[dict], entries: dict[str, dict], listed: dict[str, dict], storage_root: str) -> tuple[list[dict], list[dict]]:
+    """
+    Objetos de las fuentes que faltan reprocesar para reemplazar los Parquet pendientes.
+
+    Las fuentes que no se listaron en esta ejecución se consultan una por una.
+    Si alguna ya no existe, su Parquet no se puede rearmar: se conserva y deja
+    de estar pendiente. Cada objeto lleva su MD5 (el de su entrada si sigue
+    siendo el mismo objeto, o calculado), para que al registrarlo de nuevo siga
+    sirviendo para detectar sus copias idénticas.
+
+    Returns:
+        tuple[list[dict], list[dict]]: (objetos a procesar, Parquet que siguen pendientes)
+    """
+    backend = storage.get_backend(storage_root)
+    objects = {}
+    kept = []
+    for item in pending_outputs:
+        item_objects = {}
+        for path in outstanding_sources([item], entries):
+            obj = listed.get(path) or objects.get(path)
+            if obj is None:
+                key = backend.key(path)
+                info = backend.stat(key)
+                obj = {'path': path, 'key': key, 'md5': None, **info} if info else None
+            if obj is None:
+                logger.warning(f"'{path}' ya no existe: se conserva '{item['output']}' aunque contenga filas de un archivo reescrito.")
+                break
+            item_objects[path] = obj
+        else:
+            objects.update(item_objects)
+            kept.append(item)
+
+    for path, obj in objects.items():
+        entry = entries.get(path) or {}
+        if not obj.get('md5') and entry.get('md5') and _matches(entry, obj):
+            obj['md5'] = entry['md5']
+    fill_content_hashes(list(objects.values()), storage_root)
+    return list(objects.values()), kept
+
+def retire_superseded(pending_outputs: list[dict], entries: dict[str, dict], storage_root: str) -> list[dict]:
+    """
+    Elimina los Parquet pendientes cuyas fuentes ya se reprocesaron todas y
+    devuelve los que siguen pendientes. Un Parquet que la reescritura ya
+    reemplazó (mismo nombre, otra generación) no se elimina.
+    """
+    backend = storage.get_backend(storage_root)
+    remaining = []
+    for item in pending_outputs:
+        if outstanding_sources([item], entries):
+            remaining.append(item)
+            continue
+        current = backend.stat(item['output'])
+        if current is not None and current['generation'] == item['generation']:
+            backend.delete(item['output'])
+            logger.info(f"Parquet desactualizado eliminado: {item['output']} ({len(item['sources'])} fuentes reprocesadas).")
+    return remaining
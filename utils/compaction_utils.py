@@ -0,0 +1,207 @@
+import json
+import uuid
+
+import pyarrow as pa
+
+from utils import change_detection, gcp_utils, microbatch_utils, parquet_profiles, storage
+from utils.env_config import config
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# --------------------------------------------------------------------------------
+# Compactación de particiones clean/fact_{name}/date=.../
+#
+# Une los Parquet pequeños de una partición en pocos archivos de tamaño
+# COMPACTION_TARGET_FILE_MB, con row groups de COMPACTION_ROW_GROUP_ROWS
+# registros y el resto del perfil de escritura de la tabla (compresión,
+# estadísticas y orden de filas; ver utils.parquet_profiles). Los archivos nuevos se escriben primero
+# con prefijo '_' (ocultos para BigQuery/Spark/pyarrow.dataset), se verifica que
+# contengan todos los registros y recién entonces se publican y se eliminan los
+# archivos originales. Los datos se unen como tablas de Arrow, sin pasar por
+# pandas, para conservar los tipos del esquema de salida (por ejemplo, las
+# columnas de diccionario). El almacenamiento no ofrece renombres atómicos de varios objetos: en la
+# ventana entre publicar y eliminar un lector puede ver filas duplicadas, pero
+# nunca filas faltantes.
+#
+# Cada archivo compactado lleva en sus metadatos el linaje de todo el grupo
+# (los CSV crudos de los archivos unidos y sus registros), para poder
+# reemplazarlo si alguno de esos CSV se reescribe (ver utils.change_detection).
+#
+# compact.py puede correr a la vez que main.py, que puede reescribir una salida
+# por archivo de la partición (al reprocesar un CSV cambiado). Por eso se anota
+# la generación de cada original al listar: si alguno cambió antes de publicar,
+# la partición no se compacta en esta pasada, y cada original se elimina sólo
+# si conserva esa generación (si no, se conserva y se informa).
+#
+# Las tablas de hechos hijas (ver src.processors.child_facts) se compactan igual,
+# con `source_fact` para que el linaje de sus salidas por archivo apunte al CSV
+# de la tabla padre.
+# --------------------------------------------------------------------------------
+COMPACTED_FILE_PREFIX = 'compacted-'
+STAGING_FILE_PREFIX = '_compacting-'
+
+def list_partition_files(storage_root: str, fact_name: str, partitions: list[str] = None) -> dict[str, list[dict]]:
+    """
+    Lista los Parquet de la capa clean de una tabla de hechos agrupados por partición.
+
+    Args:
+        storage_root (str): Raíz de almacenamiento (ver utils.storage).
+        fact_name (str): Nombre de la tabla de hechos (ej. 'sales').
+        partitions (list[str], opcional): Particiones a listar (ej. ['date=2025-07-26']).
+            Si no se indica, se listan todas con un único listado recursivo.
+
+    Returns:
+        dict[str, list[dict]]: {partición: [{'name', 'size', 'generation'}, ...]}
+    """
+    backend = storage.get_backend(storage_root)
+    fact_prefix = f"clean/fact_{fact_name}/"
+    prefixes = [f"{fact_prefix}{partition}/" for partition in partitions] if partitions else [fact_prefix]
+
+    grouped = {}
+    for prefix in prefixes:
+        for obj in backend.list(prefix):
+            parts = obj['key'][len(fact_prefix):].split('/')
+            if len(parts) != 2 or not parts[0].startswith('date='):
+                continue
+            if not parts[1].endswith('.parquet') or parts[1].startswith(('_', '.')):
+                continue
+            grouped.setdefault(parts[0], []).append({'name': obj['key'], 'size': obj['size'], 'generation': obj['generation']})
+    return grouped
+
+def _group_lineage(storage_root: str, files: list[dict], tables: list[pa.Table], source_fact: str = None) -> list[list] | None:
+    """Linaje conjunto de los archivos a compactar, o None si alguno no lo tiene."""
+    rows_by_source = {}
+    for f, table in zip(files, tables):
+        lineage = change_detection.output_lineage(f['name'], table.schema.metadata, table.num_rows, storage_root, source_fact)
+        if lineage is None:
+            return None
+        for path, rows in lineage:
+            rows_by_source[path] = rows_by_source.get(path, 0) + rows
+    return [[path, rows] for path, rows in rows_by_source.items()]
+
+def _concat_tables(tables: list[pa.Table]) -> pa.Table:
+    """
+    Une las tablas de una partición. Si archivos de distintas épocas tienen la
+    misma columna como texto y como diccionario, se unen como texto.
+    """
+    try:
+        table = pa.concat_tables(tables, promote_options='permissive')
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        decoded = [
+            t.cast(pa.schema([f.with_type(f.type.value_type) if pa.types.is_dictionary(f.type) else f for f in t.schema]))
+            for t in tables
+        ]
+        table = pa.concat_tables(decoded, promote_options='permissive')
+    # Los metadatos de cada archivo (por ejemplo, el linaje de un micro-lote) no aplican al compactado
+    return table.replace_schema_metadata(None)
+
+def _small_files(files: list[dict]) -> list[dict]:
+    """Archivos por debajo de la mitad del tamaño objetivo: candidatos a compactar."""
+    threshold = config.COMPACTION_TARGET_FILE_MB * 1024 * 1024 / 2
+    return [f for f in files if f['size'] < threshold]
+
+def compact_partition(storage_root: str, partition_prefix: str, files: list[dict], profile: dict = None, source_fact: str = None) -> bool:
+    """
+    Compacta los archivos pequeños de una partición.
+
+    Args:
+        storage_root (str): Raíz de almacenamiento (ver utils.storage).
+        partition_prefix (str): Prefijo de la partición (ej. 'clean/fact_sales/date=2025-07-26/').
+        files (list[dict]): Archivos de la partición ({'name', 'size', 'generation'}).
+        profile (dict, opcional): Perfil de escritura de la tabla (por defecto, el de la configuración).
+        source_fact (str, opcional): Tabla padre de los CSV crudos, si es una tabla hija.
+
+    Returns:
+        bool: True si la partición se compactó; False si ya estaba compacta o
+        si otro proceso reescribió alguno de sus archivos en el medio.
+    """
+    small_files = _small_files(files)
+    if len(small_files) <= 1:
+        return False
+
+    backend = storage.get_backend(storage_root)
+    source_paths = [backend.uri(f['name']) for f in small_files]
+    expected_rows = sum(gcp_utils.read_parquet_num_rows(path) for path in source_paths)
+
+    tables = [gcp_utils.read_parquet_from_gcs(path, as_table=True) for path in source_paths]
+    lineage = _group_lineage(storage_root, small_files, tables, source_fact)
+    table = _concat_tables(tables)
+    del tables
+    if lineage is not None:
+        table = table.replace_schema_metadata({microbatch_utils.LINEAGE_METADATA_KEY: json.dumps(lineage).encode()})
+    else:
+        logger.warning(f"Hay archivos sin linaje en {partition_prefix}: los compactados no podrán reemplazarse si se reescribe un CSV crudo.")
+    if table.num_rows != expected_rows:
+        raise ValueError(f"Se leyeron {table.num_rows} de {expected_rows} registros en {partition_prefix}; no se compacta.")
+
+    # Cantidad de archivos de salida según el tamaño de entrada (los Parquet ya están comprimidos)
+    input_bytes = sum(f['size'] for f in small_files)
+    target_bytes = config.COMPACTION_TARGET_FILE_MB * 1024 * 1024
+    num_outputs = max(1, -(-input_bytes // target_bytes))
+    rows_per_output = -(-table.num_rows // num_outputs) if table.num_rows else 0
+
+    # Se ordena la partición completa para que cada archivo cubra un rango de claves
+    if profile:
+        table = parquet_profiles.sort_table(table, profile)
+
+    run_id = uuid.uuid4().hex[:12]
+    staged = []
+    for i in range(num_outputs):
+        part = table.slice(i * rows_per_output, rows_per_output)
+        staging_name = f"{partition_prefix}{STAGING_FILE_PREFIX}{run_id}-{i:03d}.parquet"
+        gcp_utils.write_parquet_to_gcs(part, backend.uri(staging_name), row_group_size=config.COMPACTION_ROW_GROUP_ROWS, profile=profile)
+        staged.append(staging_name)
+
+    written_rows = sum(gcp_utils.read_parquet_num_rows(backend.uri(name)) for name in staged)
+    if written_rows != expected_rows:
+        for name in staged:
+            backend.delete(name)
+        raise ValueError(f"Los archivos compactados de {partition_prefix} tienen {written_rows} de {expected_rows} registros; se descartan.")
+
+    # Si otro proceso reescribió un original mientras se compactaba, lo compactado ya no lo refleja
+    rewritten = [f['name'] for f in small_files if (backend.stat(f['name']) or {}).get('generation') != f['generation']]
+    if rewritten:
+        for name in staged:
+            backend.delete(name)
+        logger.warning(f"{len(rewritten)} archivos de {partition_prefix} cambiaron durante la compactación ({', '.join(rewritten)}); se reintentará en otra pasada.")
+        return False
+
+    # Publicar los archivos nuevos y luego eliminar los originales que no cambiaron
+    for name in staged:
+        backend.copy(name, name.replace(STAGING_FILE_PREFIX, COMPACTED_FILE_PREFIX))
+        backend.delete(name)
+    for f in small_files:
+        try:
+            backend.delete(f['name'], if_generation_match=f['generation'])
+        except storage.PreconditionFailedError:
+            logger.warning(f"'{f['name']}' se reescribió después de compactarlo: se conserva (sus filas anteriores quedan en el compactado hasta que se reemplace).")
+
+    logger.info(f"Partición {partition_prefix} compactada: {len(small_files)} archivos -> {num_outputs} ({expected_rows} registros).")
+    return True
+
+def compact_fact(storage_root: str, fact_name: str, partitions: list[str] = None, profile: dict = None, source_fact: str = None) -> tuple[int, int]:
+    """
+    Compacta las particiones de una tabla de hechos que lo necesiten.
+
+    Args:
+        storage_root (str): Raíz de almacenamiento (ver utils.storage).
+        fact_name (str): Nombre de la tabla de hechos (ej. 'sales').
+        partitions (list[str], opcional): Particiones a revisar; por defecto, todas.
+        profile (dict, opcional): Perfil de escritura de la tabla (ver utils.parquet_profiles).
+        source_fact (str, opcional): Tabla padre, si `fact_name` es una tabla hija.
+
+    Returns:
+        tuple[int, int]: (particiones compactadas, particiones con error).
+    """
+    compacted = 0
+    failed = 0
+    for partition, files in sorted(list_partition_files(storage_root, fact_name, partitions).items()):
+        partition_prefix = f"clean/fact_{fact_name}/{partition}/"
+        try:
+            if compact_partition(storage_root, partition_prefix, files, profile, source_fact):
+                compacted += 1
+        except Exception as e:
+            failed += 1
+            logger.error(f"ERROR al compactar la partición '{partition_prefix}': {e}", exc_info=True)
+    return compacted, failed
@@ -0,0 +1,175 @@
+import os
+import threading
+import time
+
+import pandas as pd
+
+from utils import gcp_utils, storage
+from utils.env_config import config
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# --------------------------------------------------------------------------------
+# Caché de dimensiones
+#
+# Resuelve el snapshot más reciente de una dimensión en la capa 'clean', lo
+# descarga una vez y construye un índice compacto de búsqueda. Dentro de
+# DIMENSION_CACHE_TTL_SECONDS se reutiliza sin consultar el almacenamiento;
+# pasado ese tiempo se vuelve a resolver el snapshot y, si la ruta y la
+# generación del objeto no cambiaron, se conserva el índice. Opcionalmente el
+# Parquet se guarda en disco (DIMENSION_CACHE_DIR) para reutilizarlo entre
+# ejecuciones.
+# --------------------------------------------------------------------------------
+_cache = {}
+_cache_lock = threading.Lock()
+
+def normalize_key(series: pd.Series) -> pd.Series:
+    """
+    Normaliza una columna clave a texto para que enteros, flotantes enteros
+    ('123.0') y cadenas ('123') de distintas fuentes coincidan entre sí.
+    """
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        try:
+            return series.astype('Int64').astype('string')
+        except (TypeError, ValueError):
+            pass
+    return series.astype('string').str.strip()
+
+class DimensionIndex:
+    """
+    Índice de búsqueda vectorizada de una dimensión: (columnas clave) -> valor.
+
+    Guarda sólo las claves normalizadas y el array de valores, no el DataFrame
+    completo de la dimensión.
+    """
+
+    def __init__(self, df: pd.DataFrame, key_columns: list[str], value_column: str):
+        df = df[key_columns + [value_column]].drop_duplicates(subset=key_columns, keep='first')
+        self.key_columns = list(key_columns)
+        self.value_column = value_column
+        self._index = pd.MultiIndex.from_arrays([normalize_key(df[col]) for col in key_columns])
+        self._values = df[value_column].astype('Int64').array
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def lookup(self, *key_series: pd.Series) -> pd.Series:
+        """
+        Devuelve, para cada fila, el valor asociado a sus claves (<NA> si no existe).
+
+        Args:
+            *key_series (pd.Series): Una serie por columna clave, en el mismo orden que key_columns.
+
+        Returns:
+            pd.Series: Serie 'Int64' alineada con el índice de la primera serie.
+        """
+        probe = pd.MultiIndex.from_arrays([normalize_key(series) for series in key_series])
+        positions = self._index.get_indexer(probe)
+        # take con allow_fill=True convierte las posiciones -1 (clave no encontrada) en <NA>
+        result = self._values.take(positions, allow_fill=True)
+        return pd.Series(result, index=key_series[0].index, name=self.value_column)
+
+    def entries(self) -> pd.DataFrame:
+        """
+        Devuelve las entradas del índice como DataFrame: una columna por clave
+        (ya normalizada con `normalize_key`) y la columna de valor ('Int64').
+        Permite resolver la búsqueda con un join en otros motores.
+        """
+        data = {col: self._index.get_level_values(i) for i, col in enumerate(self.key_columns)}
+        data[self.value_column] = self._values
+        return pd.DataFrame(data)
+
+def _object_generation(path: str):
+    """Devuelve la generación del objeto (o None si no se puede obtener)."""
+    try:
+        backend = storage.backend_for_path(path)
+        return (backend.stat(backend.key(path)) or {}).get('generation')
+    except Exception as e:
+        logger.warning(f"No se pudo obtener la generación de {path}: {e}")
+        return None
+
+def _load_dimension_df(dimension_name: str, path: str, generation) -> pd.DataFrame:
+    """Lee el snapshot de la dimensión, usando la copia en disco si corresponde a la misma generación."""
+    # Con el backend local la dimensión ya está en disco: no hace falta otra copia
+    cache_dir = config.DIMENSION_CACHE_DIR
+    if isinstance(storage.backend_for_path(path), storage.LocalBackend):
+        cache_dir = None
+    local_path = None
+    if cache_dir and generation is not None:
+        partition = next((part for part in path.split('/') if part.startswith('date=')), 'latest')
+        local_path = os.path.join(cache_dir, f"dim_{dimension_name}-{partition}-{generation}.parquet")
+        if os.path.exists(local_path):
+            logger.info(f"Dimensión '{dimension_name}' leída desde la caché local {local_path}.")
+            return pd.read_parquet(local_path)
+
+    df = gcp_utils.read_parquet_from_gcs(path)
+
+    if local_path and not df.empty:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = f"{local_path}.tmp-{os.getpid()}-{threading.get_ident()}"
+            df.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, local_path)
+        except OSError as e:
+            logger.warning(f"No se pudo guardar la dimensión '{dimension_name}' en la caché local: {e}")
+
+    return df
+
+def get_dimension_index(dimension_name: str, key_columns: list[str], value_column: str) -> DimensionIndex:
+    """
+    Devuelve el índice de búsqueda del snapshot más reciente de una dimensión.
+
+    Args:
+        dimension_name (str): Nombre de la dimensión (ej. 'items' para 'clean/dim_items').
+        key_columns (list[str]): Columnas que forman la clave de búsqueda.
+        value_column (str): Columna cuyo valor se devuelve.
+
+    Returns:
+        DimensionIndex: Índice listo para `lookup`.
+    """
+    cache_key = (dimension_name, tuple(key_columns), value_column)
+    with _cache_lock:
+        entry = _cache.get(cache_key)
+        now = time.monotonic()
+        if entry and (entry.get('pinned') or now - entry['resolved_at'] < config.DIMENSION_CACHE_TTL_SECONDS):
+            return entry['index']
+
+        path = gcp_utils.find_latest_dimension_path('clean', dimension_name)
+        generation = _object_generation(path)
+        if entry and entry['path'] == path and entry['generation'] == generation and generation is not None:
+            entry['resolved_at'] = now
+            return entry['index']
+
+        df = _load_dimension_df(dimension_name, path, generation)
+        if df.empty:
+            raise ValueError(f"El snapshot de la dimensión '{dimension_name}' en {path} está vacío o no se pudo leer.")
+
+        index = DimensionIndex(df, key_columns, value_column)
+        _cache[cache_key] = {'path': path, 'generation': generation, 'index': index, 'resolved_at': now}
+        logger.info(f"Índice de la dimensión '{dimension_name}' cargado desde {path} ({len(index)} claves).")
+        return index
+
+def preload_dimension(dimension_name: str, df: pd.DataFrame, key_columns: list[str], value_column: str) -> DimensionIndex:
+    """
+    Registra un índice construido a partir de un DataFrame ya disponible, sin
+    consultar GCS. El índice queda fijo hasta `clear_cache` (útil para benchmarks,
+    ejecuciones locales y workers que reciben la dimensión ya cargada).
+
+    Returns:
+        DimensionIndex: El índice registrado.
+    """
+    index = DimensionIndex(df, key_columns, value_column)
+    register_index(dimension_name, index)
+    return index
+
+def register_index(dimension_name: str, index: DimensionIndex):
+    """Registra un índice ya construido como fijo para la dimensión indicada."""
+    cache_key = (dimension_name, tuple(index.key_columns), index.value_column)
+    with _cache_lock:
+        _cache[cache_key] = {'path': None, 'generation': None, 'index': index, 'resolved_at': time.monotonic(), 'pinned': True}
+
+def clear_cache():
+    """Descarta todos los índices en memoria (por ejemplo, al iniciar una nueva ejecución)."""
+    with _cache_lock:
+        _cache.clear()
@@ -1,18 +1,97 @@
 import os
+import threading
 
-# Carga .env solo en local
-if os.getenv("ENV", "local") == "local":
-    from dotenv import load_dotenv
-    load_dotenv()
+# --------------------------------------------------------------------------------
+# Configuración del pipeline
+#
+# Importar este módulo no tiene efectos: .env se carga y las variables de entorno
+# se leen la primera vez que se consulta un valor de `config`, no al importar.
+# Así, importar cualquier módulo del pipeline (o sólo medir su arranque) no
+# modifica os.environ ni escribe en la salida.
+# --------------------------------------------------------------------------------
+_lock = threading.Lock()
 
-class Config:
-    GCS_BUCKET_NAME = os.getenv("GCS_BUCKET_NAME")
-    GCP_PROJECT_NAME = os.getenv("GCP_PROJECT_NAME")
-    GCP_PROJECT_ID = os.getenv("GCP_PROJECT_ID") or os.getenv("GOOGLE_CLOUD_PROJECT")
-    GOOGLE_APPLICATION_CREDENTIALS = os.getenv("GOOGLE_APPLICATION_CREDENTIALS", os.getenv("GOOGLE_CREDENTIALS_PATH"))
+def load_environment():
+    """Carga .env en os.environ, sólo en local (ENV=local, el valor por defecto)."""
+    if os.getenv("ENV", "local") == "local":
+        from dotenv import load_dotenv
+        load_dotenv()
 
-    PROCESSING_BATCH_SIZE = int(os.getenv('PROCESSING_BATCH_SIZE', '3')) # Lee la variable de entorno 'PROCESSING_BATCH_SIZE', si no existe, usa el número elegido
-config = Config()
+def _build_config():
+    """Carga .env y lee la configuración del entorno."""
+    load_environment()
 
-print(f"GCP_PROJECT_ID: {config.GCP_PROJECT_ID}")
-print(f"GOOGLE_APPLICATION_CREDENTIALS: {config.GOOGLE_APPLICATION_CREDENTIALS}")
\ No newline at end of file
+    class Config:
+        GCS_BUCKET_NAME = os.getenv("GCS_BUCKET_NAME")
+        STORAGE_ROOT = os.getenv("STORAGE_ROOT") or f"gs://{GCS_BUCKET_NAME}" # Raíz de almacenamiento: gs://bucket o una ruta local (file:///ruta)
+        GCP_PROJECT_NAME = os.getenv("GCP_PROJECT_NAME")
+        GCP_PROJECT_ID = os.getenv("GCP_PROJECT_ID") or os.getenv("GOOGLE_CLOUD_PROJECT")
+        GOOGLE_APPLICATION_CREDENTIALS = os.getenv("GOOGLE_APPLICATION_CREDENTIALS", os.getenv("GOOGLE_CREDENTIALS_PATH"))
+
+        PROCESSING_BATCH_SIZE = int(os.getenv('PROCESSING_BATCH_SIZE', '3')) # Lee la variable de entorno 'PROCESSING_BATCH_SIZE', si no existe, usa el número elegido
+        RUN_TIME_BUDGET_SECONDS = float(os.getenv('RUN_TIME_BUDGET_SECONDS', '0')) # Tiempo de reloj de la ejecución; si es > 0 reemplaza a PROCESSING_BATCH_SIZE
+        RUN_TIME_RESERVE_SECONDS = float(os.getenv('RUN_TIME_RESERVE_SECONDS', '60')) # Parte del presupuesto reservada para cerrar la ejecución (compactación, reporte)
+        BACKLOG_DRAIN = os.getenv('BACKLOG_DRAIN', 'false').lower() in ('1', 'true', 'yes') # Procesa todos los archivos pendientes, sin lote ni presupuesto
+        SCHEDULER_ORDER = os.getenv('SCHEDULER_ORDER', 'oldest').lower() # Orden de los pendientes: 'oldest' (partición más antigua) o 'smallest'
+        SCHEDULER_FILE_OVERHEAD_SECONDS = float(os.getenv('SCHEDULER_FILE_OVERHEAD_SECONDS', '1.0')) # Costo fijo inicial estimado por archivo
+        SCHEDULER_SECONDS_PER_MB = float(os.getenv('SCHEDULER_SECONDS_PER_MB', '0.5')) # Costo inicial estimado por MB de CSV
+        PROCESSING_MAX_WORKERS = int(os.getenv('PROCESSING_MAX_WORKERS', '4')) # Cantidad de archivos que se procesan en paralelo dentro de una tarea
+        PROCESSING_ENGINE = os.getenv('PROCESSING_ENGINE', 'pandas').lower() # Motor de las tareas que no fijan 'engine': 'pandas' o 'polars'
+        SHARD_WORKERS = int(os.getenv('SHARD_WORKERS', '0')) # Procesos entre los que se reparte la transformación de un archivo grande (0 = desactivado)
+        SHARD_MIN_ROWS = int(os.getenv('SHARD_MIN_ROWS', '1000000')) # Filas a partir de las cuales un archivo se transforma por shards (medir con benchmarks/sharded_transform.py)
+        PARALLEL_FACT_TASKS = os.getenv('PARALLEL_FACT_TASKS', 'true').lower() in ('1', 'true', 'yes') # Ejecuta todas las tablas de hechos a la vez
+        MANIFEST_COMPACTION_THRESHOLD = int(os.getenv('MANIFEST_COMPACTION_THRESHOLD', '200')) # Segmentos del manifiesto que disparan una compactación
+        DIMENSION_CACHE_TTL_SECONDS = float(os.getenv('DIMENSION_CACHE_TTL_SECONDS', '900')) # Tiempo durante el cual no se vuelve a resolver el snapshot de una dimensión
+        DIMENSION_CACHE_DIR = os.getenv('DIMENSION_CACHE_DIR', '/tmp/fact-processing-cache') # Copia local de dimensiones; vacío para desactivarla
+        STREAMING_MODE = os.getenv('STREAMING_MODE', 'false').lower() in ('1', 'true', 'yes') # Procesa cada CSV por bloques con memoria acotada
+        STREAMING_CHUNK_MB = int(os.getenv('STREAMING_CHUNK_MB', '64')) # Tamaño de cada bloque del CSV en modo streaming
+        COMPACT_AFTER_TASK = os.getenv('COMPACT_AFTER_TASK', 'false').lower() in ('1', 'true', 'yes') # Compacta las particiones modificadas al terminar cada tarea
+        COMPACTION_TARGET_FILE_MB = int(os.getenv('COMPACTION_TARGET_FILE_MB', '128')) # Tamaño objetivo de cada archivo compactado
+        COMPACTION_ROW_GROUP_ROWS = int(os.getenv('COMPACTION_ROW_GROUP_ROWS', '131072')) # Registros por row group en los archivos compactados
+        INCREMENTAL_DISCOVERY = os.getenv('INCREMENTAL_DISCOVERY', 'true').lower() in ('1', 'true', 'yes') # Lista sólo desde el watermark de cada tabla
+        DISCOVERY_LOOKBACK_DAYS = int(os.getenv('DISCOVERY_LOOKBACK_DAYS', '2')) # Días previos al watermark que se vuelven a listar por archivos tardíos
+        CHANGE_DETECTION = os.getenv('CHANGE_DETECTION', 'true').lower() in ('1', 'true', 'yes') # Reprocesa los archivos crudos reescritos (generación/tamaño y MD5 distintos)
+        CHANGE_DETECTION_FULL_LIST_HOURS = float(os.getenv('CHANGE_DETECTION_FULL_LIST_HOURS', '24')) # Horas entre listados completos que revisan las particiones anteriores al watermark (0 = en cada ejecución)
+        DUPLICATE_DETECTION = os.getenv('DUPLICATE_DETECTION', 'true').lower() in ('1', 'true', 'yes') # Registra sin procesar las copias idénticas (mismo MD5) de archivos ya procesados
+        GCS_HTTP_POOL_SIZE = int(os.getenv('GCS_HTTP_POOL_SIZE', '0')) # Conexiones HTTP reutilizables del cliente de Storage (0 = según la concurrencia)
+        PIPELINE_MODE = os.getenv('PIPELINE_MODE', 'false').lower() in ('1', 'true', 'yes') # Solapa descarga, transformación y subida de archivos consecutivos
+        PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', '2')) # DataFrames en espera entre etapas del pipeline
+        MICRO_BATCH_MODE = os.getenv('MICRO_BATCH_MODE', 'false').lower() in ('1', 'true', 'yes') # Transforma varios archivos crudos juntos y escribe un Parquet por partición
+        MICRO_BATCH_MAX_FILES = int(os.getenv('MICRO_BATCH_MAX_FILES', '200')) # Máximo de archivos crudos por micro-lote
+        MICRO_BATCH_MAX_MB = int(os.getenv('MICRO_BATCH_MAX_MB', '256')) # Tamaño máximo de CSV crudo por micro-lote
+        MICRO_BATCH_READ_WORKERS = int(os.getenv('MICRO_BATCH_READ_WORKERS', '8')) # Lecturas en paralelo dentro de cada micro-lote
+        PARTITION_BY_BUSINESS_DATE = os.getenv('PARTITION_BY_BUSINESS_DATE', 'false').lower() in ('1', 'true', 'yes') # Particiona cada fila de clean por su fecha de negocio y no por la del archivo crudo
+        CHILD_FACTS_ENABLED = os.getenv('CHILD_FACTS_ENABLED', 'false').lower() in ('1', 'true', 'yes') # Normaliza las relaciones embebidas (ej. discounts_data) en tablas de hechos hijas
+        PARQUET_COMPRESSION = os.getenv('PARQUET_COMPRESSION', 'zstd') # Códec de los Parquet de salida ('zstd', 'snappy', 'gzip', 'lz4', 'none')
+        PARQUET_COMPRESSION_LEVEL = int(os.getenv('PARQUET_COMPRESSION_LEVEL')) if os.getenv('PARQUET_COMPRESSION_LEVEL') else None # Nivel del códec; vacío = el del códec
+        PARQUET_ROW_GROUP_ROWS = int(os.getenv('PARQUET_ROW_GROUP_ROWS', '131072')) # Registros por row group de los Parquet de salida
+        PARQUET_PAGE_INDEX = os.getenv('PARQUET_PAGE_INDEX', 'true').lower() in ('1', 'true', 'yes') # Escribe el índice de páginas (estadísticas por página)
+        PARQUET_WRITE_PROFILES = os.getenv('PARQUET_WRITE_PROFILES', '') # JSON {tabla: {clave: valor}} que ajusta el perfil de escritura de cada tabla
+        MEMORY_GOVERNOR = os.getenv('MEMORY_GOVERNOR', 'true').lower() in ('1', 'true', 'yes') # Decide por archivo entre memoria, exclusivo o streaming según la memoria disponible
+        MEMORY_LIMIT_MB = float(os.getenv('MEMORY_LIMIT_MB', '0')) # Límite de memoria del proceso (0 = el del cgroup del contenedor; sin límite, no interviene)
+        MEMORY_SOFT_LIMIT_FRACTION = float(os.getenv('MEMORY_SOFT_LIMIT_FRACTION', '0.8')) # Parte del límite que se usa para admitir archivos
+        MEMORY_EXPANSION_FACTOR = float(os.getenv('MEMORY_EXPANSION_FACTOR', '8')) # MB en memoria por MB de CSV, hasta tener mediciones
+        MEMORY_SAMPLE_SECONDS = float(os.getenv('MEMORY_SAMPLE_SECONDS', '0.2')) # Intervalo de muestreo del RSS mientras hay archivos en curso
+        MAX_CONCURRENT_FILES = int(os.getenv('MAX_CONCURRENT_FILES', '8')) # Tope global de archivos en proceso simultáneo entre todas las tareas
+        METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes') # Mide tiempos, filas, bytes y RSS por etapa y por archivo
+        METRICS_STAGE_LOGS = os.getenv('METRICS_STAGE_LOGS', 'false').lower() in ('1', 'true', 'yes') # Emite una línea de log JSON por cada etapa medida
+        RUN_REPORT_PREFIX = os.getenv('RUN_REPORT_PREFIX', 'logs/run_reports/') # Carpeta del reporte JSON de cada ejecución; vacío para no guardarlo
+    return Config()
+
+class _LazyConfig:
+    """Expone la configuración, que se construye una vez al consultar el primer valor."""
+
+    def __init__(self):
+        self._config = None
+
+    def _resolve(self):
+        if self._config is None:
+            with _lock:
+                if self._config is None:
+                    self._config = _build_config()
+        return self._config
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+config = _LazyConfig()
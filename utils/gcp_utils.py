@@ -1,82 +1,20 @@
+import csv
+import os
+import shutil
+import tempfile
 from datetime import datetime
+from typing import Callable, Iterable, Iterator
+import numpy as np
 import pandas as pd
-from google.cloud import storage
-from google.oauth2 import service_account
-import gcsfs
-from utils.env_config import config
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from utils import metrics, parquet_profiles, storage
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
 
-# Cliente singleton
-_storage_client = None
-
-def get_storage_client():
-    """Inicializa (una vez) y devuelve el cliente de Google Cloud Storage."""
-    global _storage_client
-    if _storage_client:
-        return _storage_client
-
-    try:
-        if config.GOOGLE_APPLICATION_CREDENTIALS:
-            credentials = service_account.Credentials.from_service_account_file(config.GOOGLE_APPLICATION_CREDENTIALS)
-            _storage_client = storage.Client(credentials=credentials, project=config.GCP_PROJECT_NAME)
-            logger.info("Cliente de Storage inicializado con archivo de credenciales.")
-        else:
-            _storage_client = storage.Client(project=config.GCP_PROJECT_NAME)
-            logger.info("Cliente de Storage inicializado con Application Default Credentials (ADC).")
-    except Exception as e:
-        logger.error(f"Error al inicializar cliente de GCS: {e}")
-        _storage_client = None
-
-    return _storage_client
-
-def get_gcsfs():
-    """
-    Retorna una instancia de GCSFileSystem, usando el archivo de credenciales si está definido.
-    """
-    if config.GOOGLE_APPLICATION_CREDENTIALS:
-        return gcsfs.GCSFileSystem(token=config.GOOGLE_APPLICATION_CREDENTIALS)
-    return gcsfs.GCSFileSystem()
-
-def list_gcs_files(bucket: str, prefix: str) -> list[str]:
-    """
-    Lista archivos en GCS con un prefijo determinado usando gcsfs.
-
-    Args:
-        bucket (str): Nombre del bucket (sin 'gs://').
-        prefix (str): Prefijo de los archivos a listar.
-
-    Returns:
-        list[str]: Lista de rutas de archivos en GCS que coinciden con el prefijo.
-    """
-    fs = get_gcsfs()
-    path = f"gs://{bucket}/{prefix}"
-    try:
-        # Usar recursive=True para obtener todos los archivos, no solo directorios
-        all_items = fs.ls(path, detail=False)
-        
-        # Filtrar solo archivos (no directorios) y obtener los que terminan en .csv
-        files = []
-        for item in all_items:
-            try:
-                # Si es un directorio, listar su contenido recursivamente
-                if not item.endswith('.csv'):
-                    subitems = fs.ls(f"gs://{item}", detail=False)
-                    for subitem in subitems:
-                        if subitem.endswith('.csv'):
-                            files.append(subitem)
-                else:
-                    files.append(item)
-            except Exception:
-                # Si hay error listando un item específico, continuar con el siguiente
-                continue
-        
-        return files
-    except Exception as e:
-        logger.error(f"gcs_utils: Error al listar archivos en {path}: {e}")
-        return []
-    
 def find_latest_dimension_path(layer: str, dimension_name: str) -> str:
     """
     Encuentra la ruta con la fecha más reciente dentro de la carpeta de una dimensión y capa ('raw' o 'clean').
@@ -86,10 +24,12 @@ def find_latest_dimension_path(layer: str, dimension_name: str) -> str:
         dimension_name (str): Nombre de la dimensión (ej. 'customer').
 
     Returns:
-        str: Ruta completa al archivo más reciente.
+        str: URI completa del archivo más reciente dentro de STORAGE_ROOT.
     """
     prefix = f"{layer}/dim_{dimension_name}/"
-    files = list_gcs_files(config.GCS_BUCKET_NAME, prefix)
+    # La capa raw guarda CSV y la capa clean, Parquet
+    suffix = '.parquet' if layer == 'clean' else '.csv'
+    files = [obj['path'] for obj in storage.get_backend().list(prefix, suffix=suffix)]
 
     # Filtrar solo paths con date partition
     dated_paths = [f for f in files if 'date=' in f]
@@ -108,59 +48,556 @@ def find_latest_dimension_path(layer: str, dimension_name: str) -> str:
     latest_path = max(dated_paths, key=extract_date)
     return latest_path
 
-def read_csv_from_gcs(path: str) -> pd.DataFrame:
+# Tipos de pandas usados en los esquemas de los procesadores -> tipos de Arrow.
+# Los enteros nulables ('Int64') se leen como float64 porque pandas los escribe
+# como '3.0' cuando la columna tiene nulos; el esquema del procesador los
+# convierte después a 'Int64' sin pérdida. Las columnas 'category' se leen ya
+# como diccionario (Categorical en pandas).
+_ARROW_TYPES = {
+    'int64': pa.int64(),
+    'Int64': pa.float64(),
+    'float64': pa.float64(),
+    'string': pa.string(),
+    'category': pa.dictionary(pa.int32(), pa.string()),
+}
+
+# Mismos valores que pandas.read_csv interpreta como nulos por defecto
+_CSV_NULL_VALUES = [
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND',
+    '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null',
+]
+
+def _arrow_types_to_pandas(arrow_type):
+    """types_mapper para to_pandas: enteros y textos de Arrow a dtypes nulables de pandas."""
+    if arrow_type == pa.int64():
+        return pd.Int64Dtype()
+    if arrow_type == pa.string():
+        return pd.StringDtype()
+    return None
+
+def _read_csv_header(f, block_size: int = 64 * 1024) -> list[str]:
+    """
+    Lee sólo la fila de encabezado de un archivo binario y vuelve al inicio.
+
+    Lee por bloques en vez de usar readline(), que los archivos de Arrow
+    (memory map) no implementan.
     """
-    Lee un archivo CSV desde una ruta completa de GCS y devuelve un DataFrame.
+    header = b''
+    while b'\n' not in header:
+        block = f.read(block_size)
+        if not block:
+            break
+        header += block
+    f.seek(0)
+    header_line = header.split(b'\n', 1)[0].rstrip(b'\r').decode('utf-8-sig')
+    return next(csv.reader([header_line]), [])
+
+def _build_csv_convert_options(header: list[str], column_types: dict, exclude_columns: list, integers_as_float: bool = False):
+    """Arma las opciones de conversión de Arrow: proyección de columnas y tipos declarados."""
+    excluded = set(exclude_columns or [])
+    include_columns = [col for col in dict.fromkeys(header) if col not in excluded]
+
+    declared_types = {}
+    for col, dtype in (column_types or {}).items():
+        if col in include_columns and dtype in _ARROW_TYPES:
+            arrow_type = _ARROW_TYPES[dtype]
+            if integers_as_float and arrow_type == pa.int64():
+                arrow_type = pa.float64()
+            declared_types[col] = arrow_type
+
+    return pa_csv.ConvertOptions(
+        include_columns=include_columns,
+        column_types=declared_types,
+        null_values=_CSV_NULL_VALUES,
+        strings_can_be_null=True,
+    )
+
+def read_csv_arrow(f, column_types: dict = None, exclude_columns: list = None, as_table: bool = False) -> pd.DataFrame | pa.Table:
+    """
+    Lee un CSV desde un archivo binario con el lector multihilo de Arrow.
+
+    Sólo se parsean las columnas que no están en `exclude_columns`, y las
+    declaradas en `column_types` se convierten directamente a su tipo final.
+    Si algún entero declarado viene escrito como decimal ('3.0'), se reintenta
+    leyendo esas columnas como float64, y si aun así falla, se infieren los
+    tipos; la conversión final la hace luego el esquema del procesador.
 
     Args:
-        path (str): Ruta GCS completa (ej. 'gs://bucket/raw/dim_customer/date=2024-06-01/data.csv').
+        f: Archivo binario con soporte de seek.
+        column_types (dict, opcional): {columna cruda: dtype de pandas ('Int64', 'string', ...)}.
+        exclude_columns (list, opcional): Columnas que no se leen.
+        as_table (bool): Devuelve la tabla de Arrow sin convertirla a pandas.
 
     Returns:
-        pd.DataFrame: DataFrame con los datos del archivo.
+        pd.DataFrame | pa.Table: DataFrame con dtypes nulables de pandas (o la tabla de Arrow).
+    """
+    header = _read_csv_header(f)
+    read_options = pa_csv.ReadOptions(use_threads=True)
+
+    # Del tipado más estricto al más permisivo: tipos declarados, enteros como
+    # float64 y, por último, sólo proyección con inferencia de tipos.
+    attempts = [
+        (column_types, False),
+        (column_types, True),
+        (None, False),
+    ]
+    for attempt, (types, integers_as_float) in enumerate(attempts):
+        try:
+            f.seek(0)
+            convert_options = _build_csv_convert_options(header, types, exclude_columns, integers_as_float)
+            table = pa_csv.read_csv(f, read_options=read_options, convert_options=convert_options)
+            break
+        except pa.ArrowInvalid as e:
+            if attempt == len(attempts) - 1:
+                raise
+            logger.warning(f"Lectura tipada del CSV fallida ({e}); se reintenta con tipos más permisivos.")
+
+    return table if as_table else table.to_pandas(types_mapper=_arrow_types_to_pandas)
+
+def iter_csv_chunks_arrow(f, column_types: dict = None, exclude_columns: list = None, chunk_size_bytes: int = 64 * 1024 * 1024, as_table: bool = False) -> Iterator[pd.DataFrame | pa.Table]:
+    """
+    Lee un CSV por bloques acotados con el lector en streaming de Arrow.
+
+    Usa la misma proyección y los mismos tipos declarados que `read_csv_arrow`,
+    pero sólo mantiene en memoria un bloque de `chunk_size_bytes` a la vez.
+
+    Si un bloque no se puede convertir, el archivo se vuelve a leer con tipos
+    más permisivos (como en `read_csv_arrow`) y se continúa desde la primera
+    fila no entregada, sin repetir las anteriores. Como el lector en streaming
+    infiere los tipos sólo con el primer bloque, el último intento lee las
+    columnas declaradas como texto; la conversión final la hace luego el
+    esquema del procesador.
+
+    Args:
+        f: Archivo binario con soporte de seek.
+        column_types (dict, opcional): {columna cruda: dtype de pandas}.
+        exclude_columns (list, opcional): Columnas que no se leen.
+        chunk_size_bytes (int): Tamaño aproximado de cada bloque del CSV.
+        as_table (bool): Entrega cada bloque como tabla de Arrow.
+
+    Yields:
+        pd.DataFrame | pa.Table: Un DataFrame por bloque, con dtypes nulables de pandas (o una tabla de Arrow).
+    """
+    header = _read_csv_header(f)
+    read_options = pa_csv.ReadOptions(use_threads=True, block_size=chunk_size_bytes)
+
+    attempts = [
+        (column_types, False),
+        (column_types, True),
+        ({col: 'string' for col in column_types or {}}, False),
+    ]
+    emitted = 0
+    for attempt, (types, integers_as_float) in enumerate(attempts):
+        skip = emitted
+        try:
+            f.seek(0)
+            convert_options = _build_csv_convert_options(header, types, exclude_columns, integers_as_float)
+            reader = pa_csv.open_csv(f, read_options=read_options, convert_options=convert_options)
+            for batch in reader:
+                if skip:
+                    # Filas ya entregadas con los tipos del intento anterior
+                    dropped = min(skip, batch.num_rows)
+                    batch, skip = batch.slice(dropped), skip - dropped
+                if batch.num_rows:
+                    emitted += batch.num_rows
+                    yield pa.Table.from_batches([batch]) if as_table else batch.to_pandas(types_mapper=_arrow_types_to_pandas)
+            return
+        except pa.ArrowInvalid as e:
+            if attempt == len(attempts) - 1:
+                raise
+            logger.warning(f"Lectura tipada del CSV por bloques fallida después de {emitted} filas ({e}); se continúa con tipos más permisivos.")
+
+def iter_csv_chunks_from_gcs(path: str, column_types: dict = None, exclude_columns: list = None, chunk_size_bytes: int = 64 * 1024 * 1024, as_table: bool = False) -> Iterator[pd.DataFrame | pa.Table]:
+    """
+    Lee un CSV por bloques acotados (ver `iter_csv_chunks_arrow`).
+
+    Args:
+        path (str): URI completa del CSV (GCS o local).
+        column_types (dict, opcional): {columna cruda: dtype de pandas}.
+        exclude_columns (list, opcional): Columnas que no se leen.
+        chunk_size_bytes (int): Tamaño aproximado de cada bloque del CSV.
+        as_table (bool): Entrega cada bloque como tabla de Arrow.
+
+    Yields:
+        pd.DataFrame | pa.Table: Un bloque por iteración.
+    """
+    with storage.backend_for_path(path).open_input(path) as f:
+        chunks = iter_csv_chunks_arrow(f, column_types, exclude_columns, chunk_size_bytes, as_table)
+        # Se mide sólo la lectura de cada bloque, no el tiempo que el consumidor tarda en procesarlo
+        while True:
+            with metrics.stage('read_csv') as m:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    m['bytes_read'] = metrics.file_size(f)
+                else:
+                    m['rows_out'] = len(chunk)
+            if chunk is None:
+                break
+            yield chunk
+
+def read_csv_from_gcs(path: str, column_types: dict = None, exclude_columns: list = None, as_table: bool = False) -> pd.DataFrame | pa.Table:
+    """
+    Lee un archivo CSV desde una URI completa (GCS o local) y devuelve un DataFrame.
+
+    En el backend local el archivo se lee con memory map, sin copiarlo a memoria.
+
+    Si se pasa un esquema (`column_types` y/o `exclude_columns`), se usa el
+    lector de Arrow con proyección de columnas y tipos declarados; si no, se
+    mantiene la lectura con inferencia de pandas.
+
+    Args:
+        path (str): URI completa (ej. 'gs://bucket/raw/dim_customer/date=2024-06-01/data.csv').
+        column_types (dict, opcional): {columna cruda: dtype de pandas} para parsear directo al tipo final.
+        exclude_columns (list, opcional): Columnas que no se leen.
+        as_table (bool): Devuelve una tabla de Arrow en lugar de un DataFrame
+            (siempre con el lector de Arrow).
+
+    Returns:
+        pd.DataFrame | pa.Table: Los datos del archivo.
     """
-    fs = get_gcsfs()
     try:
-        with fs.open(path, 'r') as f:
-            df = pd.read_csv(f)
-            logger.info(f"CSV leído exitosamente desde {path} con {len(df)} registros.")
-            return df
+        with metrics.stage('read_csv') as m, storage.backend_for_path(path).open_input(path) as f:
+            if column_types or exclude_columns or as_table:
+                df = read_csv_arrow(f, column_types, exclude_columns, as_table)
+            else:
+                df = pd.read_csv(f)
+            m['bytes_read'] = metrics.file_size(f)
+            m['rows_out'] = len(df)
+        logger.info(f"CSV leído exitosamente desde {path} con {len(df)} registros.")
+        return df
     except Exception as e:
-        logger.error(f"Error al leer CSV desde GCS: {path} - {e}", exc_info=True)
-        return pd.DataFrame()
+        logger.error(f"Error al leer CSV desde {path}: {e}", exc_info=True)
+        return pa.table({}) if as_table else pd.DataFrame()
+
+def read_parquet_num_rows(path: str) -> int:
+    """
+    Devuelve la cantidad de registros de un Parquet leyendo sólo su footer.
 
-def read_parquet_from_gcs(path: str) -> pd.DataFrame:
+    Args:
+        path (str): URI completa del archivo Parquet.
+
+    Returns:
+        int: Cantidad de registros según los metadatos del archivo.
+    """
+    with storage.backend_for_path(path).open_input(path) as f:
+        return pq.ParquetFile(f).metadata.num_rows
+
+def read_parquet_from_gcs(path: str, as_table: bool = False) -> pd.DataFrame | pa.Table:
     """
-    Lee un archivo Parquet desde una ruta completa de GCS y devuelve un DataFrame.
+    Lee un archivo Parquet desde una URI completa (GCS o local) y devuelve un DataFrame.
 
     Args:
-        path (str): Ruta GCS completa (ej. 'gs://bucket/raw/dim_customer/date=2024-06-01/data.parquet').
+        path (str): URI completa (ej. 'gs://bucket/raw/dim_customer/date=2024-06-01/data.parquet').
+        as_table (bool): Devuelve la tabla de Arrow, con los tipos del archivo, sin convertirla a pandas.
 
     Returns:
-        pd.DataFrame: DataFrame con los datos del archivo.
+        pd.DataFrame | pa.Table: Los datos del archivo.
     """
-    fs = get_gcsfs()
     try:
-        with fs.open(path, 'rb') as f:
-            df = pd.read_parquet(f)
+        with metrics.stage('read_parquet') as m, storage.backend_for_path(path).open_input(path) as f:
+            df = pq.read_table(f) if as_table else pd.read_parquet(f)
+            m['bytes_read'] = metrics.file_size(f)
+            m['rows_out'] = len(df)
             logger.info(f"Parquet leído exitosamente desde {path} con {len(df)} registros.")
             return df
     except Exception as e:
-        logger.error(f"Error al leer Parquet desde GCS: {path} - {e}", exc_info=True)
-        return pd.DataFrame()
+        logger.error(f"Error al leer Parquet desde {path}: {e}", exc_info=True)
+        return pa.table({}) if as_table else pd.DataFrame()
 
-def write_parquet_to_gcs(df: pd.DataFrame, destination_path: str):
+def write_parquet_to_gcs(df: pd.DataFrame | pa.Table, destination_path: str, row_group_size: int = None, profile: dict = None):
     """
-    Escribe un DataFrame como archivo Parquet en GCS.
+    Escribe un DataFrame o una tabla de Arrow como archivo Parquet (GCS o local).
+
+    Las tablas de Arrow (salida de los procesadores de hechos) se escriben tal
+    cual, con su esquema, sin pasar por pandas. Las filas se ordenan y el
+    archivo se codifica según el perfil de escritura (ver utils.parquet_profiles).
+
+    Si la escritura falla, se descarta para no publicar un Parquet parcial.
 
     Args:
-        df (pd.DataFrame): DataFrame a guardar.
-        destination_path (str): Ruta GCS de destino (ej. 'gs://bucket/clean/dim_customer/date=2024-06-01/data.parquet').
+        df (pd.DataFrame | pa.Table): Datos a guardar.
+        destination_path (str): URI de destino (ej. 'gs://bucket/clean/dim_customer/date=2024-06-01/data.parquet').
+        row_group_size (int, opcional): Máximo de registros por row group (por defecto, el del perfil).
+        profile (dict, opcional): Perfil de escritura (por defecto, parquet_profiles.default_profile()).
+    """
+    profile = profile or parquet_profiles.default_profile()
+    with metrics.stage('write_parquet', rows_in=len(df)) as m:
+        table = df if isinstance(df, pa.Table) else pa.Table.from_pandas(df, preserve_index=False)
+        table = parquet_profiles.sort_table(table, profile)
+        f = storage.backend_for_path(destination_path).open_output(destination_path)
+        try:
+            pq.write_table(
+                table, f,
+                row_group_size=row_group_size or profile['row_group_size'],
+                **parquet_profiles.writer_options(profile, table.schema),
+            )
+            m['bytes_written'] = f.tell()
+        except Exception as e:
+            logger.error(f"Error al escribir Parquet en {destination_path}: {e}", exc_info=True)
+            _discard_upload(f)
+            raise
+        f.close()
+    logger.info(f"Archivo Parquet guardado exitosamente en {destination_path}")
+
+class _ChunkWriter:
+    """
+    ParquetWriter para una salida que llega por bloques, con el mismo orden de
+    filas y los mismos row groups que si se hubiera escrito de una sola vez.
+
+    Sin `sort_by` en el perfil, cada bloque se escribe apenas llega. Con orden,
+    un único bloque se ordena y se escribe al cerrar; si hay más de uno, cada
+    bloque se ordena y se vuelca a un Parquet temporal en disco local (una
+    corrida ordenada) y al cerrar se intercalan todas las corridas (k-way
+    merge) leyéndolas por tandas, con memoria acotada. El orden es estable: a
+    igual clave, las filas quedan en el orden en que llegaron, como al ordenar
+    el archivo completo.
     """
-    fs = get_gcsfs()
+
+    def __init__(self, f, schema: pa.Schema, profile: dict):
+        self.profile = profile
+        self.row_group_size = profile['row_group_size']
+        self.sort_keys = [(col, 'ascending') for col in profile.get('sort_by') or [] if col in schema.names]
+        self.writer = pq.ParquetWriter(f, schema, **parquet_profiles.writer_options(profile, schema))
+        self.first = None
+        self.runs = []
+        self.spill_dir = None
+
+    @property
+    def schema(self) -> pa.Schema:
+        return self.writer.schema
+
+    def write(self, table: pa.Table):
+        if not self.sort_keys:
+            self.writer.write_table(table, row_group_size=self.row_group_size)
+            return
+        table = parquet_profiles.sort_table(table, self.profile)
+        if self.first is None and not self.runs:
+            self.first = table
+            return
+        if self.first is not None:
+            self._spill(self.first)
+            self.first = None
+        self._spill(table)
+
+    def _spill(self, table: pa.Table):
+        if self.spill_dir is None:
+            self.spill_dir = tempfile.mkdtemp(prefix='fact-sort-')
+        path = os.path.join(self.spill_dir, f"{len(self.runs):06d}.parquet")
+        with metrics.stage('sort_spill', rows_in=table.num_rows) as m:
+            pq.write_table(table, path, compression='lz4')
+            m['bytes_written'] = os.path.getsize(path)
+        self.runs.append(path)
+
+    def _merged(self) -> Iterator[pa.Table]:
+        """Filas de todas las corridas en orden global, por tandas."""
+        batch_rows = max(1024, self.row_group_size // len(self.runs))
+        readers = [pq.ParquetFile(path).iter_batches(batch_size=batch_rows) for path in self.runs]
+        buffers = [None] * len(readers)
+        while True:
+            # Cada corrida con su tanda agotada lee la siguiente; las que ya no tienen más quedan cerradas
+            for i, reader in enumerate(readers):
+                if reader is not None and (buffers[i] is None or buffers[i].num_rows == 0):
+                    batch = next(reader, None)
+                    if batch is None:
+                        readers[i] = None
+                    else:
+                        buffers[i] = pa.Table.from_batches([batch], schema=self.schema)
+            live = [i for i, buffer in enumerate(buffers) if buffer is not None and buffer.num_rows]
+            if not live:
+                return
+            combined = pa.concat_tables([buffers[i] for i in live])
+            order = pc.sort_indices(combined, sort_keys=self.sort_keys).to_numpy()
+            rank = np.empty(len(order), dtype=np.int64)
+            rank[order] = np.arange(len(order))
+
+            # Lo que falta leer de una corrida va después de su última fila en memoria: se puede
+            # entregar todo hasta la menor de esas últimas filas entre las corridas que siguen abiertas
+            ends = np.cumsum([buffers[i].num_rows for i in live])
+            open_ends = [ends[k] - 1 for k, i in enumerate(live) if readers[i] is not None]
+            cutoff = int(rank[open_ends].min()) if open_ends else len(order) - 1
+            yield combined.take(order[:cutoff + 1])
+
+            # Cada corrida está ordenada: lo que queda de ella es un sufijo de su tanda
+            start = 0
+            for k, i in enumerate(live):
+                emitted = int((rank[start:ends[k]] <= cutoff).sum())
+                buffers[i] = buffers[i].slice(emitted)
+                start = ends[k]
+
+    def _write_row_groups(self, tables: Iterator[pa.Table]):
+        """Escribe las tablas en row groups completos de `row_group_size` registros."""
+        pending, rows = [], 0
+        for table in tables:
+            pending.append(table)
+            rows += table.num_rows
+            if rows >= self.row_group_size:
+                combined = pa.concat_tables(pending)
+                full = rows - rows % self.row_group_size
+                self.writer.write_table(combined.slice(0, full), row_group_size=self.row_group_size)
+                pending, rows = [combined.slice(full)], rows - full
+        if rows:
+            self.writer.write_table(pa.concat_tables(pending), row_group_size=self.row_group_size)
+
+    def close(self):
+        """Escribe lo pendiente (intercalando las corridas, si las hay) y cierra el Parquet."""
+        try:
+            if self.runs:
+                with metrics.stage('sort_merge') as m:
+                    self._write_row_groups(self._merged())
+                    m['rows_out'] = sum(pq.ParquetFile(path).metadata.num_rows for path in self.runs)
+            elif self.first is not None:
+                self.writer.write_table(self.first, row_group_size=self.row_group_size)
+            self.first = None
+            self.writer.close()
+        finally:
+            self._cleanup()
+
+    def abort(self):
+        """Cierra el escritor sin escribir lo pendiente y elimina las corridas temporales."""
+        try:
+            self.writer.close()
+        finally:
+            self._cleanup()
+
+    def _cleanup(self):
+        if self.spill_dir is not None:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+            self.spill_dir = None
+
+def write_parquet_chunks(chunks: Iterable[pd.DataFrame | pa.Table], f, profile: dict = None) -> int:
+    """
+    Escribe una secuencia de DataFrames o tablas de Arrow como un único Parquet.
+
+    El esquema lo fija el primer bloque; los siguientes se convierten a ese
+    esquema (por ejemplo, una columna completamente nula en un bloque). Con un
+    perfil que ordena filas, el archivo queda ordenado completo, con los mismos
+    row groups que al escribirlo de una vez (ver _ChunkWriter).
+
+    Args:
+        chunks (Iterable[pd.DataFrame | pa.Table]): Bloques ya procesados, en orden.
+        f: Archivo binario de destino.
+        profile (dict, opcional): Perfil de escritura (por defecto, parquet_profiles.default_profile()).
+
+    Returns:
+        int: Cantidad total de registros escritos.
+    """
+    profile = profile or parquet_profiles.default_profile()
+    writer = None
+    total_rows = 0
+    try:
+        for chunk in chunks:
+            with metrics.stage('write_parquet', rows_in=len(chunk)):
+                table = chunk if isinstance(chunk, pa.Table) else pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = _ChunkWriter(f, table.schema, profile)
+                elif not table.schema.equals(writer.schema, check_metadata=False):
+                    table = table.select(writer.schema.names).cast(writer.schema)
+                writer.write(table)
+                total_rows += table.num_rows
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        raise
+    if writer is not None:
+        with metrics.stage('write_parquet') as m:
+            writer.close()
+            m['bytes_written'] = f.tell() if hasattr(f, 'tell') else None
+    return total_rows
+
+def _discard_upload(f):
+    """Cancela una escritura en curso sin publicar el objeto parcial."""
+    if hasattr(f, 'discard'):
+        f.discard()
+    # Si la subida todavía no había comenzado, discard() no cierra el archivo y
+    # su close() (también al recolectarlo) publicaría el buffer pendiente.
+    f.closed = True
+
+def write_parquet_chunks_to_gcs(chunks: Iterable[pd.DataFrame | pa.Table], destination_path: str, profile: dict = None) -> int:
+    """
+    Escribe una secuencia de DataFrames como un único Parquet (GCS o local), a
+    medida que se producen, sin materializar el archivo completo en memoria.
+
+    Si algún bloque falla, la subida se descarta para no dejar un Parquet parcial.
+
+    Args:
+        chunks (Iterable[pd.DataFrame | pa.Table]): Bloques ya procesados, en orden.
+        destination_path (str): URI de destino.
+        profile (dict, opcional): Perfil de escritura (ver utils.parquet_profiles).
+
+    Returns:
+        int: Cantidad total de registros escritos.
+    """
+    f = storage.backend_for_path(destination_path).open_output(destination_path)
+    try:
+        total_rows = write_parquet_chunks(chunks, f, profile)
+    except Exception as e:
+        logger.error(f"Error al escribir Parquet por bloques en {destination_path}: {e}", exc_info=True)
+        _discard_upload(f)
+        raise
+
+    if total_rows == 0:
+        _discard_upload(f)
+        logger.warning(f"No se generaron registros para {destination_path}; no se escribió el archivo.")
+        return 0
+
+    f.close()
+    logger.info(f"Archivo Parquet guardado por bloques en {destination_path} ({total_rows} registros).")
+    return total_rows
+
+def write_partitioned_chunks_to_gcs(chunks: Iterable[dict[str, pa.Table]], destination_of: Callable[[str], str], profile: dict = None) -> dict[str, int]:
+    """
+    Como write_parquet_chunks_to_gcs, pero cada bloque llega repartido por
+    partición y se escribe un Parquet por partición, con un escritor abierto
+    por cada partición que aparece (ver _ChunkWriter para el orden de filas).
+
+    Si algún bloque falla, se descartan todas las subidas.
+
+    Args:
+        chunks (Iterable[dict[str, pa.Table]]): Bloques ya procesados, en orden: {partición: tabla}.
+        destination_of (Callable[[str], str]): Partición -> URI de destino.
+        profile (dict, opcional): Perfil de escritura (ver utils.parquet_profiles).
+
+    Returns:
+        dict[str, int]: {partición: registros escritos}.
+    """
+    profile = profile or parquet_profiles.default_profile()
+    outputs = {}
+    try:
+        for parts in chunks:
+            for partition, table in parts.items():
+                with metrics.stage('write_parquet', rows_in=table.num_rows):
+                    output = outputs.get(partition)
+                    if output is None:
+                        path = destination_of(partition)
+                        f = storage.backend_for_path(path).open_output(path)
+                        output = outputs[partition] = {'path': path, 'file': f, 'rows': 0}
+                        output['writer'] = _ChunkWriter(f, table.schema, profile)
+                    elif not table.schema.equals(output['writer'].schema, check_metadata=False):
+                        table = table.select(output['writer'].schema.names).cast(output['writer'].schema)
+                    output['writer'].write(table)
+                    output['rows'] += table.num_rows
+    except Exception as e:
+        logger.error(f"Error al escribir Parquet por bloques y partición ({', '.join(sorted(outputs)) or 'sin particiones'}): {e}", exc_info=True)
+        for output in outputs.values():
+            output['writer'].abort()
+            _discard_upload(output['file'])
+        raise
+
+    # Con orden, cerrar un escritor intercala sus corridas: si falla, se descartan las que no se publicaron
+    pending = list(outputs.values())
     try:
-        with fs.open(destination_path, 'wb') as f:
-            df.to_parquet(f, index=False)
-            logger.info(f"Archivo Parquet guardado exitosamente en {destination_path}")
+        while pending:
+            output = pending[0]
+            with metrics.stage('write_parquet') as m:
+                output['writer'].close()
+                m['bytes_written'] = output['file'].tell()
+            pending.pop(0)
+            output['file'].close()
+            logger.info(f"Archivo Parquet guardado por bloques en {output['path']} ({output['rows']} registros).")
     except Exception as e:
-        logger.error(f"Error al escribir Parquet en {destination_path}: {e}", exc_info=True)
+        logger.error(f"Error al cerrar Parquet por bloques y partición ({', '.join(output['path'] for output in pending)}): {e}", exc_info=True)
+        for output in pending:
+            output['writer'].abort()
+            _discard_upload(output['file'])
         raise
+    return {partition: output['rows'] for partition, output in outputs.items()}
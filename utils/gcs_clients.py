@@ -0,0 +1,94 @@
+import threading
+
+from utils.env_config import config
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# --------------------------------------------------------------------------------
+# Clientes de GCS compartidos por todo el proceso
+#
+# Un único cliente de Storage y un único GCSFileSystem por proceso, creados la
+# primera vez que se piden (de forma segura entre hilos). El cliente de Storage
+# usa una sesión HTTP con un pool de conexiones dimensionado según la
+# concurrencia del pipeline, para reutilizar conexiones TLS entre hilos en vez
+# de descartarlas cuando el pool por defecto (10) se llena.
+#
+# Las bibliotecas de Google y gcsfs se importan al crear cada cliente: un
+# listado sólo carga google-cloud-storage, y gcsfs (con aiohttp) recién se
+# importa cuando hay un archivo para leer o escribir.
+# --------------------------------------------------------------------------------
+_STORAGE_SCOPES = ["https://www.googleapis.com/auth/devstorage.full_control"]
+
+_lock = threading.Lock()
+_credentials = None
+_storage_client = None
+_gcsfs = None
+
+def http_pool_size() -> int:
+    """Tamaño del pool de conexiones HTTP: GCS_HTTP_POOL_SIZE o uno derivado de la concurrencia."""
+    if config.GCS_HTTP_POOL_SIZE > 0:
+        return config.GCS_HTTP_POOL_SIZE
+    return max(32, config.MAX_CONCURRENT_FILES * 4)
+
+def _get_credentials():
+    """Credenciales del archivo configurado o, si no hay, Application Default Credentials."""
+    global _credentials
+    if _credentials is None:
+        from google.auth import default as google_auth_default
+        from google.oauth2 import service_account
+        if config.GOOGLE_APPLICATION_CREDENTIALS:
+            _credentials = service_account.Credentials.from_service_account_file(
+                config.GOOGLE_APPLICATION_CREDENTIALS, scopes=_STORAGE_SCOPES
+            )
+        else:
+            _credentials, _ = google_auth_default(scopes=_STORAGE_SCOPES)
+    return _credentials
+
+def get_storage_client():
+    """Inicializa (una vez) y devuelve el cliente de Google Cloud Storage."""
+    global _storage_client
+    if _storage_client:
+        return _storage_client
+
+    with _lock:
+        if _storage_client:
+            return _storage_client
+        try:
+            from google.auth.transport.requests import AuthorizedSession
+            from google.cloud import storage
+            from requests.adapters import HTTPAdapter
+
+            pool_size = http_pool_size()
+            session = AuthorizedSession(_get_credentials())
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            _storage_client = storage.Client(project=config.GCP_PROJECT_NAME, credentials=_get_credentials(), _http=session)
+            origin = "archivo de credenciales" if config.GOOGLE_APPLICATION_CREDENTIALS else "Application Default Credentials (ADC)"
+            logger.info(f"Cliente de Storage inicializado con {origin} (pool HTTP: {pool_size} conexiones).")
+        except Exception as e:
+            logger.error(f"Error al inicializar cliente de GCS: {e}")
+            _storage_client = None
+
+    return _storage_client
+
+def get_gcsfs():
+    """
+    Inicializa (una vez) y devuelve el GCSFileSystem compartido, usando el archivo
+    de credenciales si está definido.
+
+    gcsfs usa su propio pool de conexiones asíncrono (aiohttp, 100 conexiones por
+    defecto), que ya supera la concurrencia del pipeline.
+    """
+    global _gcsfs
+    if _gcsfs is not None:
+        return _gcsfs
+
+    with _lock:
+        if _gcsfs is None:
+            import gcsfs
+            if config.GOOGLE_APPLICATION_CREDENTIALS:
+                _gcsfs = gcsfs.GCSFileSystem(token=config.GOOGLE_APPLICATION_CREDENTIALS)
+            else:
+                _gcsfs = gcsfs.GCSFileSystem()
+    return _gcsfs
@@ -0,0 +1,303 @@
+import csv
+import json
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from io import StringIO
+
+import pytz
+
+from utils import metrics, storage
+from utils.env_config import config
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# --------------------------------------------------------------------------------
+# Manifiesto de archivos procesados (append-only)
+#
+#   {manifest_prefix}base.csv                  -> entradas ya compactadas
+#   {manifest_prefix}segments/{ts}-{id}.csv    -> un segmento pequeño por append
+#   {manifest_prefix}watermark.json            -> partición desde la cual listar archivos nuevos
+#
+# Cada append sube un objeto nuevo y nunca reescribe los existentes, por lo que
+# su costo no depende del tamaño del historial y varios escritores pueden
+# registrar archivos a la vez sin pisarse. La compactación une los segmentos
+# en base.csv cada tanto.
+#
+# Cada entrada guarda además la generación, el tamaño y el MD5 (base64) del
+# archivo crudo que se procesó, para detectar archivos reescritos y copias
+# idénticas (ver utils.change_detection). 'duplicate_of' indica que el archivo
+# no se procesó por ser una copia idéntica de esa otra ruta. Un archivo puede
+# tener varias entradas (una por cada vez que se reprocesó): vale la más reciente.
+# 'partitions' son las particiones de clean donde quedaron sus filas, separadas
+# por ';' (con PARTITION_BY_BUSINESS_DATE pueden ser varias y distintas de la del
+# archivo crudo). Las entradas anteriores a estas columnas las tienen vacías.
+# --------------------------------------------------------------------------------
+MANIFEST_COLUMNS = ['processed_file_path', 'processing_timestamp_utc', 'generation', 'size', 'md5', 'duplicate_of', 'partitions']
+SOURCE_COLUMNS = ('generation', 'size', 'md5', 'duplicate_of')
+BASE_FILE_NAME = 'base.csv'
+WATERMARK_FILE_NAME = 'watermark.json'
+SEGMENTS_DIR = 'segments/'
+PARTITIONS_SEPARATOR = ';'
+
+def _base_path(manifest_prefix: str) -> str:
+    return f"{manifest_prefix}{BASE_FILE_NAME}"
+
+def _segments_prefix(manifest_prefix: str) -> str:
+    return f"{manifest_prefix}{SEGMENTS_DIR}"
+
+def _parse_entries(content: str) -> list[dict]:
+    """Convierte el contenido CSV de la base o de un segmento en una lista de entradas."""
+    return [row for row in csv.DictReader(StringIO(content)) if row.get('processed_file_path')]
+
+def _serialize_entries(entries: list[dict]) -> str:
+    """Serializa entradas a CSV con el encabezado del manifiesto."""
+    output = StringIO()
+    writer = csv.DictWriter(output, fieldnames=MANIFEST_COLUMNS, extrasaction='ignore', lineterminator='\n')
+    writer.writeheader()
+    writer.writerows(entries)
+    return output.getvalue()
+
+def _read_manifest(manifest_prefix: str, storage_root: str) -> tuple[list[dict], list[str], int]:
+    """
+    Lee todas las entradas del manifiesto (base + segmentos).
+
+    Los segmentos se listan y se leen ANTES de leer la base: si una compactación
+    ocurre en el medio, los segmentos que borró (y que por eso no se pudieron
+    leer) ya están en la base nueva, que se lee después, y no se pierde ninguna
+    entrada (a lo sumo se ven duplicadas).
+
+    Returns:
+        tuple: (entradas, nombres de segmentos leídos, generación de la base o 0 si no existe)
+    """
+    backend = storage.get_backend(storage_root)
+
+    segment_names = [obj['key'] for obj in backend.list(_segments_prefix(manifest_prefix), suffix='.csv')]
+
+    segment_entries = []
+    if segment_names:
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            for content in executor.map(backend.read_text, segment_names):
+                if content:
+                    segment_entries.extend(_parse_entries(content))
+
+    base_stat = backend.stat(_base_path(manifest_prefix))
+    entries = []
+    base_generation = 0
+    if base_stat is not None:
+        base_generation = base_stat['generation']
+        entries.extend(_parse_entries(backend.read_text(_base_path(manifest_prefix)) or ''))
+    entries.extend(segment_entries)
+
+    return entries, segment_names, base_generation
+
+def _latest_entries(entries: list[dict]) -> dict[str, dict]:
+    """Entrada más reciente de cada archivo (a igual timestamp, la última leída)."""
+    latest = {}
+    for entry in entries:
+        path = entry['processed_file_path']
+        current = latest.get(path)
+        if current is None or (entry.get('processing_timestamp_utc') or '') >= (current.get('processing_timestamp_utc') or ''):
+            latest[path] = entry
+    return latest
+
+def load_manifest_entries(manifest_prefix: str, storage_root: str) -> dict[str, dict]:
+    """
+    Carga la entrada más reciente de cada archivo registrado en el manifiesto.
+
+    Si la cantidad de segmentos supera MANIFEST_COMPACTION_THRESHOLD, se compactan
+    en la base para que las próximas lecturas sigan siendo baratas.
+
+    Args:
+        manifest_prefix (str): Prefijo del manifiesto dentro del almacenamiento (ej. 'logs/manifest/fact_sales/').
+        storage_root (str): Raíz de almacenamiento (ver utils.storage).
+
+    Returns:
+        dict[str, dict]: {ruta: entrada (columnas de MANIFEST_COLUMNS)}. Vacío si el manifiesto no existe.
+    """
+    try:
+        with metrics.stage('manifest_load') as m:
+            entries, segment_names, base_generation = _read_manifest(manifest_prefix, storage_root)
+            m['rows_out'] = len(entries)
+    except Exception as e:
+        logger.error(f"Error al leer el manifiesto '{manifest_prefix}': {e}", exc_info=True)
+        return {}
+
+    if len(segment_names) >= config.MANIFEST_COMPACTION_THRESHOLD:
+        try:
+            _write_compacted(manifest_prefix, storage_root, entries, segment_names, base_generation)
+        except Exception as e:
+            # La compactación es una optimización: si falla, la lectura sigue siendo válida
+            logger.warning(f"No se pudo compactar el manifiesto '{manifest_prefix}': {e}")
+
+    return _latest_entries(entries)
+
+def entry_partitions(entry: dict | None) -> list[str]:
+    """Particiones de clean registradas para un archivo (vacío si la entrada no las tiene)."""
+    value = (entry or {}).get('partitions') or ''
+    return [partition for partition in value.split(PARTITIONS_SEPARATOR) if partition]
+
+def load_processed_log(manifest_prefix: str, storage_root: str) -> set:
+    """
+    Carga el conjunto de archivos ya procesados desde el manifiesto.
+
+    Args:
+        manifest_prefix (str): Prefijo del manifiesto dentro del almacenamiento (ej. 'logs/manifest/fact_sales/').
+        storage_root (str): Raíz de almacenamiento (ver utils.storage).
+
+    Returns:
+        set: Rutas de archivos ya procesados. Conjunto vacío si el manifiesto no existe.
+    """
+    return set(load_manifest_entries(manifest_prefix, storage_root))
+
+def append_entries(file_paths: list[str], manifest_prefix: str, storage_root: str, sources: dict[str, dict] = None, partitions: dict[str, list[str]] = None):
+    """
+    Registra uno o más archivos procesados subiendo un único segmento nuevo.
+
+    La escritura de un objeto en GCS es atómica, así que todas las rutas del
+    segmento quedan registradas juntas o ninguna.
+
+    Args:
+        file_paths (list[str]): Rutas completas (gs://...) de los archivos procesados.
+        manifest_prefix (str): Prefijo del manifiesto dentro del almacenamiento.
+        storage_root (str): Raíz de almacenamiento (ver utils.storage).
+        sources (dict[str, dict], opcional): {ruta: objeto del listado} con la
+            generación, el tamaño y el MD5 que se leyeron (y 'duplicate_of', si aplica).
+        partitions (dict[str, list[str]], opcional): {ruta: particiones de clean donde quedaron sus filas}.
+    """
+    if not file_paths:
+        return
+
+    timestamp = datetime.now(pytz.utc)
+    sources = sources or {}
+    partitions = partitions or {}
+    entries = [
+        {
+            'processed_file_path': path,
+            'processing_timestamp_utc': timestamp.isoformat(),
+            **{col: sources[path].get(col) for col in SOURCE_COLUMNS if path in sources},
+            'partitions': PARTITIONS_SEPARATOR.join(sorted(partitions.get(path) or [])),
+        }
+        for path in file_paths
+    ]
+    segment_name = f"{_segments_prefix(manifest_prefix)}{timestamp.strftime('%Y%m%dT%H%M%S%f')}-{uuid.uuid4().hex[:12]}.csv"
+
+    try:
+        with metrics.stage('manifest_append', rows_in=len(entries)) as m:
+            content = _serialize_entries(entries)
+            storage.get_backend(storage_root).write_text(segment_name, content, 'text/csv', if_generation_match=0)
+            m['bytes_written'] = len(content)
+    except Exception as e:
+        logger.error(f"Error al registrar {len(file_paths)} archivo(s) en el manifiesto '{manifest_prefix}': {e}")
+        raise
+
+def append_to_log(file_path: str, manifest_prefix: str, storage_root: str, source: dict = None, partitions: list[str] = None):
+    """
+    Registra un archivo procesado en el manifiesto.
+
+    Args:
+        file_path (str): La ruta completa (gs://...) del archivo que fue procesado.
+        manifest_prefix (str): Prefijo del manifiesto dentro del almacenamiento.
+        storage_root (str): Raíz de almacenamiento (ver utils.storage).
+        source (dict, opcional): Objeto del listado del archivo (generación, tamaño y MD5).
+        partitions (list[str], opcional): Particiones de clean donde quedaron sus filas.
+    """
+    append_entries([file_path], manifest_prefix, storage_root, {file_path: source} if source else None, {file_path: partitions} if partitions else None)
+
+def _write_compacted(manifest_prefix: str, storage_root: str, entries: list[dict], segment_names: list[str], base_generation: int):
+    """
+    Reescribe la base con todas las entradas y elimina los segmentos ya incluidos.
+
+    La base se sube con una precondición sobre su generación: si otro proceso
+    compactó en el medio, esta compactación se descarta sin borrar nada.
+    """
+    backend = storage.get_backend(storage_root)
+
+    unique_entries = _latest_entries(entries)
+
+    try:
+        backend.write_text(
+            _base_path(manifest_prefix), _serialize_entries(list(unique_entries.values())), 'text/csv',
+            if_generation_match=base_generation
+        )
+    except storage.PreconditionFailedError:
+        logger.info(f"El manifiesto '{manifest_prefix}' fue compactado por otro proceso; se omite.")
+        return
+
+    for name in segment_names:
+        backend.delete(name)
+
+    logger.info(f"Manifiesto '{manifest_prefix}' compactado: {len(unique_entries)} entradas, {len(segment_names)} segmentos unidos.")
+
+def compact_manifest(manifest_prefix: str, storage_root: str):
+    """
+    Une todos los segmentos del manifiesto en la base, sin importar cuántos haya.
+
+    Args:
+        manifest_prefix (str): Prefijo del manifiesto dentro del almacenamiento.
+        storage_root (str): Raíz de almacenamiento (ver utils.storage).
+    """
+    entries, segment_names, base_generation = _read_manifest(manifest_prefix, storage_root)
+    if segment_names:
+        _write_compacted(manifest_prefix, storage_root, entries, segment_names, base_generation)
+
+def migrate_legacy_log(legacy_log_path: str, manifest_prefix: str, storage_root: str) -> bool:
+    """
+    Migra (una sola vez) un log CSV heredado 'logs/processed_*_log.txt' a la base del manifiesto.
+
+    La base sólo se crea si todavía no existe, por lo que llamarla en cada
+    ejecución es seguro y cuesta una única consulta de metadatos.
+
+    Args:
+        legacy_log_path (str): Ruta del log heredado dentro del almacenamiento.
+        manifest_prefix (str): Prefijo del manifiesto dentro del almacenamiento.
+        storage_root (str): Raíz de almacenamiento (ver utils.storage).
+
+    Returns:
+        bool: True si se realizó la migración en esta llamada.
+    """
+    backend = storage.get_backend(storage_root)
+    if backend.stat(_base_path(manifest_prefix)) is not None:
+        return False
+
+    legacy_content = backend.read_text(legacy_log_path)
+    if legacy_content is None:
+        return False
+
+    entries = _parse_entries(legacy_content)
+    try:
+        backend.write_text(_base_path(manifest_prefix), _serialize_entries(entries), 'text/csv', if_generation_match=0)
+    except storage.PreconditionFailedError:
+        return False
+
+    logger.info(f"Log heredado '{legacy_log_path}' migrado al manifiesto '{manifest_prefix}' ({len(entries)} entradas).")
+    return True
+
+def load_watermark(manifest_prefix: str, storage_root: str) -> str | None:
+    """
+    Lee el watermark de descubrimiento: la partición (ej. 'date=2025-07-20') a
+    partir de la cual hay que listar, porque todas las anteriores ya están
+    completamente procesadas.
+
+    Returns:
+        str | None: La partición, o None si todavía no hay watermark.
+    """
+    try:
+        content = storage.get_backend(storage_root).read_text(f"{manifest_prefix}{WATERMARK_FILE_NAME}")
+        return json.loads(content).get('partition') if content else None
+    except Exception as e:
+        logger.warning(f"No se pudo leer el watermark de '{manifest_prefix}': {e}")
+        return None
+
+def save_watermark(partition: str, manifest_prefix: str, storage_root: str):
+    """
+    Guarda el watermark de descubrimiento de una tabla de hechos.
+
+    Args:
+        partition (str): Partición desde la cual listar en la próxima ejecución (ej. 'date=2025-07-20').
+        manifest_prefix (str): Prefijo del manifiesto dentro del almacenamiento.
+        storage_root (str): Raíz de almacenamiento (ver utils.storage).
+    """
+    content = json.dumps({'partition': partition, 'updated_at': datetime.now(pytz.utc).isoformat()})
+    storage.get_backend(storage_root).write_text(f"{manifest_prefix}{WATERMARK_FILE_NAME}", content, 'application/json')
@@ -0,0 +1,323 @@
+import json
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import pytz
+
+from utils import metrics, storage
+from utils.env_config import config
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# --------------------------------------------------------------------------------
+# Gobernador de memoria
+#
+# Un archivo crudo grande procesado en memoria (lectura completa y varias copias
+# del DataFrame en el procesador) puede superar la memoria del contenedor y
+# hacer que el sistema mate el proceso entero, con todas las tareas. Antes de
+# procesar cada archivo (o micro-lote) se estima su memoria como
+#     MB en memoria ≈ factor de expansión * MB de CSV
+# y se decide cómo procesarlo:
+#
+#   in_memory  entra junto al trabajo en curso: se procesa ya, en memoria.
+#   exclusive  sólo entra solo: espera a que termine lo que está en curso y
+#              no se admite nada más mientras se procesa.
+#   streaming  no entra ni solo: se procesa por bloques de STREAMING_CHUNK_MB
+#              (ver gcp_utils.iter_csv_chunks_from_gcs), con memoria acotada.
+#
+# El gobernador es único por proceso y lo comparten todas las tareas. Un hilo
+# muestrea el RSS del proceso mientras hay archivos en curso: la admisión usa el
+# RSS real (no sólo las estimaciones) y el pico de cada archivo que corrió solo
+# ajusta el factor de expansión de su tabla, que se guarda en
+# {manifest_prefix}memory.json. El límite es MEMORY_LIMIT_MB o, si es 0, el del
+# cgroup del contenedor; sin límite conocido el gobernador no interviene. Cada
+# decisión queda en el reporte de la ejecución (ver metrics.record_memory_decision).
+# --------------------------------------------------------------------------------
+MEMORY_FILE_NAME = 'memory.json'
+
+_BYTES_PER_MB = 1024 * 1024
+_DECAY = 0.8         # Peso que conserva lo observado antes de cada nueva medición
+_PRIOR_MB = 16.0     # MB de CSV que "pesa" el factor inicial (evita ajustes inestables con archivos chicos)
+_MIN_FACTOR = 1.0
+_UNLIMITED_BYTES = 1 << 60  # cgroup v1 informa "sin límite" con un valor enorme
+
+def current_rss_mb() -> float:
+    """RSS actual del proceso (de /proc); si no está disponible, el pico (ru_maxrss)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / _BYTES_PER_MB
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _cgroup_limit_bytes() -> int | None:
+    """Límite de memoria del cgroup (v2 o v1), o None si no hay."""
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value.isdigit() and int(value) < _UNLIMITED_BYTES:
+            return int(value)
+    return None
+
+def memory_limit_mb() -> float | None:
+    """Límite de memoria del proceso en MB: MEMORY_LIMIT_MB o el del cgroup; None si no se conoce."""
+    if config.MEMORY_LIMIT_MB > 0:
+        return float(config.MEMORY_LIMIT_MB)
+    limit = _cgroup_limit_bytes()
+    return limit / _BYTES_PER_MB if limit else None
+
+class ExpansionModel:
+    """
+    Factor de expansión de una tabla: MB de RSS por MB de CSV crudo.
+
+    Es un promedio ponderado por MB con decaimiento, anclado al valor inicial de
+    la configuración. Es seguro para usar desde varios hilos.
+    """
+
+    def __init__(self, initial_factor: float, state: dict = None):
+        self.prior = initial_factor
+        self.rss_mb = float((state or {}).get('rss_mb', 0.0))
+        self.csv_mb = float((state or {}).get('csv_mb', 0.0))
+        self.observations = int((state or {}).get('observations', 0))
+        self._lock = threading.Lock()
+
+    def factor(self) -> float:
+        with self._lock:
+            return max(_MIN_FACTOR, (self.rss_mb + self.prior * _PRIOR_MB) / (self.csv_mb + _PRIOR_MB))
+
+    def estimate_mb(self, num_bytes: int) -> float:
+        """MB de memoria estimados para procesar `num_bytes` de CSV en memoria."""
+        return self.factor() * (num_bytes or 0) / _BYTES_PER_MB
+
+    def observe(self, num_bytes: int, rss_mb: float):
+        """Incorpora el aumento de RSS medido al procesar `num_bytes` de CSV."""
+        with self._lock:
+            self.rss_mb = self.rss_mb * _DECAY + max(0.0, rss_mb)
+            self.csv_mb = self.csv_mb * _DECAY + (num_bytes or 0) / _BYTES_PER_MB
+            self.observations += 1
+
+    def to_dict(self) -> dict:
+        factor = self.factor()
+        with self._lock:
+            return {'rss_mb': self.rss_mb, 'csv_mb': self.csv_mb, 'observations': self.observations, 'expansion_factor': round(factor, 3)}
+
+def load_model(manifest_prefix: str, storage_root: str) -> ExpansionModel:
+    """Factor de expansión guardado de una tabla de hechos, o el inicial si todavía no hay."""
+    state = None
+    try:
+        content = storage.get_backend(storage_root).read_text(f"{manifest_prefix}{MEMORY_FILE_NAME}")
+        state = json.loads(content).get('expansion') if content else None
+    except Exception as e:
+        logger.warning(f"No se pudo leer el factor de expansión de '{manifest_prefix}': {e}")
+    return ExpansionModel(config.MEMORY_EXPANSION_FACTOR, state)
+
+def save_model(model: ExpansionModel, manifest_prefix: str, storage_root: str):
+    """Guarda el factor de expansión de una tabla de hechos."""
+    content = json.dumps({'expansion': model.to_dict(), 'updated_at': datetime.now(pytz.utc).isoformat()}, indent=2)
+    storage.get_backend(storage_root).write_text(f"{manifest_prefix}{MEMORY_FILE_NAME}", content, 'application/json')
+
+class _Admission:
+    """Un archivo (o micro-lote) en curso: su reserva y el pico de RSS observado."""
+
+    def __init__(self, reserved_mb: float, start_rss_mb: float):
+        self.reserved_mb = reserved_mb
+        self.start_rss_mb = start_rss_mb
+        self.peak_rss_mb = start_rss_mb
+        self.alone = True
+
+class MemoryGovernor:
+    """
+    Admite archivos según la memoria disponible (ver el comentario del módulo).
+
+    Args:
+        limit_mb (float | None): Límite de memoria del proceso; None desactiva el gobernador.
+        soft_fraction (float): Parte del límite que se usa para admitir archivos.
+        sample_seconds (float): Intervalo de muestreo del RSS mientras hay archivos en curso.
+    """
+
+    def __init__(self, limit_mb: float | None, soft_fraction: float = 0.8, sample_seconds: float = 0.2):
+        self.limit_mb = limit_mb
+        self.soft_limit_mb = limit_mb * soft_fraction if limit_mb else None
+        self.sample_seconds = sample_seconds
+        self._condition = threading.Condition()
+        self._admissions = set()
+        self._exclusive = False
+        self._exclusive_waiting = 0
+        self._rss_mb = current_rss_mb()
+        self._idle_rss_mb = self._rss_mb
+        self._sampler = None
+        self._warned = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.soft_limit_mb is not None
+
+    def _reserved_mb(self) -> float:
+        return sum(admission.reserved_mb for admission in self._admissions)
+
+    def _projected_mb(self) -> float:
+        """Memoria que se considera ocupada: el RSS actual o, si es mayor, el de reposo más lo reservado."""
+        return max(self._rss_mb, self._idle_rss_mb + self._reserved_mb())
+
+    def _classify(self, estimate_mb: float, streaming_mb: float) -> str:
+        """Decisión para un archivo según la memoria disponible ahora. Requiere tener tomado el lock."""
+        if self._idle_rss_mb + estimate_mb > self.soft_limit_mb and estimate_mb > streaming_mb:
+            return 'streaming'
+        if self._admissions and self._projected_mb() + estimate_mb > self.soft_limit_mb:
+            return 'exclusive'
+        return 'in_memory'
+
+    def fits_alone(self, estimate_mb: float) -> bool:
+        """Indica si un archivo con esa estimación entra en memoria con el proceso en reposo."""
+        return not self.enabled or self._idle_rss_mb + estimate_mb <= self.soft_limit_mb
+
+    @contextmanager
+    def admit(self, label: str, num_bytes: int, model: ExpansionModel, allow_streaming: bool = True):
+        """
+        Espera a que haya memoria para procesar `num_bytes` de CSV y entrega la
+        decisión: {'mode': 'in_memory' | 'exclusive' | 'streaming', 'estimate_mb',
+        'wait_seconds', 'rss_mb', 'limit_mb'}. Con `allow_streaming=False`, un
+        archivo que no entra ni solo se procesa igual en forma exclusiva.
+
+        Si el archivo corrió solo, su pico de RSS alimenta `model`.
+        """
+        if not self.enabled:
+            yield {'mode': 'in_memory', 'estimate_mb': None, 'wait_seconds': 0.0, 'rss_mb': None, 'limit_mb': None}
+            return
+
+        estimate_mb = model.estimate_mb(num_bytes)
+        streaming_mb = model.estimate_mb(config.STREAMING_CHUNK_MB * _BYTES_PER_MB)
+        start = time.perf_counter()
+        with self._condition:
+            self._rss_mb = current_rss_mb()
+            if not self._admissions:
+                self._idle_rss_mb = self._rss_mb
+            mode = self._classify(estimate_mb, streaming_mb)
+            if mode == 'streaming' and not allow_streaming:
+                mode = 'exclusive'
+            if mode == 'exclusive':
+                # Espera a que no quede nada en curso; mientras tanto no se admite nada nuevo
+                self._exclusive_waiting += 1
+                try:
+                    self._condition.wait_for(lambda: not self._admissions)
+                finally:
+                    self._exclusive_waiting -= 1
+                self._exclusive = True
+                reserved_mb = estimate_mb
+            else:
+                reserved_mb = streaming_mb if mode == 'streaming' else estimate_mb
+                self._condition.wait_for(lambda: not self._exclusive and not self._exclusive_waiting and (
+                    not self._admissions or self._projected_mb() + reserved_mb <= self.soft_limit_mb
+                ))
+            for other in self._admissions:
+                other.alone = False
+            admission = _Admission(reserved_mb, self._rss_mb)
+            admission.alone = not self._admissions
+            self._admissions.add(admission)
+            self._ensure_sampler()
+
+        decision = {
+            'mode': mode, 'estimate_mb': round(estimate_mb, 1), 'wait_seconds': round(time.perf_counter() - start, 3),
+            'rss_mb': round(admission.start_rss_mb, 1), 'limit_mb': round(self.limit_mb, 1),
+        }
+        if mode != 'in_memory':
+            logger.info(f"Memoria: '{label}' ({(num_bytes or 0) / _BYTES_PER_MB:.1f} MB, ~{estimate_mb:.0f} MB en memoria) se procesa en modo {mode} (RSS {admission.start_rss_mb:.0f} de {self.limit_mb:.0f} MB).")
+        try:
+            yield decision
+        finally:
+            with self._condition:
+                self._sample()
+                self._admissions.discard(admission)
+                if mode == 'exclusive':
+                    self._exclusive = False
+                self._condition.notify_all()
+            decision['peak_rss_mb'] = round(admission.peak_rss_mb, 1)
+            if admission.alone and mode != 'streaming':
+                model.observe(num_bytes, admission.peak_rss_mb - admission.start_rss_mb)
+
+    def _sample(self):
+        """Actualiza el RSS actual y el pico de cada archivo en curso. Requiere tener tomado el lock."""
+        self._rss_mb = current_rss_mb()
+        for admission in self._admissions:
+            admission.peak_rss_mb = max(admission.peak_rss_mb, self._rss_mb)
+        if self._rss_mb > self.limit_mb * 0.95 and not self._warned:
+            self._warned = True
+            logger.warning(f"Memoria: el RSS ({self._rss_mb:.0f} MB) está cerca del límite ({self.limit_mb:.0f} MB).")
+
+    def _ensure_sampler(self):
+        if self._sampler is None or not self._sampler.is_alive():
+            self._sampler = threading.Thread(target=self._sample_loop, name='memory_sampler', daemon=True)
+            self._sampler.start()
+
+    def _sample_loop(self):
+        while True:
+            with self._condition:
+                if not self._admissions:
+                    self._sampler = None
+                    return
+                self._sample()
+                # El RSS cambió: los archivos en espera vuelven a evaluar si entran
+                self._condition.notify_all()
+            time.sleep(self.sample_seconds)
+
+_governor = None
+_governor_lock = threading.Lock()
+_models = {}
+
+def get_governor() -> MemoryGovernor:
+    """Devuelve (creándolo una vez) el gobernador de memoria del proceso."""
+    global _governor
+    if _governor is None:
+        with _governor_lock:
+            if _governor is None:
+                limit_mb = memory_limit_mb() if config.MEMORY_GOVERNOR else None
+                _governor = MemoryGovernor(limit_mb, config.MEMORY_SOFT_LIMIT_FRACTION, config.MEMORY_SAMPLE_SECONDS)
+                if limit_mb:
+                    logger.info(f"Gobernador de memoria activo: límite {limit_mb:.0f} MB, se admite hasta {_governor.soft_limit_mb:.0f} MB.")
+    return _governor
+
+def get_model(manifest_prefix: str) -> ExpansionModel:
+    """Factor de expansión de una tabla, leído una vez por ejecución (ver load_model)."""
+    with _governor_lock:
+        model = _models.get(manifest_prefix)
+        if model is None:
+            model = _models[manifest_prefix] = load_model(manifest_prefix, config.STORAGE_ROOT)
+        return model
+
+def save_models(manifest_prefix: str):
+    """Guarda el factor de expansión de una tabla, si se usó y se midió algo en esta ejecución."""
+    model = _models.get(manifest_prefix)
+    if model is None or not get_governor().enabled:
+        return
+    try:
+        save_model(model, manifest_prefix, config.STORAGE_ROOT)
+    except Exception as e:
+        logger.warning(f"No se pudo guardar el factor de expansión de '{manifest_prefix}': {e}")
+
+@contextmanager
+def admit(fact_name: str, label: str, num_bytes: int, manifest_prefix: str, allow_streaming: bool = True):
+    """
+    Admite un archivo (o micro-lote) en el gobernador del proceso y registra la
+    decisión en el reporte de la ejecución. Ver MemoryGovernor.admit.
+    """
+    governor = get_governor()
+    decision = None
+    try:
+        with governor.admit(label, num_bytes, get_model(manifest_prefix), allow_streaming) as decision:
+            yield decision
+    finally:
+        # Después de salir del gobernador, para que la decisión incluya el pico de RSS
+        if governor.enabled and decision is not None:
+            metrics.record_memory_decision(fact_name, label, decision)
+
+def fits_alone(num_bytes: int, manifest_prefix: str) -> bool:
+    """Indica si `num_bytes` de CSV de una tabla entran en memoria con el proceso en reposo."""
+    governor = get_governor()
+    return not governor.enabled or governor.fits_alone(get_model(manifest_prefix).estimate_mb(num_bytes))
@@ -0,0 +1,270 @@
+import functools
+import json
+import resource
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+import pytz
+
+from utils.env_config import config
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# --------------------------------------------------------------------------------
+# Instrumentación del pipeline
+#
+# Cada etapa (descubrimiento, lectura, pasos del procesador, escritura, registro
+# en el manifiesto) se mide con `stage(nombre)`: tiempo de reloj, filas de
+# entrada/salida, bytes leídos/escritos y RSS del proceso al terminar. Las
+# mediciones se acumulan por etapa y por archivo (el archivo actual se toma del
+# `file_context` del hilo) y al final de la ejecución se arma un reporte JSON.
+#
+# El costo por etapa es un perf_counter, una llamada a getrusage y una
+# actualización de diccionarios bajo un lock, por lo que puede quedar activa en
+# producción (METRICS_ENABLED).
+# --------------------------------------------------------------------------------
+_COUNTERS = ('rows_in', 'rows_out', 'bytes_read', 'bytes_written')
+
+_lock = threading.Lock()
+_local = threading.local()
+_run = {}
+_stages = {}
+_files = {}
+_tasks = {}
+_memory = {}
+
+def _now_iso() -> str:
+    return datetime.now(pytz.utc).isoformat()
+
+def reset():
+    """Descarta las mediciones acumuladas e inicia una nueva ejecución."""
+    with _lock:
+        _run.clear()
+        _run.update({'run_id': uuid.uuid4().hex[:12], 'started_at': _now_iso(), 'started': time.perf_counter()})
+        _stages.clear()
+        _files.clear()
+        _tasks.clear()
+        _memory.clear()
+
+reset()
+
+def _max_rss_mb() -> float:
+    """Pico de RSS del proceso (ru_maxrss está en KB en Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _empty_stats() -> dict:
+    return {'calls': 0, 'errors': 0, 'seconds': 0.0, 'max_seconds': 0.0, **{c: 0 for c in _COUNTERS}, 'max_rss_mb': 0.0}
+
+def _accumulate(stats: dict, counters: dict, elapsed: float, rss_mb: float, failed: bool):
+    stats['calls'] += 1
+    stats['errors'] += int(failed)
+    stats['seconds'] += elapsed
+    stats['max_seconds'] = max(stats['max_seconds'], elapsed)
+    for c in _COUNTERS:
+        stats[c] += int(counters.get(c) or 0)
+    stats['max_rss_mb'] = max(stats['max_rss_mb'], rss_mb)
+
+def _file_record(fact_name: str, file_path: str) -> dict:
+    """Registro (creado si hace falta) de un archivo. Requiere tener tomado _lock."""
+    key = (fact_name, file_path)
+    record = _files.get(key)
+    if record is None:
+        record = {'fact': fact_name, 'path': file_path, 'success': None, 'seconds': 0.0, 'stages': {}}
+        _files[key] = record
+    return record
+
+@contextmanager
+def file_context(fact_name: str, file_path: str):
+    """
+    Atribuye a un archivo las etapas que se midan dentro del bloque, en este hilo.
+
+    Puede usarse varias veces para el mismo archivo (por ejemplo, una por etapa
+    del pipeline en hilos distintos); los tiempos se suman.
+    """
+    if not config.METRICS_ENABLED:
+        yield
+        return
+
+    previous = getattr(_local, 'file', None)
+    _local.file = (fact_name, file_path)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        _local.file = previous
+        with _lock:
+            _file_record(fact_name, file_path)['seconds'] += elapsed
+
+@contextmanager
+def stage(name: str, **counters):
+    """
+    Mide una etapa. El diccionario que se entrega permite completar contadores
+    ('rows_in', 'rows_out', 'bytes_read', 'bytes_written') dentro del bloque.
+
+    Ejemplo:
+        with metrics.stage('read_csv') as m:
+            df = ...
+            m['rows_out'] = len(df)
+    """
+    if not config.METRICS_ENABLED:
+        yield counters
+        return
+
+    current_file = getattr(_local, 'file', None)
+    failed = False
+    start = time.perf_counter()
+    try:
+        yield counters
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        rss_mb = _max_rss_mb()
+        with _lock:
+            _accumulate(_stages.setdefault(name, _empty_stats()), counters, elapsed, rss_mb, failed)
+            if current_file is not None:
+                file_stats = _file_record(*current_file)['stages'].setdefault(name, _empty_stats())
+                _accumulate(file_stats, counters, elapsed, rss_mb, failed)
+
+        if config.METRICS_STAGE_LOGS:
+            line = {'stage': name, 'seconds': round(elapsed, 6), 'rss_mb': round(rss_mb, 1), 'error': failed, **counters}
+            if current_file is not None:
+                line['fact'], line['file'] = current_file
+            logger.info(f"METRICS {json.dumps(line, default=str)}")
+
+def _rows(value) -> int | None:
+    """Cantidad de filas de un DataFrame/Table, o None si no aplica."""
+    try:
+        return len(value) if hasattr(value, 'columns') else None
+    except TypeError:
+        return None
+
+def timed_step(fn):
+    """
+    Decorador para pasos de procesadores: mide el paso como una etapa
+    '{módulo}.{función}', con filas de entrada (primer argumento) y de salida.
+    """
+    name = f"{fn.__module__.rsplit('.', 1)[-1]}.{fn.__name__}"
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with stage(name) as m:
+            if args:
+                m['rows_in'] = _rows(args[0])
+            result = fn(*args, **kwargs)
+            m['rows_out'] = _rows(result)
+            return result
+    return wrapper
+
+def file_size(f) -> int | None:
+    """Tamaño de un archivo abierto (gcsfs expone `size`, Arrow `size()`), si se conoce."""
+    size = getattr(f, 'size', None)
+    try:
+        return size() if callable(size) else size
+    except Exception:
+        return None
+
+def set_file_result(fact_name: str, file_path: str, success: bool):
+    """Marca el resultado final de un archivo."""
+    if not config.METRICS_ENABLED:
+        return
+    with _lock:
+        _file_record(fact_name, file_path)['success'] = success
+
+def record_task(fact_name: str, success: bool, processed: int, failed: int, seconds: float):
+    """Registra el resultado de una tarea de hechos."""
+    with _lock:
+        _tasks[fact_name] = {
+            'success': success, 'processed': processed, 'failed': failed, 'seconds': round(seconds, 3),
+        }
+
+def record_memory_decision(fact_name: str, file_path: str, decision: dict):
+    """
+    Registra cómo decidió procesar un archivo (o micro-lote) el gobernador de
+    memoria (ver utils.memory_utils): queda en el registro del archivo y en los
+    totales de la ejecución.
+    """
+    with _lock:
+        if config.METRICS_ENABLED:
+            _file_record(fact_name, file_path)['memory'] = dict(decision)
+        _memory['limit_mb'] = decision.get('limit_mb')
+        decisions = _memory.setdefault('decisions', {})
+        decisions[decision['mode']] = decisions.get(decision['mode'], 0) + 1
+        if decision.get('fallback'):
+            fallbacks = _memory.setdefault('fallbacks', {})
+            fallbacks[decision['fallback']] = fallbacks.get(decision['fallback'], 0) + 1
+        _memory['wait_seconds'] = round(_memory.get('wait_seconds', 0.0) + (decision.get('wait_seconds') or 0.0), 3)
+        _memory['max_peak_rss_mb'] = max(_memory.get('max_peak_rss_mb', 0.0), decision.get('peak_rss_mb') or 0.0)
+
+def _rounded(stats: dict) -> dict:
+    return {k: round(v, 6) if isinstance(v, float) else v for k, v in stats.items()}
+
+def build_report() -> dict:
+    """
+    Arma el reporte de la ejecución.
+
+    Returns:
+        dict: {'run_id', 'started_at', 'finished_at', 'wall_seconds', 'max_rss_mb',
+               'tasks': {...}, 'memory': {...}, 'stages': {etapa: totales}, 'files': [{..., 'stages': {...}}]}
+    """
+    with _lock:
+        return {
+            'run_id': _run['run_id'],
+            'started_at': _run['started_at'],
+            'finished_at': _now_iso(),
+            'wall_seconds': round(time.perf_counter() - _run['started'], 3),
+            'max_rss_mb': round(_max_rss_mb(), 1),
+            'tasks': dict(_tasks),
+            'memory': dict(_memory),
+            'stages': {name: _rounded(stats) for name, stats in sorted(_stages.items())},
+            'files': [
+                {**record, 'seconds': round(record['seconds'], 6),
+                 'stages': {name: _rounded(stats) for name, stats in record['stages'].items()}}
+                for record in _files.values()
+            ],
+        }
+
+def write_report(report: dict) -> str | None:
+    """
+    Guarda el reporte como '{RUN_REPORT_PREFIX}{fecha}-{run_id}.json' en el
+    almacenamiento configurado.
+
+    Returns:
+        str | None: URI del reporte, o None si RUN_REPORT_PREFIX está vacío.
+    """
+    prefix = config.RUN_REPORT_PREFIX
+    if not prefix:
+        return None
+
+    # Import diferido: storage depende de los clientes de GCS y metrics se usa en todo el proyecto
+    from utils import storage
+
+    backend = storage.get_backend()
+    key = f"{prefix.rstrip('/')}/{datetime.now(pytz.utc).strftime('%Y%m%dT%H%M%S')}-{report['run_id']}.json"
+    backend.write_text(key, json.dumps(report, indent=2, default=str), 'application/json')
+    return backend.uri(key)
+
+def log_summary(report: dict, top: int = 8):
+    """Registra en el log las etapas que más tiempo acumularon."""
+    slowest = sorted(report['stages'].items(), key=lambda item: item[1]['seconds'], reverse=True)[:top]
+    for name, stats in slowest:
+        logger.info(
+            f"Etapa '{name}': {stats['seconds']:.2f}s en {stats['calls']} llamadas "
+            f"(máx {stats['max_seconds']:.2f}s), filas {stats['rows_in']}->{stats['rows_out']}, "
+            f"{stats['bytes_read'] / 1e6:.1f} MB leídos, {stats['bytes_written'] / 1e6:.1f} MB escritos."
+        )
+    memory = report.get('memory') or {}
+    if memory.get('decisions'):
+        decisions = ', '.join(f"{mode}: {count}" for mode, count in sorted(memory['decisions'].items()))
+        fallbacks = ', '.join(f"{mode}: {count}" for mode, count in sorted((memory.get('fallbacks') or {}).items()))
+        logger.info(
+            f"Memoria (límite {memory['limit_mb']:.0f} MB): {decisions}"
+            f"{f'; reintentos {fallbacks}' if fallbacks else ''}; {memory['wait_seconds']:.1f}s de espera, pico {memory['max_peak_rss_mb']:.0f} MB."
+        )
+    logger.info(f"Ejecución {report['run_id']}: {report['wall_seconds']:.1f}s, RSS máximo {report['max_rss_mb']:.0f} MB.")
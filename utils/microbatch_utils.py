@@ -0,0 +1,168 @@
+import hashlib
+import json
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# --------------------------------------------------------------------------------
+# Micro-lotes de archivos crudos
+#
+# Con muchos archivos pequeños por día, el costo fijo por archivo (lectura,
+# preparación del procesador, una escritura y un segmento del manifiesto)
+# domina el tiempo total. En modo micro-lote se leen varios CSV crudos, se
+# concatenan con una columna de linaje (LINEAGE_COLUMN = ruta del archivo de
+# origen de cada fila), el procesador corre una sola vez y la salida se
+# reparte en un Parquet por partición de fecha. El linaje se conserva en los
+# metadatos del Parquet (fuentes y registros de cada una, en orden) y todas las
+# fuentes del micro-lote se registran juntas en un único segmento del manifiesto.
+#
+# Con PARTITION_BY_BUSINESS_DATE, la partición de cada fila sale de su propia
+# clave de fecha de negocio (ej. start_date_key, YYYYMMDD en hora argentina) y
+# no de la partición del archivo crudo: un archivo que mezcla días (mesas que
+# cierran tarde, recargas) reparte sus filas en la partición de cada día. Las
+# filas sin fecha quedan en la partición de su archivo crudo.
+# --------------------------------------------------------------------------------
+LINEAGE_COLUMN = 'source_file'
+LINEAGE_METADATA_KEY = b'fact_processing.source_files'
+OUTPUT_FILE_PREFIX = 'microbatch-'
+
+def plan_batches(objects: list[dict], max_files: int, max_bytes: int) -> list[list[str]]:
+    """
+    Agrupa archivos en micro-lotes en orden de ruta (por lo tanto, de partición),
+    cortando al llegar a `max_files` archivos o `max_bytes` bytes.
+
+    Args:
+        objects (list[dict]): Archivos a procesar ({'path', 'size'}, como storage.list_objects).
+        max_files (int): Máximo de archivos por micro-lote.
+        max_bytes (int): Tamaño máximo de entrada por micro-lote (un archivo más grande va solo).
+
+    Returns:
+        list[list[str]]: Rutas de cada micro-lote.
+    """
+    batches = []
+    current, current_bytes = [], 0
+    for obj in sorted(objects, key=lambda o: o['path']):
+        size = obj.get('size') or 0
+        if current and (len(current) >= max_files or current_bytes + size > max_bytes):
+            batches.append(current)
+            current, current_bytes = [], 0
+        current.append(obj['path'])
+        current_bytes += size
+    if current:
+        batches.append(current)
+    return batches
+
+def _lineage_array(path: str, rows: int) -> pa.DictionaryArray:
+    """Columna de linaje diccionarizada: una única cadena por archivo, sin repetirla por fila."""
+    return pa.DictionaryArray.from_arrays(pa.array(np.zeros(rows, dtype=np.int32)), pa.array([path]))
+
+def with_lineage(data: pa.Table, path: str) -> pa.Table:
+    """Agrega LINEAGE_COLUMN a los datos de un único archivo de origen."""
+    return data.append_column(LINEAGE_COLUMN, _lineage_array(path, data.num_rows))
+
+def concat_with_lineage(frames: list[tuple[str, pd.DataFrame | pa.Table]]) -> pd.DataFrame | pa.Table:
+    """
+    Concatena los datos crudos de varios archivos agregando LINEAGE_COLUMN.
+
+    Las columnas que falten en algún archivo quedan nulas en sus filas.
+
+    Args:
+        frames (list[tuple[str, pd.DataFrame | pa.Table]]): (ruta de origen, datos) en orden.
+
+    Returns:
+        pd.DataFrame | pa.Table: Del mismo tipo que los datos de entrada.
+    """
+    if isinstance(frames[0][1], pa.Table):
+        tables = [data.append_column(LINEAGE_COLUMN, _lineage_array(path, data.num_rows)) for path, data in frames]
+        return pa.concat_tables(tables, promote_options='permissive')
+
+    parts = [data.assign(**{LINEAGE_COLUMN: path}) for path, data in frames]
+    df = pd.concat(parts, ignore_index=True)
+    df[LINEAGE_COLUMN] = pd.Categorical(df[LINEAGE_COLUMN], categories=[path for path, _ in frames])
+    return df
+
+def output_name(source_paths: list[str]) -> str:
+    """
+    Nombre del Parquet de un micro-lote en una partición, derivado de sus
+    fuentes: reintentar el mismo micro-lote sobrescribe el mismo archivo.
+    """
+    digest = hashlib.sha1('\n'.join(sorted(source_paths)).encode()).hexdigest()[:16]
+    return f"{OUTPUT_FILE_PREFIX}{digest}.parquet"
+
+def split_by_partition(table: pa.Table, partition_of: Callable[[str], str]) -> dict[str, tuple[pa.Table, list[str]]]:
+    """
+    Reparte la salida del procesador por partición según el archivo de origen de
+    cada fila, quita LINEAGE_COLUMN y deja el linaje en los metadatos del esquema
+    ([[ruta, registros], ...] en orden de aparición).
+
+    Args:
+        table (pa.Table): Salida del procesador, con LINEAGE_COLUMN.
+        partition_of (Callable[[str], str]): Ruta de origen -> partición ('date=YYYY-MM-DD').
+
+    Returns:
+        dict[str, tuple[pa.Table, list[str]]]: {partición: (tabla, rutas de origen)}
+    """
+    lineage = table[LINEAGE_COLUMN].cast(pa.string())
+    data = table.drop_columns([LINEAGE_COLUMN])
+
+    counts = pc.value_counts(lineage).to_pylist()
+    sources_by_partition = {}
+    for item in counts:
+        sources_by_partition.setdefault(partition_of(item['values']), []).append((item['values'], item['counts']))
+
+    outputs = {}
+    for partition, sources in sources_by_partition.items():
+        paths = [path for path, _ in sources]
+        part = data if len(sources_by_partition) == 1 else data.filter(pc.is_in(lineage, value_set=pa.array(paths)))
+        metadata = {**(part.schema.metadata or {}), LINEAGE_METADATA_KEY: json.dumps([list(s) for s in sources]).encode()}
+        outputs[partition] = (part.replace_schema_metadata(metadata), paths)
+    return outputs
+
+def date_key_partition(date_key: int) -> str:
+    """Partición de clean ('date=YYYY-MM-DD') de una clave de fecha YYYYMMDD."""
+    return f"date={date_key // 10000:04d}-{date_key // 100 % 100:02d}-{date_key % 100:02d}"
+
+def _partition_date_key(partition: str) -> int:
+    return int(partition.replace('date=', '').replace('-', ''))
+
+def split_by_date_key(table: pa.Table, date_key_column: str, partition_of: Callable[[str], str]) -> dict[str, tuple[pa.Table, list[str]]]:
+    """
+    Como split_by_partition, pero la partición de cada fila es la de su clave de
+    fecha de negocio (`date_key_column`, YYYYMMDD); las filas sin fecha van a la
+    partición de su archivo de origen.
+
+    Es una sola pasada: las filas se ordenan por partición con un orden estable
+    (se conserva el orden original dentro de cada una) y cada partición es un
+    corte sin copia de la tabla ordenada.
+
+    Args:
+        table (pa.Table): Salida del procesador, con LINEAGE_COLUMN y `date_key_column`.
+        date_key_column (str): Columna con la clave de fecha de cada fila.
+        partition_of (Callable[[str], str]): Ruta de origen -> partición ('date=YYYY-MM-DD').
+
+    Returns:
+        dict[str, tuple[pa.Table, list[str]]]: {partición: (tabla, rutas de origen)}, en orden de fecha.
+    """
+    lineage = table[LINEAGE_COLUMN].cast(pa.string()).combine_chunks().dictionary_encode()
+    fallback = pa.array([_partition_date_key(partition_of(path)) for path in lineage.dictionary.to_pylist()], type=pa.int64())
+    keys = pc.coalesce(table[date_key_column].combine_chunks().cast(pa.int64()), fallback.take(lineage.indices))
+    data = table.drop_columns([LINEAGE_COLUMN])
+
+    runs = pc.value_counts(keys).to_pylist()
+    if len(runs) > 1:
+        order = pc.sort_indices(keys)
+        data, keys, lineage = data.take(order), keys.take(order), lineage.take(order)
+        runs = pc.value_counts(keys).to_pylist()
+
+    outputs = {}
+    offset = 0
+    for run in runs:
+        part = data.slice(offset, run['counts'])
+        sources = [(item['values'], item['counts']) for item in pc.value_counts(lineage.slice(offset, run['counts']).dictionary_decode()).to_pylist()]
+        metadata = {**(part.schema.metadata or {}), LINEAGE_METADATA_KEY: json.dumps([list(s) for s in sources]).encode()}
+        outputs[date_key_partition(run['values'])] = (part.replace_schema_metadata(metadata), [path for path, _ in sources])
+        offset += run['counts']
+    return outputs
@@ -0,0 +1,116 @@
+import json
+from functools import lru_cache
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from utils.env_config import config
+
+# --------------------------------------------------------------------------------
+# Perfiles de escritura de Parquet
+#
+# Un perfil fija cómo se escribe el Parquet de una tabla de hechos: códec y
+# nivel de compresión, columnas con codificación de diccionario (conviene
+# limitarla a las de baja cardinalidad: en claves únicas y montos el
+# diccionario crece hasta su límite, se abandona y sólo agrega costo), codificación
+# explícita de otras columnas (DELTA_BINARY_PACKED para claves), registros por
+# row group, estadísticas (por column chunk y por página, en el page index) y
+# orden de las filas. Ordenar por las columnas que filtran los lectores (fecha y
+# clave) hace que los mínimos/máximos de cada row group y página sean estrechos
+# y que BigQuery/Spark/pyarrow.dataset descarten la mayor parte del archivo.
+#
+# El perfil de una tabla se arma en capas, de menor a mayor prioridad:
+#   1. los valores por defecto de la configuración (PARQUET_*),
+#   2. WRITE_PROFILE del módulo procesador,
+#   3. PARQUET_WRITE_PROFILES (JSON {tabla: {clave: valor}}), para ajustar en
+#      producción sin cambiar código.
+# --------------------------------------------------------------------------------
+PROFILE_KEYS = (
+    'compression',        # 'zstd', 'snappy', 'gzip', 'lz4', 'brotli' o 'none'
+    'compression_level',  # Nivel del códec (None = el del códec)
+    'use_dictionary',     # True, False o lista de columnas
+    'column_encoding',    # {columna: codificación}, para columnas sin diccionario
+    'row_group_size',     # Máximo de registros por row group
+    'write_statistics',   # Mínimo/máximo/nulos por column chunk y por página
+    'write_page_index',   # Índice de páginas (column/offset index) en el footer
+    'sort_by',            # Columnas por las que se ordenan las filas (ascendente, nulos al final)
+)
+
+def default_profile() -> dict:
+    """Perfil por defecto según la configuración (variables PARQUET_*)."""
+    return {
+        'compression': config.PARQUET_COMPRESSION,
+        'compression_level': config.PARQUET_COMPRESSION_LEVEL,
+        'use_dictionary': True,
+        'column_encoding': {},
+        'row_group_size': config.PARQUET_ROW_GROUP_ROWS,
+        'write_statistics': True,
+        'write_page_index': config.PARQUET_PAGE_INDEX,
+        'sort_by': [],
+    }
+
+@lru_cache(maxsize=4)
+def _configured_overrides(raw: str) -> dict:
+    overrides = json.loads(raw) if raw else {}
+    if not isinstance(overrides, dict) or not all(isinstance(v, dict) for v in overrides.values()):
+        raise ValueError("PARQUET_WRITE_PROFILES debe ser un JSON {tabla: {clave: valor}}.")
+    return overrides
+
+def _merge(profile: dict, overrides: dict, origin: str) -> dict:
+    unknown = set(overrides) - set(PROFILE_KEYS)
+    if unknown:
+        raise ValueError(f"Claves desconocidas en el perfil de escritura de {origin}: {sorted(unknown)}")
+    return {**profile, **overrides}
+
+def resolve(fact_name: str, processor=None) -> dict:
+    """
+    Perfil de escritura de una tabla de hechos.
+
+    Args:
+        fact_name (str): Nombre de la tabla de hechos (ej. 'sales').
+        processor: Módulo procesador; se usa su WRITE_PROFILE, si lo declara.
+
+    Returns:
+        dict: Perfil completo (todas las claves de PROFILE_KEYS).
+    """
+    profile = _merge(default_profile(), getattr(processor, 'WRITE_PROFILE', None) or {}, getattr(processor, '__name__', fact_name))
+    overrides = _configured_overrides(config.PARQUET_WRITE_PROFILES).get(fact_name, {})
+    return _merge(profile, overrides, f"PARQUET_WRITE_PROFILES['{fact_name}']")
+
+def sort_table(table: pa.Table, profile: dict) -> pa.Table:
+    """Ordena la tabla por las columnas `sort_by` del perfil que existan en ella."""
+    keys = [col for col in profile.get('sort_by') or [] if col in table.column_names]
+    if not keys or table.num_rows < 2:
+        return table
+    return table.sort_by([(col, 'ascending') for col in keys])
+
+def writer_options(profile: dict, schema: pa.Schema) -> dict:
+    """
+    Argumentos para pq.write_table / pq.ParquetWriter según el perfil
+    (sin row_group_size, que se pasa al escribir cada tabla).
+    """
+    dictionary_fields = {field.name for field in schema if pa.types.is_dictionary(field.type)}
+    # Las columnas que ya son diccionario de Arrow se escriben siempre como diccionario
+    column_encoding = {
+        col: encoding for col, encoding in (profile.get('column_encoding') or {}).items()
+        if col in schema.names and col not in dictionary_fields
+    }
+
+    use_dictionary = profile['use_dictionary']
+    if use_dictionary is True and column_encoding:
+        use_dictionary = [col for col in schema.names if col not in column_encoding]
+    if isinstance(use_dictionary, (list, tuple)):
+        use_dictionary = sorted(
+            ({col for col in use_dictionary if col in schema.names} - set(column_encoding)) | dictionary_fields
+        )
+
+    sort_keys = [col for col in profile.get('sort_by') or [] if col in schema.names]
+    return {
+        'compression': profile['compression'],
+        'compression_level': profile['compression_level'],
+        'use_dictionary': use_dictionary,
+        'column_encoding': column_encoding or None,
+        'write_statistics': profile['write_statistics'],
+        'write_page_index': profile['write_page_index'],
+        'sorting_columns': pq.SortingColumn.from_ordering(schema, [(col, 'ascending') for col in sort_keys]) if sort_keys else None,
+    }
@@ -0,0 +1,147 @@
+import queue
+import threading
+from typing import Callable, Iterable
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# --------------------------------------------------------------------------------
+# Pipeline por etapas: lectura -> transformación -> escritura -> registro
+#
+# Cada etapa corre en su propio hilo y se comunica con la siguiente mediante
+# colas acotadas: mientras se transforma el archivo N, el lector ya descarga el
+# N+1 y el escritor sube el N-1. Como las colas tienen tamaño máximo, una etapa
+# lenta frena a las anteriores (backpressure) y la cantidad de DataFrames en
+# memoria queda limitada a (2 * queue_size + 3).
+# --------------------------------------------------------------------------------
+_END = object()
+
+def run_staged_pipeline(
+    items: Iterable,
+    read_fn: Callable,
+    transform_fn: Callable,
+    write_fn: Callable,
+    commit_fn: Callable,
+    queue_size: int = 2,
+    slots: threading.Semaphore = None,
+) -> dict:
+    """
+    Ejecuta read_fn -> transform_fn -> write_fn -> commit_fn para cada elemento,
+    solapando las etapas de elementos distintos.
+
+    Los errores se aíslan por elemento: si una etapa falla, ese elemento se
+    descarta, las demás continúan y commit_fn nunca se llama para él. Un error
+    fuera de las funciones de un elemento (ej. al obtener el siguiente de
+    `items`) detiene el pipeline: las etapas siguientes terminan lo que ya
+    recibieron, los elementos en cola se descartan y el error se propaga.
+
+    Args:
+        items (Iterable): Elementos a procesar (ej. rutas de archivos), en orden; se consumen a medida que el lector tiene lugar.
+        read_fn (Callable): read_fn(item) -> datos crudos.
+        transform_fn (Callable): transform_fn(item, datos crudos) -> datos procesados.
+        write_fn (Callable): write_fn(item, datos procesados) -> None.
+        commit_fn (Callable): commit_fn(item) -> None; se llama sólo tras una escritura exitosa.
+        queue_size (int): Capacidad de cada cola entre etapas.
+        slots (threading.Semaphore, opcional): Tope compartido de elementos en vuelo;
+            se toma antes de leer y se libera al terminar el elemento.
+
+    Returns:
+        dict: {item: True si se completó (incluido el registro), False si falló}.
+
+    Raises:
+        Exception: El primer error que detuvo una etapa.
+    """
+    read_queue = queue.Queue(maxsize=max(1, queue_size))
+    write_queue = queue.Queue(maxsize=max(1, queue_size))
+    results = {}
+    results_lock = threading.Lock()
+    errors = []
+
+    def _finish(item, success: bool, stage: str = None, error: Exception = None):
+        if error is not None:
+            logger.error(f"ERROR en la etapa de {stage} de '{item}': {error}", exc_info=error)
+        with results_lock:
+            results[item] = success
+        if slots is not None:
+            slots.release()
+
+    def _stopped(stage: str, error: BaseException):
+        logger.error(f"ERROR: la etapa de {stage} del pipeline se detuvo: {error}", exc_info=error)
+        errors.append(error)
+
+    def _drain(source: queue.Queue, stage: str):
+        """Descarta lo que queda en una cola tras detenerse la etapa que la consume."""
+        while (entry := source.get()) is not _END:
+            _finish(entry[0], False, stage)
+
+    def _reader():
+        try:
+            for item in items:
+                if slots is not None:
+                    slots.acquire()
+                try:
+                    data = read_fn(item)
+                except Exception as e:
+                    _finish(item, False, 'lectura', e)
+                    continue
+                read_queue.put((item, data))
+        except BaseException as e:
+            _stopped('lectura', e)
+        finally:
+            read_queue.put(_END)
+
+    def _transformer():
+        try:
+            while True:
+                entry = read_queue.get()
+                if entry is _END:
+                    break
+                item, data = entry
+                try:
+                    result = transform_fn(item, data)
+                except Exception as e:
+                    _finish(item, False, 'transformación', e)
+                    continue
+                finally:
+                    del data
+                write_queue.put((item, result))
+        except BaseException as e:
+            _stopped('transformación', e)
+            _drain(read_queue, 'transformación')
+        finally:
+            write_queue.put(_END)
+
+    def _writer():
+        try:
+            while True:
+                entry = write_queue.get()
+                if entry is _END:
+                    break
+                item, result = entry
+                try:
+                    write_fn(item, result)
+                    commit_fn(item)
+                except Exception as e:
+                    _finish(item, False, 'escritura', e)
+                    continue
+                finally:
+                    del result
+                _finish(item, True)
+        except BaseException as e:
+            _stopped('escritura', e)
+            _drain(write_queue, 'escritura')
+
+    threads = [
+        threading.Thread(target=_reader, name="pipeline-reader", daemon=True),
+        threading.Thread(target=_transformer, name="pipeline-transform", daemon=True),
+        threading.Thread(target=_writer, name="pipeline-writer", daemon=True),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise errors[0]
+    return results
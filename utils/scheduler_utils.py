@@ -0,0 +1,221 @@
+import json
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Callable
+
+import pytz
+
+from utils import storage
+from utils.env_config import config
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# --------------------------------------------------------------------------------
+# Planificación de archivos con presupuesto de tiempo
+#
+# En lugar de tomar una cantidad fija de archivos por ejecución, se admiten
+# unidades de trabajo (un archivo o un micro-lote) mientras su costo estimado
+# entre en el tiempo que queda hasta el límite de la ejecución. Una unidad que
+# no entra se deja para la próxima ejecución (no se corta a mitad de camino), y
+# se sigue probando con las siguientes por si alguna más chica entra. Mientras
+# un modo no tiene observaciones, su primera unidad se admite igual (si queda
+# tiempo) para medirla: con sólo los valores iniciales, una tabla podría no
+# admitir nunca nada.
+#
+# El costo de una unidad se estima como
+#     segundos ≈ costo_fijo * archivos + segundos_por_MB * MB
+# con coeficientes ajustados por mínimos cuadrados sobre las unidades recientes
+# (con decaimiento, para seguir cambios de throughput) y anclados a los valores
+# iniciales de la configuración. El modelo se guarda por tabla y por modo de
+# procesamiento en {manifest_prefix}throughput.json.
+# --------------------------------------------------------------------------------
+THROUGHPUT_FILE_NAME = 'throughput.json'
+ORDERS = ('oldest', 'smallest')
+
+_BYTES_PER_MB = 1024 * 1024
+_DECAY = 0.8         # Peso que conserva lo observado antes de cada nueva unidad
+_PRIOR_WEIGHT = 0.5  # Peso de los valores iniciales (evita ajustes inestables con pocos datos)
+
+def order_files(objects: list[dict], order: str) -> list[dict]:
+    """
+    Ordena los archivos pendientes.
+
+    Args:
+        objects (list[dict]): Archivos ({'path', 'size'}, como storage.list_objects).
+        order (str): 'oldest' (partición más antigua primero) o 'smallest' (más chico primero).
+
+    Returns:
+        list[dict]: Los mismos archivos, en el orden en que se intentan procesar.
+    """
+    if order not in ORDERS:
+        raise ValueError(f"Orden de planificación desconocido: '{order}'. Opciones: {', '.join(ORDERS)}.")
+    if order == 'smallest':
+        return sorted(objects, key=lambda o: (o.get('size') or 0, o['path']))
+    # Las rutas incluyen 'date=YYYY-MM-DD', por lo que el orden lexicográfico es cronológico
+    return sorted(objects, key=lambda o: o['path'])
+
+class CostModel:
+    """
+    Estimador de segundos por unidad de trabajo a partir de archivos y bytes.
+
+    Acumula sumas ponderadas de las observaciones y resuelve el sistema de 2x2
+    de mínimos cuadrados en cada estimación. Es seguro para usar desde varios hilos.
+    """
+    _SUMS = ('ff', 'fm', 'mm', 'fs', 'ms')
+
+    def __init__(self, overhead_seconds: float, seconds_per_mb: float, state: dict = None):
+        self.prior = (overhead_seconds, seconds_per_mb)
+        self.sums = {key: float((state or {}).get(key, 0.0)) for key in self._SUMS}
+        self.observations = int((state or {}).get('observations', 0))
+        self._lock = threading.Lock()
+
+    def coefficients(self) -> tuple[float, float]:
+        """(segundos fijos por archivo, segundos por MB)."""
+        with self._lock:
+            s = dict(self.sums)
+        prior_overhead, prior_per_mb = self.prior
+        # Los valores iniciales cuentan como dos observaciones: (1 archivo, 0 MB) y (0 archivos, 1 MB)
+        ff, mm, fm = s['ff'] + _PRIOR_WEIGHT, s['mm'] + _PRIOR_WEIGHT, s['fm']
+        fs, ms = s['fs'] + _PRIOR_WEIGHT * prior_overhead, s['ms'] + _PRIOR_WEIGHT * prior_per_mb
+        det = ff * mm - fm * fm
+        overhead, per_mb = (fs * mm - ms * fm) / det, (ms * ff - fs * fm) / det
+        if overhead < 0:
+            overhead, per_mb = 0.0, ms / mm
+        elif per_mb < 0:
+            overhead, per_mb = fs / ff, 0.0
+        return overhead, per_mb
+
+    def estimate(self, num_bytes: int, files: int = 1) -> float:
+        """Segundos estimados para procesar `files` archivos que suman `num_bytes`."""
+        overhead, per_mb = self.coefficients()
+        return overhead * files + per_mb * (num_bytes or 0) / _BYTES_PER_MB
+
+    def observe(self, num_bytes: int, files: int, seconds: float):
+        """Incorpora la duración medida de una unidad."""
+        mb = (num_bytes or 0) / _BYTES_PER_MB
+        with self._lock:
+            for key in self._SUMS:
+                self.sums[key] *= _DECAY
+            self.sums['ff'] += files * files
+            self.sums['fm'] += files * mb
+            self.sums['mm'] += mb * mb
+            self.sums['fs'] += files * seconds
+            self.sums['ms'] += mb * seconds
+            self.observations += 1
+
+    def to_dict(self) -> dict:
+        overhead, per_mb = self.coefficients()
+        with self._lock:
+            return {**self.sums, 'observations': self.observations,
+                    'overhead_seconds': round(overhead, 4), 'seconds_per_mb': round(per_mb, 4)}
+
+def load_models(manifest_prefix: str, storage_root: str) -> dict:
+    """
+    Lee el estado guardado de los modelos de costo de una tabla de hechos.
+
+    Returns:
+        dict: {modo: estado} (vacío si todavía no hay o no se pudo leer).
+    """
+    try:
+        content = storage.get_backend(storage_root).read_text(f"{manifest_prefix}{THROUGHPUT_FILE_NAME}")
+        return json.loads(content).get('models', {}) if content else {}
+    except Exception as e:
+        logger.warning(f"No se pudo leer el throughput observado de '{manifest_prefix}': {e}")
+        return {}
+
+def get_model(states: dict, mode: str) -> CostModel:
+    """Modelo de costo de un modo de procesamiento, con los valores iniciales de la configuración."""
+    return CostModel(config.SCHEDULER_FILE_OVERHEAD_SECONDS, config.SCHEDULER_SECONDS_PER_MB, states.get(mode))
+
+def save_model(model: CostModel, mode: str, manifest_prefix: str, storage_root: str):
+    """Guarda el modelo de un modo junto con los del resto de los modos de la tabla."""
+    states = load_models(manifest_prefix, storage_root)
+    states[mode] = model.to_dict()
+    content = json.dumps({'models': states, 'updated_at': datetime.now(pytz.utc).isoformat()}, indent=2)
+    storage.get_backend(storage_root).write_text(f"{manifest_prefix}{THROUGHPUT_FILE_NAME}", content, 'application/json')
+
+def fits(model: CostModel, num_bytes: int, files: int, deadline: float | None, ahead: int = 0) -> bool:
+    """
+    Indica si una unidad que empieza ahora termina antes de `deadline`
+    (time.monotonic()), contando `ahead` unidades similares que deben terminar antes.
+    """
+    if deadline is None:
+        return True
+    return time.monotonic() + model.estimate(num_bytes, files) * (1 + ahead) <= deadline
+
+def should_explore(model: CostModel, deadline: float | None, admitted: int) -> bool:
+    """Admitir una unidad aunque no entre: el modo todavía no tiene mediciones y no se admitió ninguna."""
+    return deadline is not None and admitted == 0 and model.observations == 0 and time.monotonic() < deadline
+
+def run_within_budget(units: list[dict], run_unit: Callable, max_workers: int, model: CostModel, deadline: float | None, slots: threading.Semaphore = None, thread_name_prefix: str = 'unit') -> tuple[dict, list[dict]]:
+    """
+    Ejecuta unidades de trabajo en paralelo admitiendo cada una sólo si su costo
+    estimado entra antes de `deadline`. La duración de cada unidad (desde que
+    empieza a ejecutarse, sin la espera por el tope global `slots`) alimenta el modelo.
+
+    Como la espera por `slots` (compartido con otras tareas) no se conoce al
+    admitir, cada unidad se vuelve a evaluar al obtener su lugar: si ya no entra,
+    lo libera sin ejecutarse y queda como no admitida.
+
+    Args:
+        units (list[dict]): Unidades en orden de prioridad: {'items': [rutas], 'bytes': int}.
+        run_unit (Callable): run_unit(items) -> {ruta: bool}.
+        max_workers (int): Unidades en ejecución simultánea.
+        model (CostModel): Estimador de costo.
+        deadline (float | None): Límite en time.monotonic(); None para procesar todo.
+        slots (threading.Semaphore, opcional): Tope global de unidades en ejecución, compartido entre tareas.
+        thread_name_prefix (str): Prefijo de los hilos del pool.
+
+    Returns:
+        tuple[dict, list[dict]]: ({ruta: bool} de las unidades ejecutadas, unidades no admitidas).
+    """
+    def _timed(unit, explore):
+        if slots is not None:
+            slots.acquire()
+        try:
+            # Una unidad de exploración sólo necesita que quede tiempo: su costo todavía no se conoce
+            still_fits = time.monotonic() < deadline if explore else fits(model, unit['bytes'], len(unit['items']), deadline)
+            if not still_fits:
+                return None
+            start = time.perf_counter()
+            result = run_unit(unit['items'])
+            model.observe(unit['bytes'], len(unit['items']), time.perf_counter() - start)
+            return result
+        finally:
+            if slots is not None:
+                slots.release()
+
+    pending = list(units)
+    results = {}
+    in_flight = {}
+    late = []
+    admitted = 0
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix) as executor:
+        while pending or in_flight:
+            while pending and len(in_flight) < max_workers:
+                index = next((i for i, unit in enumerate(pending) if fits(model, unit['bytes'], len(unit['items']), deadline)), None)
+                explore = index is None and should_explore(model, deadline, admitted)
+                if explore:
+                    index = 0
+                if index is None:
+                    break
+                unit = pending.pop(index)
+                in_flight[executor.submit(_timed, unit, explore)] = unit
+                admitted += 1
+            if not in_flight:
+                break
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                unit = in_flight.pop(future)
+                result = future.result()
+                if result is None:
+                    late.append(unit)
+                else:
+                    results.update(result)
+
+    # Las unidades que no entraron al obtener su lugar vuelven, en su orden de prioridad, con las no admitidas
+    priority = {id(unit): i for i, unit in enumerate(units)}
+    return results, sorted(pending + late, key=lambda unit: priority[id(unit)])
@@ -0,0 +1,433 @@
+import base64
+import hashlib
+import os
+import threading
+import uuid
+from typing import Iterator
+
+from utils import metrics
+from utils.env_config import config
+from utils.gcs_clients import get_gcsfs, get_storage_client
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# --------------------------------------------------------------------------------
+# Backends de almacenamiento
+#
+# Toda la E/S del pipeline (listado, lectura de CSV/Parquet, escritura de Parquet
+# y objetos del manifiesto) pasa por un backend elegido según el esquema de la
+# raíz de almacenamiento:
+#
+#   gs://bucket          -> GCSBackend (google-cloud-storage + gcsfs)
+#   file:///ruta, /ruta  -> LocalBackend (disco local o volumen montado)
+#
+# Las rutas que maneja el pipeline son URIs completas dentro de la raíz
+# ('gs://bucket/raw/...' o '/mnt/dump/raw/...'); las operaciones de objetos
+# (manifiesto, compactación) reciben claves relativas a la raíz ('logs/...').
+# STORAGE_ROOT elige la raíz; por defecto es gs://{GCS_BUCKET_NAME}.
+#
+# Los listados incluyen 'md5' (base64 del MD5 del contenido, como GCS) cuando
+# el almacenamiento lo conoce sin leer el objeto; si no, es None y
+# `content_hash` lo calcula leyendo el objeto.
+#
+# pyarrow y las excepciones de google-api-core se importan donde se usan, para
+# que listar y leer el manifiesto no cargue las bibliotecas de datos.
+# --------------------------------------------------------------------------------
+_HASH_READ_BYTES = 8 * 1024 * 1024
+
+class PreconditionFailedError(Exception):
+    """La generación del objeto no coincide con la esperada (otro proceso lo modificó)."""
+
+class StorageBackend:
+    """Interfaz común de los backends. Las claves son relativas a `root`."""
+
+    root: str
+
+    def uri(self, key: str) -> str:
+        """URI completa de una clave."""
+        return f"{self.root}/{key}"
+
+    def key(self, uri: str) -> str:
+        """Clave relativa a la raíz de una URI completa."""
+        return uri[len(self.root) + 1:] if uri.startswith(f"{self.root}/") else uri
+
+    def list(self, prefix: str, start_offset: str = None, suffix: str = None) -> list[dict]:
+        """
+        Lista objetos bajo `prefix` en orden lexicográfico.
+
+        Args:
+            prefix (str): Prefijo de las claves a listar (ej. 'raw/fact_sales/').
+            start_offset (str, opcional): Clave desde la cual listar; las anteriores no se recorren.
+            suffix (str, opcional): Sólo devolver claves que terminen con este sufijo.
+
+        Returns:
+            list[dict]: [{'path': URI completa, 'key', 'size': int, 'generation': int, 'md5': str | None}, ...]
+        """
+        raise NotImplementedError
+
+    def open_input(self, uri: str):
+        """Abre un objeto para lectura binaria con soporte de seek."""
+        raise NotImplementedError
+
+    def open_output(self, uri: str):
+        """
+        Abre un objeto para escritura binaria. El objeto sólo se publica al cerrar
+        el archivo; `discard()` cancela la escritura sin publicar nada.
+        """
+        raise NotImplementedError
+
+    def stat(self, key: str) -> dict | None:
+        """{'size', 'generation'} del objeto (y 'md5', si el backend lo conoce sin leerlo), o None si no existe."""
+        raise NotImplementedError
+
+    def read_text(self, key: str) -> str | None:
+        """Contenido del objeto como texto, o None si no existe."""
+        raise NotImplementedError
+
+    def write_text(self, key: str, content: str, content_type: str = 'text/plain', if_generation_match: int = None):
+        """
+        Escribe un objeto de texto completo.
+
+        Args:
+            if_generation_match (int, opcional): Generación esperada del objeto actual
+                (0 = sólo si no existe). Si no coincide, lanza PreconditionFailedError.
+        """
+        raise NotImplementedError
+
+    def delete(self, key: str, if_generation_match: int = None):
+        """
+        Elimina un objeto; no falla si ya no existe.
+
+        Args:
+            if_generation_match (int, opcional): Generación esperada del objeto. Si
+                otro proceso lo reescribió, lanza PreconditionFailedError y no lo elimina.
+        """
+        raise NotImplementedError
+
+    def copy(self, source_key: str, destination_key: str):
+        """Copia un objeto dentro de la misma raíz."""
+        raise NotImplementedError
+
+    def content_hash(self, key: str) -> str | None:
+        """MD5 del contenido en base64 (el formato de GCS), o None si el objeto no existe."""
+        digest = hashlib.md5()
+        try:
+            with self.open_input(self.uri(key)) as f:
+                while chunk := f.read(_HASH_READ_BYTES):
+                    digest.update(chunk)
+        except FileNotFoundError:
+            return None
+        return base64.b64encode(digest.digest()).decode('ascii')
+
+class GCSBackend(StorageBackend):
+    """Backend sobre un bucket de GCS, con los clientes compartidos de gcs_clients."""
+
+    def __init__(self, bucket_name: str):
+        self.bucket_name = bucket_name
+        self.root = f"gs://{bucket_name}"
+
+    def _bucket(self):
+        return get_storage_client().bucket(self.bucket_name)
+
+    def list(self, prefix: str, start_offset: str = None, suffix: str = None) -> list[dict]:
+        objects = []
+        blobs = get_storage_client().list_blobs(self.bucket_name, prefix=prefix, start_offset=start_offset, page_size=1000)
+        for blob in blobs:
+            if suffix and not blob.name.endswith(suffix):
+                continue
+            objects.append({
+                'path': self.uri(blob.name),
+                'key': blob.name,
+                'size': blob.size or 0,
+                'generation': blob.generation,
+                'md5': blob.md5_hash,
+            })
+        return objects
+
+    def open_input(self, uri: str):
+        return get_gcsfs().open(uri, 'rb')
+
+    def open_output(self, uri: str):
+        return get_gcsfs().open(uri, 'wb')
+
+    def stat(self, key: str) -> dict | None:
+        blob = self._bucket().get_blob(key)
+        if blob is None:
+            return None
+        return {'size': blob.size or 0, 'generation': blob.generation, 'md5': blob.md5_hash}
+
+    def read_text(self, key: str) -> str | None:
+        from google.api_core import exceptions as gcs_exceptions
+        try:
+            return self._bucket().blob(key).download_as_text()
+        except gcs_exceptions.NotFound:
+            return None
+
+    def write_text(self, key: str, content: str, content_type: str = 'text/plain', if_generation_match: int = None):
+        from google.api_core import exceptions as gcs_exceptions
+        try:
+            self._bucket().blob(key).upload_from_string(content, content_type, if_generation_match=if_generation_match)
+        except gcs_exceptions.PreconditionFailed as e:
+            raise PreconditionFailedError(str(e)) from e
+
+    def delete(self, key: str, if_generation_match: int = None):
+        from google.api_core import exceptions as gcs_exceptions
+        try:
+            self._bucket().blob(key).delete(if_generation_match=if_generation_match)
+        except gcs_exceptions.NotFound:
+            pass
+        except gcs_exceptions.PreconditionFailed as e:
+            raise PreconditionFailedError(str(e)) from e
+
+    def copy(self, source_key: str, destination_key: str):
+        bucket = self._bucket()
+        bucket.copy_blob(bucket.blob(source_key), bucket, destination_key)
+
+    def content_hash(self, key: str) -> str | None:
+        blob = self._bucket().get_blob(key)
+        if blob is None:
+            return None
+        # Los objetos compuestos no tienen MD5 en sus metadatos: se calcula leyéndolos
+        return blob.md5_hash or super().content_hash(key)
+
+class _AtomicLocalFile:
+    """
+    Archivo de escritura local que se publica con un rename atómico al cerrarlo,
+    como un objeto de GCS: los lectores nunca ven un archivo a medio escribir.
+    """
+
+    def __init__(self, path: str):
+        directory, name = os.path.split(path)
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        # Prefijo '.' para que los listados lo ignoren mientras se escribe
+        self.tmp_path = os.path.join(directory, f".{name}.tmp-{uuid.uuid4().hex[:12]}")
+        self._file = open(self.tmp_path, 'wb')
+        self.closed = False
+
+    def write(self, data) -> int:
+        return self._file.write(data)
+
+    def tell(self) -> int:
+        return self._file.tell()
+
+    def flush(self):
+        self._file.flush()
+
+    def writable(self) -> bool:
+        return True
+
+    def close(self):
+        if self.closed:
+            return
+        self._file.close()
+        os.replace(self.tmp_path, self.path)
+        self.closed = True
+
+    def discard(self):
+        """Cancela la escritura y elimina el archivo temporal."""
+        if self.closed:
+            return
+        self._file.close()
+        try:
+            os.remove(self.tmp_path)
+        except FileNotFoundError:
+            pass
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+class LocalBackend(StorageBackend):
+    """
+    Backend sobre un directorio local (por ejemplo, un volcado montado).
+
+    Los archivos se leen con memory map de Arrow (sin copias) y se escriben de
+    forma atómica. La generación de un archivo es su mtime en nanosegundos.
+    """
+
+    def __init__(self, root_dir: str):
+        self.root_dir = os.path.abspath(root_dir)
+        self.root = self.root_dir
+        # Serializa las escrituras condicionales (if_generation_match) dentro del proceso
+        self._write_lock = threading.Lock()
+
+    def _path(self, key_or_uri: str) -> str:
+        if key_or_uri.startswith('file://'):
+            return key_or_uri[len('file://'):]
+        if os.path.isabs(key_or_uri):
+            return key_or_uri
+        return os.path.join(self.root_dir, key_or_uri)
+
+    def _walk(self, directory: str, start_offset: str | None) -> Iterator[os.DirEntry]:
+        """Recorre `directory` en orden lexicográfico, salteando subárboles anteriores a start_offset."""
+        try:
+            entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            key = os.path.relpath(entry.path, self.root_dir).replace(os.sep, '/')
+            if entry.is_dir():
+                dir_key = f"{key}/"
+                if start_offset and dir_key < start_offset and not start_offset.startswith(dir_key):
+                    continue
+                yield from self._walk(entry.path, start_offset)
+            elif not start_offset or key >= start_offset:
+                yield entry
+
+    def list(self, prefix: str, start_offset: str = None, suffix: str = None) -> list[dict]:
+        # Se recorre el directorio que contiene al prefijo y se filtra por el resto del prefijo
+        base_dir = os.path.join(self.root_dir, os.path.dirname(prefix))
+        objects = []
+        for entry in self._walk(base_dir, start_offset):
+            key = os.path.relpath(entry.path, self.root_dir).replace(os.sep, '/')
+            if not key.startswith(prefix) or (suffix and not key.endswith(suffix)):
+                continue
+            st = entry.stat()
+            objects.append({'path': self.uri(key), 'key': key, 'size': st.st_size, 'generation': st.st_mtime_ns, 'md5': None})
+        return objects
+
+    def open_input(self, uri: str):
+        import pyarrow as pa
+        return pa.memory_map(self._path(uri), 'r')
+
+    def open_output(self, uri: str):
+        return _AtomicLocalFile(self._path(uri))
+
+    def stat(self, key: str) -> dict | None:
+        try:
+            st = os.stat(self._path(key))
+        except FileNotFoundError:
+            return None
+        return {'size': st.st_size, 'generation': st.st_mtime_ns}
+
+    def read_text(self, key: str) -> str | None:
+        try:
+            with open(self._path(key), encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def write_text(self, key: str, content: str, content_type: str = 'text/plain', if_generation_match: int = None):
+        path = self._path(key)
+        with self._write_lock:
+            if if_generation_match is not None:
+                current = self.stat(key)
+                current_generation = current['generation'] if current else 0
+                if current_generation != if_generation_match:
+                    raise PreconditionFailedError(f"{path}: generación {current_generation}, se esperaba {if_generation_match}")
+            f = _AtomicLocalFile(path)
+            try:
+                f.write(content.encode('utf-8'))
+            except Exception:
+                f.discard()
+                raise
+            if if_generation_match == 0:
+                # Creación exclusiva: link falla si otro proceso creó el archivo en el medio
+                f._file.close()
+                try:
+                    os.link(f.tmp_path, path)
+                except FileExistsError as e:
+                    raise PreconditionFailedError(f"{path} ya existe") from e
+                finally:
+                    os.remove(f.tmp_path)
+                    f.closed = True
+            else:
+                f.close()
+
+    def delete(self, key: str, if_generation_match: int = None):
+        path = self._path(key)
+        with self._write_lock:
+            if if_generation_match is not None:
+                # Equivalente local de la precondición de GCS: la generación es el mtime en ns
+                current = self.stat(key)
+                if current is None:
+                    return
+                if current['generation'] != if_generation_match:
+                    raise PreconditionFailedError(f"{path}: generación {current['generation']}, se esperaba {if_generation_match}")
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def copy(self, source_key: str, destination_key: str):
+        with open(self._path(source_key), 'rb') as src, _AtomicLocalFile(self._path(destination_key)) as dst:
+            while chunk := src.read(8 * 1024 * 1024):
+                dst.write(chunk)
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+def _normalize_root(root: str) -> str:
+    """Normaliza una raíz: 'gs://bucket', ruta local absoluta o nombre de bucket a secas."""
+    if root.startswith('gs://'):
+        return root.rstrip('/')
+    if root.startswith('file://'):
+        return os.path.abspath(root[len('file://'):])
+    if '/' not in root and not root.startswith('.'):
+        # Un nombre sin esquema ni barras es un bucket de GCS (compatibilidad con GCS_BUCKET_NAME)
+        return f"gs://{root}"
+    return os.path.abspath(root)
+
+def get_backend(root: str = None) -> StorageBackend:
+    """
+    Devuelve (creándolo una vez) el backend de una raíz de almacenamiento.
+
+    Args:
+        root (str, opcional): 'gs://bucket', 'file:///ruta', una ruta local o un nombre
+            de bucket. Por defecto, STORAGE_ROOT.
+
+    Returns:
+        StorageBackend: El backend correspondiente.
+    """
+    root = _normalize_root(root or config.STORAGE_ROOT)
+    with _backends_lock:
+        backend = _backends.get(root)
+        if backend is None:
+            if root.startswith('gs://'):
+                backend = GCSBackend(root[len('gs://'):].split('/')[0])
+            else:
+                backend = LocalBackend(root)
+                logger.info(f"Usando almacenamiento local en {root}.")
+            _backends[root] = backend
+        return backend
+
+def backend_for_path(uri: str) -> StorageBackend:
+    """Backend al que pertenece una URI completa ('gs://bucket/...' o ruta local)."""
+    if uri.startswith('gs://'):
+        return get_backend(f"gs://{uri[len('gs://'):].split('/')[0]}")
+    default = get_backend()
+    # LocalBackend acepta rutas absolutas aunque estén fuera de su raíz
+    return default if isinstance(default, LocalBackend) else get_backend('/')
+
+def list_objects(root: str, prefix: str, start_partition: str = None, suffix: str = None) -> list[dict]:
+    """
+    Lista objetos con sus metadatos usando un único listado recursivo y paginado.
+
+    Los objetos se listan en orden lexicográfico; si se indica `start_partition`,
+    el listado comienza directamente en '{prefix}{start_partition}', de modo que
+    las particiones anteriores (ej. 'date=...' más antiguas) ni siquiera se recorren.
+
+    Args:
+        root (str): Raíz de almacenamiento ('gs://bucket', nombre del bucket o ruta local).
+        prefix (str): Prefijo de los objetos a listar (ej. 'raw/fact_sales/').
+        start_partition (str, opcional): Partición desde la cual listar (ej. 'date=2025-07-20').
+        suffix (str, opcional): Sólo devolver objetos que terminen con este sufijo (ej. '.csv').
+
+    Returns:
+        list[dict]: [{'path': URI completa, 'key', 'size': int, 'generation': int, 'md5': str | None}, ...]
+    """
+    start_offset = f"{prefix}{start_partition}" if start_partition else None
+    with metrics.stage('list_objects') as m:
+        objects = get_backend(root).list(prefix, start_offset=start_offset, suffix=suffix)
+        m['rows_out'] = len(objects)
+    return objects